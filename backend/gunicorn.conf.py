@@ -0,0 +1,39 @@
+# Production server settings. Run from backend/:
+#   gunicorn --config gunicorn.conf.py wsgi:app
+#
+# Each worker is a separate process with its own DB pool, so keep
+# DB_MAX_CONN >= WEB_THREADS and WEB_WORKERS * DB_MAX_CONN below Postgres' max_connections.
+import os
+
+pythonpath = "src"
+bind = os.getenv("WEB_BIND", "0.0.0.0:5000")
+
+workers = int(os.getenv("WEB_WORKERS", "2"))
+threads = int(os.getenv("WEB_THREADS", "4"))
+worker_class = "gthread" if threads > 1 else "sync"
+
+# Import the app once in the master so workers fork with it already loaded.
+preload_app = os.getenv("WEB_PRELOAD", "1") == "1"
+
+timeout = int(os.getenv("WEB_TIMEOUT", "150"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("WEB_KEEPALIVE", "5"))
+# Recycle workers periodically so slow leaks cannot accumulate; jitter avoids restarting all at once.
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "5000"))
+max_requests_jitter = int(os.getenv("WEB_MAX_REQUESTS_JITTER", "500"))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    # The master may have imported tools.database (preload); give this worker its own connections.
+    from tools.database import db_pool
+
+    db_pool.prefill()
+
+
+def worker_exit(server, worker):
+    from tools.database import db_pool
+
+    db_pool.closeall()
@@ -11,7 +11,13 @@ from routes.goal import goal_blueprint
 from routes.friend import friend_blueprint
 from routes.journal import journal_blueprint
 from routes.health import health_blueprint
-from routes.ai import ai_blueprint
+from routes.dashboard import dashboard_blueprint
+from routes.ai import ai_blueprint, response_cache
+from tools.database import db_pool
+from tools import friendships, google_certs, ollama, profiles, statements
+from tools.notify import listener
+from tools.sessions import session_interface
+from tools.json_provider import install_json_provider
 
 # Load environment variables first (.env, then .env.local override)
 ENV_ROOT = Path(__file__).resolve().parent.parent
@@ -23,6 +29,9 @@ load_dotenv(ENV_ROOT / ".env.local")
 # -----------------------------
 def create_app():
     app = Flask(__name__)
+    install_json_provider(app)
+    # Cookie holds a signed session id; the session itself lives in user_sessions.
+    app.session_interface = session_interface
 
     # ENV VARS you must set:
     #   SECRET_KEY=... (any long random string)
@@ -44,6 +53,7 @@ def create_app():
         resources={r"/api/*": {"origins": [frontend_origin]}},
         supports_credentials=True,
         allow_headers=["Content-Type", "Authorization"],
+        expose_headers=["X-Next-Cursor"],
         methods=["GET", "POST", "PATCH", "OPTIONS", "DELETE"],
     )
 
@@ -52,6 +62,23 @@ def create_app():
     def health():
         return jsonify({"ok": True}), 200
 
+    @app.route("/api/metrics", methods=["GET"])
+    def metrics():
+        """Per-process utilization counters for scraping."""
+        return jsonify(
+            {
+                "db_pool": db_pool.stats(),
+                "statements": statements.stats(),
+                "ai": ollama.stats(),
+                "ai_cache": response_cache.stats(),
+                "google_certs": google_certs.cert_cache.stats(),
+                "sessions": session_interface.stats(),
+                "profiles": profiles.stats(),
+                "friendships": friendships.stats(),
+                "listener": listener.stats(),
+            }
+        ), 200
+
     app.register_blueprint(auth_blueprint)
     app.register_blueprint(user_blueprint)
     app.register_blueprint(habit_blueprint)
@@ -59,6 +86,7 @@ def create_app():
     app.register_blueprint(friend_blueprint)
     app.register_blueprint(journal_blueprint)
     app.register_blueprint(health_blueprint)
+    app.register_blueprint(dashboard_blueprint)
     app.register_blueprint(ai_blueprint)
 
     return app
@@ -0,0 +1,77 @@
+"""
+Rebuild users.total_xp and users.level from goal XP.
+
+The goal triggers keep both current by deltas; this one-shot job repairs any
+drift (manual SQL, restores, past bugs). It walks users in id order, one short
+transaction per chunk, and only rewrites rows whose counters are wrong.
+
+Run from backend/src:  python -m jobs.reconcile_user_xp [--chunk-size 500]
+"""
+import argparse
+import time
+
+from tools.database import db_pool
+
+# The users are locked first so goal writes in flight either commit before the
+# recount (and are included) or apply their delta after it.
+LOCK_CHUNK = """
+    SELECT id
+    FROM users
+    WHERE id > %s
+    ORDER BY id
+    LIMIT %s
+    FOR UPDATE
+"""
+
+FIX_CHUNK = """
+    WITH sums AS (
+        SELECT u.id, COALESCE(SUM(g.xp), 0) AS xp
+        FROM users u
+        LEFT JOIN goals g ON g.user_id = u.id
+        WHERE u.id = ANY(%s)
+        GROUP BY u.id
+    )
+    UPDATE users u
+    SET total_xp = s.xp,
+        level = GREATEST(1, (s.xp / 100) + 1)
+    FROM sums s
+    WHERE u.id = s.id
+      AND (u.total_xp <> s.xp OR u.level <> GREATEST(1, (s.xp / 100) + 1))
+    RETURNING u.id
+"""
+
+
+def reconcile(chunk_size=500):
+    """Return (users checked, users fixed)."""
+    checked = fixed = 0
+    last_id = 0
+    conn = db_pool.getconn()
+    try:
+        while True:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(LOCK_CHUNK, (last_id, chunk_size))
+                    ids = [row[0] for row in cur.fetchall()]
+                    if not ids:
+                        break
+                    cur.execute(FIX_CHUNK, (ids,))
+                    fixed += cur.rowcount
+            checked += len(ids)
+            last_id = ids[-1]
+    finally:
+        db_pool.putconn(conn)
+    return checked, fixed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    checked, fixed = reconcile(args.chunk_size)
+    print(f"Checked {checked} users, fixed {fixed} in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
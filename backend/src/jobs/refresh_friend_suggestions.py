@@ -0,0 +1,154 @@
+"""
+Recompute "people you may know" suggestions.
+
+Each user's top FRIEND_SUGGESTIONS_K friends-of-friends by mutual friend count
+are written to friend_suggestions. By default the job drains
+friend_suggestion_queue, which a trigger on friends fills with the users whose
+two-hop neighborhood changed, so run it every few minutes. --all recomputes
+every user (new databases, or after bulk changes that bypassed the queue).
+Work goes in chunks, one short transaction each, on one pooled connection.
+
+Run from backend/src:  python -m jobs.refresh_friend_suggestions [--all] [--chunk-size 200]
+"""
+import argparse
+import os
+import time
+
+from tools.database import db_pool
+
+# Suggestions kept per user.
+FRIEND_SUGGESTIONS_K = int(os.getenv("FRIEND_SUGGESTIONS_K", "50"))
+
+# Oldest queued users first; rows claimed by a concurrent run are skipped.
+CLAIM_QUEUED = """
+    DELETE FROM friend_suggestion_queue
+    WHERE user_id IN (
+        SELECT user_id
+        FROM friend_suggestion_queue
+        ORDER BY queued_at
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING user_id
+"""
+
+NEXT_USERS = """
+    SELECT id
+    FROM users
+    WHERE id > %s
+    ORDER BY id
+    LIMIT %s
+"""
+
+CLEAR_SUGGESTIONS = """
+    DELETE FROM friend_suggestions
+    WHERE user_id = ANY(%s)
+"""
+
+# Both hops are index-only seeks on friends_pkey / idx_friends_user2_user1. The
+# upsert only matters when a --all run and a queue run overlap on a user.
+WRITE_SUGGESTIONS = """
+    WITH target AS (
+        SELECT DISTINCT user_id FROM unnest(%s::bigint[]) AS t (user_id)
+    ),
+    first_hop AS (
+        SELECT t.user_id, n.friend_id
+        FROM target t
+        CROSS JOIN LATERAL (
+            SELECT user_id2 AS friend_id FROM friends WHERE user_id1 = t.user_id
+            UNION ALL
+            SELECT user_id1 FROM friends WHERE user_id2 = t.user_id
+        ) n
+    ),
+    second_hop AS (
+        SELECT h.user_id, m.friend_id AS suggested_id, count(*) AS mutual_count
+        FROM first_hop h
+        CROSS JOIN LATERAL (
+            SELECT user_id2 AS friend_id FROM friends WHERE user_id1 = h.friend_id
+            UNION ALL
+            SELECT user_id1 FROM friends WHERE user_id2 = h.friend_id
+        ) m
+        WHERE m.friend_id <> h.user_id
+          AND NOT EXISTS (
+              SELECT 1 FROM first_hop x WHERE x.user_id = h.user_id AND x.friend_id = m.friend_id
+          )
+        GROUP BY 1, 2
+    ),
+    ranked AS (
+        SELECT
+            user_id,
+            suggested_id,
+            mutual_count,
+            row_number() OVER (PARTITION BY user_id ORDER BY mutual_count DESC, suggested_id) AS rank
+        FROM second_hop
+    )
+    INSERT INTO friend_suggestions (user_id, suggested_id, mutual_count)
+    SELECT r.user_id, r.suggested_id, r.mutual_count
+    FROM ranked r
+    JOIN users u ON u.id = r.user_id
+    WHERE r.rank <= %s
+    ON CONFLICT (user_id, suggested_id) DO UPDATE
+    SET mutual_count = EXCLUDED.mutual_count, computed_at = now()
+"""
+
+
+def _write(cur, user_ids):
+    cur.execute(CLEAR_SUGGESTIONS, (user_ids,))
+    cur.execute(WRITE_SUGGESTIONS, (user_ids, FRIEND_SUGGESTIONS_K))
+    return cur.rowcount
+
+
+def refresh_queued(chunk_size=200):
+    """Drain the queue; return (users refreshed, suggestions written)."""
+    users = written = 0
+    conn = db_pool.getconn()
+    try:
+        while True:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(CLAIM_QUEUED, (chunk_size,))
+                    user_ids = [row[0] for row in cur.fetchall()]
+                    if not user_ids:
+                        break
+                    written += _write(cur, user_ids)
+            users += len(user_ids)
+    finally:
+        db_pool.putconn(conn)
+    return users, written
+
+
+def refresh_all(chunk_size=200):
+    """Recompute every user; return (users refreshed, suggestions written)."""
+    users = written = 0
+    last_id = 0
+    conn = db_pool.getconn()
+    try:
+        while True:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(NEXT_USERS, (last_id, chunk_size))
+                    user_ids = [row[0] for row in cur.fetchall()]
+                    if not user_ids:
+                        break
+                    written += _write(cur, user_ids)
+            users += len(user_ids)
+            last_id = user_ids[-1]
+    finally:
+        db_pool.putconn(conn)
+    return users, written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--all", action="store_true", help="recompute every user, not just queued ones")
+    parser.add_argument("--chunk-size", type=int, default=200)
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    refresh = refresh_all if args.all else refresh_queued
+    users, written = refresh(args.chunk_size)
+    print(f"Refreshed {users} users, wrote {written} suggestions in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""
+Refresh the leaderboard materialized view.
+
+GET /api/friends/leaderboard ranks from this snapshot of users' XP, so it is as
+fresh as the last run; schedule it every few minutes. CONCURRENTLY keeps the
+view readable during the refresh and only rewrites rows that changed.
+
+Run from backend/src:  python -m jobs.refresh_leaderboard
+"""
+import argparse
+import time
+
+from tools.database import db_pool
+
+REFRESH = "REFRESH MATERIALIZED VIEW CONCURRENTLY leaderboard"
+
+
+def refresh():
+    conn = db_pool.getconn()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(REFRESH)
+    finally:
+        db_pool.putconn(conn)
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__.strip().splitlines()[0]).parse_args()
+
+    started = time.monotonic()
+    refresh()
+    print(f"Refreshed leaderboard in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Zero lapsed users.streak values.
+
+Journal writes keep streaks current as entries arrive, but nothing happens on a
+day a user does not log, so this runs nightly (after midnight in the database's
+time zone). Only a streak whose last active day is before yesterday changes
+overnight, and it becomes 0, so by default the job touches just those users,
+found through idx_users_streak_lapse. --all recounts every user instead (to
+repair drift; run weekly, and after manual SQL or a restore). Work goes in chunks, one short
+transaction each, on one pooled connection.
+
+Run from backend/src:  python -m jobs.refresh_streaks [--all] [--chunk-size 500]
+"""
+import argparse
+import time
+
+from tools.database import db_pool
+
+# --all: extra passes over users a journal write had locked, and the pause before each.
+RETRIES = 3
+RETRY_DELAY = 1.0
+
+# Users mid-write are skipped rather than waited on; their own journal write
+# keeps the streak current, and the next run picks them up. Zeroed rows leave
+# the partial index, so each chunk finds the next ones.
+ZERO_LAPSED = """
+    UPDATE users
+    SET streak = 0
+    WHERE id IN (
+        SELECT id
+        FROM users
+        WHERE streak > 0 AND streak_last_date < current_date - 1
+        LIMIT %s
+        FOR NO KEY UPDATE SKIP LOCKED
+    )
+"""
+
+NEXT_USERS = """
+    SELECT id
+    FROM users
+    WHERE id > %s
+    ORDER BY id
+    LIMIT %s
+"""
+
+# Users mid-write are set aside and retried once the pass is done.
+LOCK_USERS = """
+    SELECT id
+    FROM users
+    WHERE id = ANY(%s)
+    ORDER BY id
+    FOR NO KEY UPDATE SKIP LOCKED
+"""
+
+REFRESH_CHUNK = """
+    SELECT COUNT(*) FILTER (WHERE refresh_user_streak(id))
+    FROM unnest(%s::bigint[]) AS id
+"""
+
+
+def zero_lapsed(chunk_size=500):
+    """Return the number of lapsed streaks zeroed."""
+    changed = 0
+    conn = db_pool.getconn()
+    try:
+        while True:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(ZERO_LAPSED, (chunk_size,))
+                    zeroed = cur.rowcount
+            if not zeroed:
+                break
+            changed += zeroed
+    finally:
+        db_pool.putconn(conn)
+    return changed
+
+
+def _recount(conn, ids):
+    """Recount the users among ids not locked by a write; return (changed, skipped ids)."""
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(LOCK_USERS, (ids,))
+            locked = [row[0] for row in cur.fetchall()]
+            changed = 0
+            if locked:
+                cur.execute(REFRESH_CHUNK, (locked,))
+                changed = cur.fetchone()[0]
+    skipped = set(ids).difference(locked)
+    return changed, sorted(skipped)
+
+
+def refresh_all(chunk_size=500, retries=RETRIES):
+    """Recount every user; return (users checked, users changed, users still skipped)."""
+    checked = changed = 0
+    skipped = []
+    last_id = 0
+    conn = db_pool.getconn()
+    try:
+        while True:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(NEXT_USERS, (last_id, chunk_size))
+                    ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                break
+            chunk_changed, chunk_skipped = _recount(conn, ids)
+            changed += chunk_changed
+            skipped += chunk_skipped
+            checked += len(ids) - len(chunk_skipped)
+            last_id = ids[-1]
+
+        for _ in range(retries):
+            if not skipped:
+                break
+            time.sleep(RETRY_DELAY)
+            pending, skipped = skipped, []
+            for i in range(0, len(pending), chunk_size):
+                ids = pending[i:i + chunk_size]
+                chunk_changed, chunk_skipped = _recount(conn, ids)
+                changed += chunk_changed
+                skipped += chunk_skipped
+                checked += len(ids) - len(chunk_skipped)
+    finally:
+        db_pool.putconn(conn)
+    return checked, changed, len(skipped)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--all", action="store_true", help="recount every user, not just lapsed streaks")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    if args.all:
+        checked, changed, skipped = refresh_all(args.chunk_size)
+        print(
+            f"Checked {checked} users, updated {changed} streaks, skipped {skipped} locked users "
+            f"in {time.monotonic() - started:.1f}s"
+        )
+    else:
+        zeroed = zero_lapsed(args.chunk_size)
+        print(f"Zeroed {zeroed} lapsed streaks in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
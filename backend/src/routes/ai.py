@@ -1,73 +1,170 @@
+import hashlib
+import json
+import logging
 import os
+import threading
+from concurrent.futures import TimeoutError as FutureTimeout
 
-import requests
-from flask import Blueprint, jsonify, request
+from cachetools import TTLCache
+from flask import Blueprint, Response, jsonify, request
+from psycopg2.extras import Json
 
+from tools import conversations, ollama
 from tools.auth_helper import ensure_auth
+from tools.database import db_pool
 
 ai_blueprint = Blueprint("ai", __name__, url_prefix="/api/ai")
+log = logging.getLogger(__name__)
 
-DEFAULT_OLLAMA_URL = "http://localhost:11434"
-DEFAULT_OLLAMA_MODEL = "phi3:mini"
+# Seconds a synchronous /respond request holds its web thread before giving up with 504.
+AI_RESPOND_TIMEOUT = float(os.getenv("AI_RESPOND_TIMEOUT", "30"))
+# Seconds a job may wait for a free executor slot before it fails as busy.
+AI_JOB_QUEUE_TIMEOUT = float(os.getenv("AI_JOB_QUEUE_TIMEOUT", "300"))
+# Pending jobs past these (since starting, or since creation if never started)
+# were orphaned by a worker that exited mid-call.
+JOB_STALE_AFTER_SECONDS = int(ollama.OLLAMA_TIMEOUT) + 60
+JOB_UNSTARTED_STALE_AFTER_SECONDS = int(AI_JOB_QUEUE_TIMEOUT) + 60
+# Finished jobs are kept this long for clients that poll late.
+JOB_RETENTION = "1 hour"
 
+# Response cache is opt-in: AI_CACHE_SIZE=0 (default) disables it.
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "0"))
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", "600"))
 
-def _ollama_settings():
+
+class _ResponseCache:
     """
-    Return sanitized Ollama base URL and preferred model.
+    Per-process LRU + TTL cache of Ollama completions, keyed by model, system
+    prompt, prompt and a hash of the context, so repeated canned prompts skip generation.
     """
-    base_url = os.environ.get("OLLAMA_BASE_URL", DEFAULT_OLLAMA_URL).strip() or DEFAULT_OLLAMA_URL
-    model = os.environ.get("OLLAMA_MODEL", DEFAULT_OLLAMA_MODEL).strip() or DEFAULT_OLLAMA_MODEL
-    return base_url.rstrip("/"), model
 
+    # Fields of Ollama's reply that _build_result reads
+    FIELDS = ("response", "model", "created_at", "total_duration", "load_duration", "eval_count", "eval_duration", "context")
 
-@ai_blueprint.route("/respond", methods=["POST"])
-def ollama_respond():
-    """
-    Call an Ollama model with the provided prompt and optional system prompt/context.
-    """
-    user, error = ensure_auth()
-    if error:
-        return error
+    def __init__(self, maxsize, ttl):
+        self.enabled = maxsize > 0
+        self._cache = TTLCache(maxsize=max(maxsize, 1), ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
 
-    payload = request.get_json(silent=True) or {}
+    @staticmethod
+    def key(model, system_prompt, prompt, context):
+        context_hash = hashlib.blake2b(json.dumps(context or []).encode(), digest_size=16).hexdigest()
+        return (model, system_prompt or "", prompt, context_hash)
+
+    def get(self, key, bypass=False):
+        if not self.enabled:
+            return None
+        with self._lock:
+            if bypass:
+                self.bypassed += 1
+                return None
+            data = self._cache.get(key)
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return data
+
+    def put(self, key, data):
+        if not self.enabled:
+            return
+        entry = {field: data.get(field) for field in self.FIELDS}
+        with self._lock:
+            self._cache[key] = entry
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._cache),
+                "max_size": AI_CACHE_SIZE,
+                "hits_total": self.hits,
+                "misses_total": self.misses,
+                "bypassed_total": self.bypassed,
+            }
+
+
+response_cache = _ResponseCache(AI_CACHE_SIZE, AI_CACHE_TTL)
+
+
+def _parse_prompt(payload):
+    """Return (prompt, system_prompt, context, conversation_id, error)."""
     prompt = (payload.get("prompt") or "").strip()
     if not prompt:
-        return jsonify({"error": "prompt is required"}), 400
+        return None, None, None, None, (jsonify({"error": "prompt is required"}), 400)
 
     system_prompt = (payload.get("system_prompt") or "").strip()
     context = payload.get("context")
     if context is not None and not isinstance(context, list):
-        return jsonify({"error": "context must be a list of integers if provided"}), 400
+        return None, None, None, None, (jsonify({"error": "context must be a list of integers if provided"}), 400)
 
-    base_url, model = _ollama_settings()
-    request_body = {
-        "model": model,
-        "prompt": prompt,
-        "stream": False,
-    }
-    if system_prompt:
-        request_body["system"] = system_prompt
-    if context:
-        request_body["context"] = context
+    conversation_id = payload.get("conversation_id")
+    if conversation_id is not None:
+        if not isinstance(conversation_id, int) or isinstance(conversation_id, bool):
+            return None, None, None, None, (jsonify({"error": "conversation_id must be an integer"}), 400)
+        if context is not None:
+            return None, None, None, None, (jsonify({"error": "Send either context or conversation_id, not both"}), 400)
+    return prompt, system_prompt, context, conversation_id, None
+
+
+def _resolve_context(user_id, conversation_id, context):
+    """Return (context, error), loading the stored context when a conversation_id is given."""
+    if conversation_id is None:
+        return context, None
+
+    conn = db_pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            stored = conversations.load(cur, conversation_id, user_id)
+    finally:
+        db_pool.putconn(conn)
 
+    if stored is None:
+        return None, (jsonify({"error": "Conversation not found or expired"}), 404)
+    return stored, None
+
+
+def _store_context(user_id, conversation_id, data):
+    """
+    Save a reply's context (fresh or cached) to its conversation, if any.
+    Returns False if that failed; the reply itself is still good to send.
+    """
+    if conversation_id is None or not data.get("context"):
+        return True
+    conn = db_pool.getconn()
     try:
-        resp = requests.post(f"{base_url}/api/generate", json=request_body, timeout=120)
-        resp.raise_for_status()
-        data = resp.json()
-    except requests.exceptions.RequestException as exc:
-        return jsonify({"error": f"Ollama request failed: {exc}"}), 502
-    except ValueError:
-        return jsonify({"error": "Invalid JSON received from Ollama"}), 502
-
-    response_text = data.get("response")
-    if not response_text:
-        return jsonify({"error": "Ollama response missing 'response'"}), 502
+        with conn:
+            with conn.cursor() as cur:
+                conversations.save(cur, conversation_id, user_id, data["context"])
+        return True
+    except Exception:
+        log.exception("Saving context for AI conversation %s failed", conversation_id)
+        return False
+    finally:
+        db_pool.putconn(conn)
 
+
+def _cache_bypassed(payload):
+    """Per-request opt-out: body {"cache": false} or a Cache-Control: no-cache header."""
+    return payload.get("cache") is False or "no-cache" in request.headers.get("Cache-Control", "")
+
+
+def _busy(exc):
+    resp = jsonify({"error": str(exc)})
+    resp.headers["Retry-After"] = str(ollama.AI_RETRY_AFTER)
+    return resp, 503
+
+
+def _build_result(user_id, prompt, model, data, cached=False, conversation_id=None, context_saved=True):
     result = {
         "prompt": prompt,
-        "response": response_text,
+        "response": data["response"],
         "model": data.get("model") or model,
-        "user_id": user["id"],
+        "user_id": user_id,
+        "cached": cached,
         "meta": {
             "created_at": data.get("created_at"),
             "total_duration": data.get("total_duration"),
@@ -77,8 +174,368 @@ def ollama_respond():
         },
     }
 
+    if conversation_id is not None:
+        # The context stays server-side (_store_context); the client only echoes the id next turn.
+        result["conversation_id"] = conversation_id
+        if not context_saved:
+            result["context_saved"] = False
+        return result
+
     response_context = data.get("context")
     if response_context:
         result["context"] = response_context
+    return result
+
+
+def _run_job(job_id, user_id, prompt, model, base_url, body, cache_key, conversation_id):
+    """Executor task: call Ollama and record the outcome on the job row."""
+    try:
+        _start_job(job_id)
+        data = ollama.generate(base_url, body)
+        response_cache.put(cache_key, data)
+        saved = _store_context(user_id, conversation_id, data)
+        result = _build_result(user_id, prompt, model, data, conversation_id=conversation_id, context_saved=saved)
+        status, error = "done", None
+    except ollama.OllamaError as exc:
+        status, result, error = "failed", None, str(exc)
+    except Exception:
+        # Nothing awaits this future; record the failure or the row stays pending.
+        log.exception("AI job %s failed", job_id)
+        _fail_job(job_id, "AI job failed; please retry")
+        return
+
+    conn = db_pool.getconn()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    UPDATE ai_jobs
+                    SET status = %s, result = %s, error = %s, finished_at = now()
+                    WHERE id = %s
+                    """,
+                    (status, Json(result) if result is not None else None, error, job_id),
+                )
+                cur.execute(
+                    "DELETE FROM ai_jobs WHERE created_at < now() - %s::interval",
+                    (JOB_RETENTION,),
+                )
+    finally:
+        db_pool.putconn(conn)
+
+
+def _start_job(job_id):
+    conn = db_pool.getconn()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("UPDATE ai_jobs SET started_at = now() WHERE id = %s", (job_id,))
+    finally:
+        db_pool.putconn(conn)
+
+
+def _fail_job(job_id, message):
+    conn = db_pool.getconn()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE ai_jobs SET status = 'failed', error = %s, finished_at = now() WHERE id = %s",
+                    (message, job_id),
+                )
+    finally:
+        db_pool.putconn(conn)
 
+
+@ai_blueprint.route("/respond", methods=["POST"])
+def ollama_respond():
+    """
+    Call an Ollama model with the provided prompt and optional system prompt/context.
+
+    Pass "conversation_id" (from POST /api/ai/conversations) instead of "context"
+    to keep the context server-side; the reply then carries the id, not the tokens.
+
+    Deprecated synchronous variant kept for existing clients: the call still runs
+    on the AI executor, so AI_MAX_CONCURRENCY applies, but this request waits for
+    it, at most AI_RESPOND_TIMEOUT seconds (then 504). New clients should use
+    POST /api/ai/jobs.
+    """
+    user, error = ensure_auth()
+    if error:
+        return error
+
+    payload = request.get_json(silent=True) or {}
+    prompt, system_prompt, context, conversation_id, error = _parse_prompt(payload)
+    if error:
+        return error
+    context, error = _resolve_context(user["id"], conversation_id, context)
+    if error:
+        return error
+
+    base_url, model = ollama.settings()
+    cache_key = response_cache.key(model, system_prompt, prompt, context)
+    cached = response_cache.get(cache_key, bypass=_cache_bypassed(payload))
+    if cached:
+        saved = _store_context(user["id"], conversation_id, cached)
+        result = _build_result(
+            user["id"], prompt, model, cached, cached=True, conversation_id=conversation_id, context_saved=saved
+        )
+        return jsonify(result), 200
+
+    body = ollama.build_request(model, prompt, system_prompt, context)
+    try:
+        future = ollama.submit(ollama.generate, base_url, body, queue_timeout=ollama.AI_QUEUE_TIMEOUT)
+        data = future.result(timeout=AI_RESPOND_TIMEOUT)
+    except FutureTimeout:
+        # The generation finishes on the executor; cache it so a retry can be answered at once.
+        def on_done(f):
+            if f.exception() is None:
+                response_cache.put(cache_key, f.result())
+
+        future.add_done_callback(on_done)
+        return jsonify({"error": "AI response timed out; use POST /api/ai/jobs for long generations"}), 504
+    except ollama.OllamaBusy as exc:
+        return _busy(exc)
+    except ollama.OllamaError as exc:
+        return jsonify({"error": str(exc)}), 502
+
+    response_cache.put(cache_key, data)
+    saved = _store_context(user["id"], conversation_id, data)
+    result = _build_result(user["id"], prompt, model, data, conversation_id=conversation_id, context_saved=saved)
     return jsonify(result), 200
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _sse_response(events):
+    return Response(
+        events,
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            # Stop nginx ingress from buffering the stream
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
+@ai_blueprint.route("/respond/stream", methods=["POST"])
+def ollama_respond_stream():
+    """
+    Streaming variant of /respond using Server-Sent Events.
+
+    Emits one `token` event per Ollama chunk ({"response": "<text>"}), then a
+    `done` event carrying the same body /respond returns (full response text,
+    meta and context or conversation_id). Failures after the stream starts
+    arrive as an `error` event.
+    """
+    user, error = ensure_auth()
+    if error:
+        return error
+
+    payload = request.get_json(silent=True) or {}
+    prompt, system_prompt, context, conversation_id, error = _parse_prompt(payload)
+    if error:
+        return error
+    context, error = _resolve_context(user["id"], conversation_id, context)
+    if error:
+        return error
+
+    user_id = user["id"]
+    base_url, model = ollama.settings()
+    cache_key = response_cache.key(model, system_prompt, prompt, context)
+    cached = response_cache.get(cache_key, bypass=_cache_bypassed(payload))
+    if cached:
+        saved = _store_context(user_id, conversation_id, cached)
+        result = _build_result(
+            user_id, prompt, model, cached, cached=True, conversation_id=conversation_id, context_saved=saved
+        )
+        events = [_sse("token", {"response": cached["response"]}), _sse("done", result)]
+        return _sse_response(events)
+
+    body = ollama.build_request(model, prompt, system_prompt, context, stream=True)
+    chunks = ollama.stream(base_url, body)
+
+    # Wait for the first chunk so connection failures still get a proper 502.
+    try:
+        first = next(chunks, None)
+    except ollama.OllamaBusy as exc:
+        return _busy(exc)
+    except ollama.OllamaError as exc:
+        return jsonify({"error": str(exc)}), 502
+
+    def events():
+        parts = []
+        chunk = first
+        try:
+            while chunk is not None:
+                text = chunk.get("response") or ""
+                if text:
+                    parts.append(text)
+                    yield _sse("token", {"response": text})
+                if chunk.get("done"):
+                    data = {**chunk, "response": "".join(parts)}
+                    response_cache.put(cache_key, data)
+                    saved = _store_context(user_id, conversation_id, data)
+                    yield _sse(
+                        "done",
+                        _build_result(user_id, prompt, model, data, conversation_id=conversation_id, context_saved=saved),
+                    )
+                    return
+                chunk = next(chunks, None)
+            yield _sse("error", {"error": "Ollama stream ended before completion"})
+        except ollama.OllamaError as exc:
+            yield _sse("error", {"error": str(exc)})
+        finally:
+            chunks.close()
+
+    return _sse_response(events())
+
+
+@ai_blueprint.route("/jobs", methods=["POST"])
+def create_job():
+    """
+    Queue an Ollama call and return immediately with a job id to poll.
+    Body matches /respond: { "prompt", "system_prompt"?, "context"? | "conversation_id"? }
+    """
+    user, error = ensure_auth()
+    if error:
+        return error
+
+    payload = request.get_json(silent=True) or {}
+    prompt, system_prompt, context, conversation_id, error = _parse_prompt(payload)
+    if error:
+        return error
+    context, error = _resolve_context(user["id"], conversation_id, context)
+    if error:
+        return error
+
+    base_url, model = ollama.settings()
+    cache_key = response_cache.key(model, system_prompt, prompt, context)
+    cached = response_cache.get(cache_key, bypass=_cache_bypassed(payload))
+    if cached:
+        # Nothing to queue: answer in the shape of a finished job.
+        saved = _store_context(user["id"], conversation_id, cached)
+        result = _build_result(
+            user["id"], prompt, model, cached, cached=True, conversation_id=conversation_id, context_saved=saved
+        )
+        return jsonify({"job_id": None, "status": "done", "result": result}), 200
+
+    body = ollama.build_request(model, prompt, system_prompt, context)
+
+    # Refuse early rather than create a job row that cannot be admitted.
+    if not ollama.has_capacity():
+        return _busy(ollama.OllamaBusy("AI is busy; too many requests in progress"))
+
+    conn = db_pool.getconn()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO ai_jobs (user_id) VALUES (%s) RETURNING id",
+                    (user["id"],),
+                )
+                job_id = cur.fetchone()[0]
+    finally:
+        db_pool.putconn(conn)
+
+    try:
+        future = ollama.submit(
+            _run_job, job_id, user["id"], prompt, model, base_url, body, cache_key, conversation_id,
+            queue_timeout=AI_JOB_QUEUE_TIMEOUT,
+        )
+    except ollama.OllamaBusy as exc:
+        _fail_job(job_id, str(exc))
+        return _busy(exc)
+
+    def on_done(f):
+        # _run_job records its own outcome; only a queue timeout leaves the row pending.
+        if isinstance(f.exception(), ollama.OllamaBusy):
+            _fail_job(job_id, str(f.exception()))
+
+    future.add_done_callback(on_done)
+
+    resp = jsonify({"job_id": job_id, "status": "pending"})
+    resp.headers["Location"] = f"{ai_blueprint.url_prefix}/jobs/{job_id}"
+    return resp, 202
+
+
+@ai_blueprint.route("/jobs/<int:job_id>", methods=["GET"])
+def get_job(job_id):
+    """Poll a job: status is pending, done (with result) or failed (with error)."""
+    user, error = ensure_auth()
+    if error:
+        return error
+
+    conn = db_pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT
+                    CASE WHEN stale THEN 'failed' ELSE status END,
+                    result,
+                    CASE WHEN stale THEN 'AI job was interrupted; please retry' ELSE error END
+                FROM ai_jobs
+                CROSS JOIN LATERAL (
+                    SELECT status = 'pending' AND COALESCE(
+                        started_at + make_interval(secs => %s),
+                        created_at + make_interval(secs => %s)
+                    ) < now() AS stale
+                ) s
+                WHERE id = %s AND user_id = %s
+                """,
+                (JOB_STALE_AFTER_SECONDS, JOB_UNSTARTED_STALE_AFTER_SECONDS, job_id, user["id"]),
+            )
+            row = cur.fetchone()
+    finally:
+        db_pool.putconn(conn)
+
+    if not row:
+        return jsonify({"error": "Job not found"}), 404
+
+    payload = {"job_id": job_id, "status": row[0]}
+    if row[0] == "done":
+        payload["result"] = row[1]
+    elif row[0] == "failed":
+        payload["error"] = row[2]
+    return jsonify(payload), 200
+
+
+@ai_blueprint.route("/conversations", methods=["POST"])
+def create_conversation():
+    """Start a server-side conversation; pass its id as conversation_id on each turn."""
+    user, error = ensure_auth()
+    if error:
+        return error
+
+    conn = db_pool.getconn()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                conversation_id = conversations.create(cur, user["id"])
+    finally:
+        db_pool.putconn(conn)
+
+    return jsonify({"conversation_id": conversation_id}), 201
+
+
+@ai_blueprint.route("/conversations/<int:conversation_id>", methods=["DELETE"])
+def delete_conversation(conversation_id):
+    user, error = ensure_auth()
+    if error:
+        return error
+
+    conn = db_pool.getconn()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                deleted = conversations.delete(cur, conversation_id, user["id"])
+    finally:
+        db_pool.putconn(conn)
+
+    if not deleted:
+        return jsonify({"error": "Conversation not found"}), 404
+    return ("", 204)
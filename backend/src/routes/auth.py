@@ -1,9 +1,15 @@
+from dataclasses import asdict
+
 from flask import request, session, jsonify, Blueprint
+from tools import profiles
 from tools.auth_helper import session_user, verify_google_id_token 
 from tools.database import db_pool 
+from tools.records import RowMapper, UserProfile
 
 auth_blueprint = Blueprint("auth", __name__, url_prefix="/api/auth")
 
+PROFILE_ROWS = RowMapper(UserProfile)
+
 @auth_blueprint.route("/google", methods=["POST"])
 def auth_google():
     """
@@ -34,20 +40,20 @@ def auth_google():
         with conn.cursor() as cursor:
             # Check if user already exists
             cursor.execute("""
-                SELECT id, oauth_id, email, name, bio, level, streak, onboarding_complete, theme_preference
+                SELECT id, oauth_id, email, name, bio, level, streak, created_at, onboarding_complete, theme_preference
                 FROM users
                 WHERE oauth_id = %s
             """, (oauth_id,))
-            db_user = cursor.fetchone()
+            db_user = PROFILE_ROWS.one(cursor)
 
             if not db_user:
                 # Insert new user
                 cursor.execute("""
                     INSERT INTO users (oauth_id, email, name, bio, level, streak)
                     VALUES (%s, %s, %s, %s, 1, 0)
-                    RETURNING id, oauth_id, email, name, bio, level, streak, onboarding_complete, theme_preference
+                    RETURNING id, oauth_id, email, name, bio, level, streak, created_at, onboarding_complete, theme_preference
                 """, (oauth_id, email, name, ""))
-                db_user = cursor.fetchone()
+                db_user = PROFILE_ROWS.one(cursor)
 
             # Commit changes
             conn.commit()
@@ -58,26 +64,14 @@ def auth_google():
     finally:
         db_pool.putconn(conn)  # Return connection to pool
 
-    # Persist the session (signed cookie by Flask)
+    # Persist the session server-side (tools/sessions.py); the cookie only carries its id
     session.clear()
     session.permanent = True
+    session["user_id"] = db_user.id
+    session["picture"] = picture
 
-    user_payload = {
-        "id": db_user[0],
-        "oauth_id": db_user[1],
-        "email": db_user[2],
-        "name": db_user[3],
-        "bio": db_user[4],
-        "level": db_user[5],
-        "streak": db_user[6],
-        "onboarding_complete": db_user[7],
-        "theme_preference": db_user[8],
-        "picture": picture,
-    }
-
-    session["user"] = user_payload
-
-    return jsonify(session["user"]), 200
+    profiles.put(db_user)
+    return jsonify({**asdict(db_user), "picture": picture}), 200
 
 @auth_blueprint.route("/me", methods=["GET"])
 def auth_me():
@@ -85,13 +79,15 @@ def auth_me():
     user = session_user()
     if not user:
         return jsonify({"error": "Unauthorized"}), 401
-    return jsonify(user), 200
+    profile = profiles.get(user["id"])
+    if not profile:
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify({**asdict(profile), "picture": user["picture"]}), 200
 
 @auth_blueprint.route("/logout", methods=["POST"])
 def auth_logout():
     """Clear session."""
     session.clear()
-    # Optionally, you can force the cookie to expire client-side:
     resp = jsonify({"ok": True})
-    # Flask will overwrite the session cookie automatically; clearing session is enough.
+    # Clearing deletes the server-side row and expires the cookie.
     return resp, 200
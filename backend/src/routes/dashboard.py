@@ -0,0 +1,128 @@
+from datetime import date, timedelta
+
+from flask import Blueprint, current_app, jsonify, request
+from tools.auth_helper import ensure_auth
+from tools.database import db_pool
+from tools.statements import register
+
+dashboard_blueprint = Blueprint("dashboard", __name__, url_prefix="/api/dashboard")
+
+DEFAULT_ENTRY_LIMIT = 10
+MAX_ENTRY_LIMIT = 50
+DEFAULT_HEALTH_DAYS = 7
+MAX_HEALTH_DAYS = 30
+
+# One statement builds the whole payload as JSON text; the items match the shapes
+# of /api/goals, /api/journal/entries and /api/health/daily.
+DASHBOARD = register("dashboard", """
+    WITH params AS (
+        SELECT %s::bigint AS user_id, %s::int AS entry_limit, %s::date AS health_since
+    )
+    SELECT json_build_object(
+        'goals', COALESCE((
+            SELECT json_agg(
+                json_build_object(
+                    'id', g.id,
+                    'goal_text', g.goal_text,
+                    'xp', g.xp,
+                    'completed', g.completed,
+                    'created_at', g.created_at,
+                    'habit_id', h.id,
+                    'habit', json_build_object('id', h.id, 'name', h.name, 'description', h.description)
+                )
+                ORDER BY g.created_at DESC
+            )
+            FROM params p
+            JOIN goals g ON g.user_id = p.user_id
+            JOIN habits h ON h.id = g.habit_id
+        ), '[]'::json),
+        'entries', COALESCE((
+            SELECT json_agg(e ORDER BY e.entry_date DESC, e.id DESC)
+            FROM (
+                SELECT
+                    je.id,
+                    je.goal_id,
+                    g.habit_id,
+                    h.name AS habit_name,
+                    g.goal_text,
+                    je.entry_date,
+                    je.reflection,
+                    je.completion_level,
+                    je.xp_delta,
+                    je.created_at,
+                    je.updated_at,
+                    g.xp AS goal_xp
+                FROM params p
+                JOIN journal_entries je ON je.user_id = p.user_id
+                JOIN goals g ON g.id = je.goal_id
+                JOIN habits h ON h.id = g.habit_id
+                ORDER BY je.entry_date DESC, je.id DESC
+                LIMIT (SELECT entry_limit FROM params)
+            ) e
+        ), '[]'::json),
+        'health', COALESCE((
+            SELECT json_agg(d ORDER BY d.date DESC)
+            FROM (
+                SELECT m.metric_date AS date, m.steps, m.exercise_minutes, m.sleep_minutes, m.source, m.updated_at
+                FROM params p
+                JOIN user_health_metrics m ON m.user_id = p.user_id AND m.metric_date >= p.health_since
+            ) d
+        ), '[]'::json),
+        'friend_count', (
+            SELECT (SELECT count(*) FROM friends f WHERE f.user_id1 = p.user_id)
+                 + (SELECT count(*) FROM friends f WHERE f.user_id2 = p.user_id)
+            FROM params p
+        ),
+        'requests', (
+            SELECT json_build_object(
+                'incoming', count(*) FILTER (WHERE fr.receiver_id = p.user_id),
+                'outgoing', count(*) FILTER (WHERE fr.sender_id = p.user_id)
+            )
+            FROM params p
+            JOIN friend_requests fr
+              ON (fr.sender_id = p.user_id OR fr.receiver_id = p.user_id)
+             AND fr.status = 'pending'
+        )
+    )::text
+""")
+
+
+def _bounded_int(name, default, maximum):
+    value = request.args.get(name)
+    if value is None:
+        return default, None
+    try:
+        return max(1, min(maximum, int(value))), None
+    except (TypeError, ValueError):
+        return None, (jsonify({"error": f"{name} must be an integer"}), 400)
+
+
+@dashboard_blueprint.route("", methods=["GET"])
+def get_dashboard():
+    """
+    Everything the home screen needs in one call: goals, recent journal entries,
+    recent health days, friend count and pending request counts.
+    Query: ?entries=<n> (default 10, max 50), ?days=<n> (default 7, max 30)
+    """
+    user, error = ensure_auth()
+    if error:
+        return error
+
+    entry_limit, error = _bounded_int("entries", DEFAULT_ENTRY_LIMIT, MAX_ENTRY_LIMIT)
+    if error:
+        return error
+    days, error = _bounded_int("days", DEFAULT_HEALTH_DAYS, MAX_HEALTH_DAYS)
+    if error:
+        return error
+    since_date = date.today() - timedelta(days=days - 1)
+
+    conn = db_pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            DASHBOARD.execute(cur, (user["id"], entry_limit, since_date))
+            body = cur.fetchone()[0]
+    finally:
+        db_pool.putconn(conn)
+
+    # Already JSON; skip decoding and re-encoding it in Python.
+    return current_app.response_class(body, mimetype="application/json")
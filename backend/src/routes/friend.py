@@ -1,17 +1,167 @@
+from datetime import date, datetime
+
 from flask import request, jsonify, Blueprint
+from tools import cursors, friendships, profiles
 from tools.auth_helper import ensure_auth
 from tools.database import db_pool
+from tools.records import FeedEntry, Friend, FriendSuggestion, Goal, LeaderboardEntry, RowMapper, UserSummary
+from tools.statements import register
 
 friend_blueprint = Blueprint("friends", __name__, url_prefix="/api/friends")
 
-
-def _build_user_payload(row):
-    return {
-        "id": row[0],
-        "email": row[1],
-        "name": row[2],
-        "bio": row[3],
-    }
+# Page size for GET /feed when no limit is given, and the largest accepted.
+DEFAULT_FEED_PAGE_SIZE = 50
+MAX_FEED_PAGE_SIZE = 200
+# Sort key above every real entry; the first page seeks from here.
+FEED_START = (date.max, 2**63 - 1)
+# Suggestions returned by GET /suggestions when no limit is given, and the most
+# accepted (the job keeps FRIEND_SUGGESTIONS_K per user).
+DEFAULT_SUGGESTIONS = 20
+MAX_SUGGESTIONS = 50
+# Entries returned by GET /leaderboard when no limit is given, and the most accepted.
+DEFAULT_LEADERBOARD_SIZE = 10
+MAX_LEADERBOARD_SIZE = 100
+
+FEED_ROWS = RowMapper(FeedEntry)
+SUGGESTION_ROWS = RowMapper(FriendSuggestion)
+LEADERBOARD_ROWS = RowMapper(LeaderboardEntry)
+FRIEND_ROWS = RowMapper(Friend)
+GOAL_ROWS = RowMapper(Goal)
+USER_ROWS = RowMapper(UserSummary)
+SENDER_ROWS = RowMapper(UserSummary, prefix="sender_")
+RECEIVER_ROWS = RowMapper(UserSummary, prefix="receiver_")
+
+# Edges are stored once (user_id1 < user_id2), so each direction is its own
+# branch: a seek on friends_pkey or idx_friends_user2_user1, both covering since.
+FRIENDS_FOR_USER = register("friends_for_user", """
+    SELECT u.id, u.email, u.name, u.bio, f.since
+    FROM (
+        SELECT user_id2 AS friend_id, since FROM friends WHERE user_id1 = %s
+        UNION ALL
+        SELECT user_id1, since FROM friends WHERE user_id2 = %s
+    ) f
+    JOIN users u ON u.id = f.friend_id
+    ORDER BY u.name NULLS LAST, u.email
+""")
+
+# Newest entries across all friends, in two passes over idx_journal_entries_user_date_id
+# (index-only seeks, one per friend each):
+#   1. each friend's newest key below the cursor; the page-size-th largest of
+#      these is a lower bound for the page, since that many entries sit at or above it;
+#   2. each friend's keys between that bound's date and the cursor, at most a page each.
+# Only the winning page is joined back to entries, goals, habits and users, so the
+# cost is about friends + page size however long their histories are. Reflections stay private.
+FRIEND_FEED = register("friend_feed", """
+    WITH friend AS (
+        SELECT user_id FROM unnest(%s::bigint[]) AS f (user_id)
+    ),
+    page_size (n) AS (
+        VALUES (%s::int)
+    ),
+    head AS (
+        SELECT h.entry_date, h.id
+        FROM friend f
+        CROSS JOIN LATERAL (
+            SELECT je.entry_date, je.id
+            FROM journal_entries je
+            WHERE je.user_id = f.user_id
+              AND (je.entry_date, je.id) < (%s::date, %s::bigint)
+            ORDER BY je.entry_date DESC, je.id DESC
+            LIMIT 1
+        ) h
+    ),
+    bound (entry_date) AS (
+        SELECT COALESCE((
+            SELECT entry_date FROM head
+            ORDER BY entry_date DESC, id DESC
+            OFFSET (SELECT n - 1 FROM page_size) LIMIT 1
+        ), '-infinity'::date)
+    ),
+    page AS (
+        SELECT k.id, k.entry_date
+        FROM friend f
+        CROSS JOIN LATERAL (
+            SELECT je.id, je.entry_date
+            FROM journal_entries je
+            WHERE je.user_id = f.user_id
+              AND (je.entry_date, je.id) < (%s::date, %s::bigint)
+              AND je.entry_date >= (SELECT entry_date FROM bound)
+            ORDER BY je.entry_date DESC, je.id DESC
+            LIMIT (SELECT n FROM page_size)
+        ) k
+        ORDER BY k.entry_date DESC, k.id DESC
+        LIMIT (SELECT n FROM page_size)
+    )
+    SELECT
+        je.id,
+        u.id AS friend_id,
+        u.email AS friend_email,
+        u.name AS friend_name,
+        u.bio AS friend_bio,
+        je.goal_id,
+        g.habit_id,
+        h.name AS habit_name,
+        g.goal_text,
+        je.entry_date,
+        je.completion_level,
+        je.xp_delta,
+        je.created_at,
+        je.updated_at
+    FROM page p
+    JOIN journal_entries je ON je.id = p.id
+    JOIN goals g ON g.id = je.goal_id
+    JOIN habits h ON h.id = g.habit_id
+    JOIN users u ON u.id = je.user_id
+    ORDER BY p.entry_date DESC, p.id DESC
+""")
+
+# Precomputed by jobs/refresh_friend_suggestions.py; a range read of idx_friend_suggestions_rank.
+# A few extra rows cover friendships made since the last refresh, which are filtered out.
+FRIEND_SUGGESTIONS = register("friend_suggestions", """
+    SELECT u.id, u.name, u.bio, s.mutual_count
+    FROM friend_suggestions s
+    JOIN users u ON u.id = s.suggested_id
+    WHERE s.user_id = %s
+    ORDER BY s.mutual_count DESC, s.suggested_id
+    LIMIT %s
+""")
+
+# The caller and their friends ranked by XP, from the leaderboard materialized view
+# (one index-only lookup per member; see jobs/refresh_leaderboard.py). Returns the
+# top rows plus the caller's own row wherever it falls; ties share a rank.
+FRIEND_LEADERBOARD = register("friend_leaderboard", """
+    WITH ranked AS (
+        SELECT
+            l.id,
+            l.name,
+            l.total_xp,
+            l.level,
+            rank() OVER (ORDER BY l.total_xp DESC)::int AS rank,
+            row_number() OVER (ORDER BY l.total_xp DESC, l.id) AS position
+        FROM leaderboard l
+        WHERE l.id = ANY(%s::bigint[])
+    )
+    SELECT rank, id, name, total_xp, level, position <= %s AS in_top
+    FROM ranked
+    WHERE position <= %s OR id = %s
+    ORDER BY position
+""")
+
+FRIEND_GOALS = register("friend_goals", """
+    SELECT
+        g.id,
+        g.goal_text,
+        g.xp,
+        g.completed,
+        g.created_at,
+        h.id AS habit_id,
+        h.name AS habit_name,
+        h.description AS habit_description
+    FROM goals g
+    JOIN habits h ON h.id = g.habit_id
+    WHERE g.user_id = %s
+    ORDER BY h.name NULLS LAST, g.created_at DESC
+""")
 
 
 @friend_blueprint.route("", methods=["GET"])
@@ -23,42 +173,130 @@ def get_friends():
     conn = db_pool.getconn()
     try:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT
-                    CASE
-                        WHEN f.user_id1 = %s THEN f.user_id2
-                        ELSE f.user_id1
-                    END AS friend_id,
-                    u.email,
-                    u.name,
-                    u.bio,
-                    f.since
-                FROM friends f
-                JOIN users u
-                  ON u.id = CASE WHEN f.user_id1 = %s THEN f.user_id2 ELSE f.user_id1 END
-                WHERE f.user_id1 = %s OR f.user_id2 = %s
-                ORDER BY u.name NULLS LAST, u.email
-                """,
-                (user["id"], user["id"], user["id"], user["id"]),
-            )
-            rows = cur.fetchall()
+            FRIENDS_FOR_USER.execute(cur, (user["id"], user["id"]))
+            friends = FRIEND_ROWS.all(cur)
 
-        friends = [
-            {
-                "id": row[0],
-                "email": row[1],
-                "name": row[2],
-                "bio": row[3],
-                "since": row[4].isoformat() if row[4] else None,
-            }
-            for row in rows
-        ]
         return jsonify(friends)
     finally:
         db_pool.putconn(conn)
 
 
+@friend_blueprint.route("/feed", methods=["GET"])
+def get_friend_feed():
+    """
+    Friends' journal activity, newest first (?limit=, default 50, max 200).
+    When more rows exist the response carries an X-Next-Cursor header; pass it
+    back as ?cursor= to fetch the following page.
+    """
+    user, error = ensure_auth()
+    if error:
+        return error
+
+    after_date, after_id = FEED_START
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            after_date, after_id = cursors.decode(cursor, 2)
+            after_date = datetime.strptime(after_date, "%Y-%m-%d").date()
+            after_id = int(after_id)
+        except (TypeError, ValueError):
+            return jsonify({"error": "cursor is invalid"}), 400
+
+    page_size = DEFAULT_FEED_PAGE_SIZE
+    limit = request.args.get("limit")
+    if limit:
+        try:
+            page_size = max(1, min(MAX_FEED_PAGE_SIZE, int(limit)))
+        except (TypeError, ValueError):
+            return jsonify({"error": "limit must be an integer"}), 400
+
+    friend_ids = friendships.friend_ids(user["id"])
+    if not friend_ids:
+        return jsonify([])
+
+    conn = db_pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            # One extra row tells us whether another page exists.
+            FRIEND_FEED.execute(
+                cur, (list(friend_ids), page_size + 1, after_date, after_id, after_date, after_id)
+            )
+            entries = FEED_ROWS.all(cur)
+    finally:
+        db_pool.putconn(conn)
+
+    resp = jsonify(entries[:page_size])
+    if len(entries) > page_size:
+        last = entries[page_size - 1]
+        resp.headers["X-Next-Cursor"] = cursors.encode(last.entry_date.isoformat(), last.id)
+    return resp
+
+
+@friend_blueprint.route("/suggestions", methods=["GET"])
+def get_friend_suggestions():
+    """People you may know: friends of friends, most mutual friends first (?limit=, default 20, max 50)."""
+    user, error = ensure_auth()
+    if error:
+        return error
+
+    limit = DEFAULT_SUGGESTIONS
+    if request.args.get("limit"):
+        try:
+            limit = max(1, min(MAX_SUGGESTIONS, int(request.args["limit"])))
+        except (TypeError, ValueError):
+            return jsonify({"error": "limit must be an integer"}), 400
+
+    friend_ids = friendships.friend_ids(user["id"])
+    conn = db_pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            FRIEND_SUGGESTIONS.execute(cur, (user["id"], limit + 10))
+            suggestions = SUGGESTION_ROWS.all(cur)
+    finally:
+        db_pool.putconn(conn)
+
+    return jsonify([s for s in suggestions if s.id not in friend_ids][:limit])
+
+
+@friend_blueprint.route("/leaderboard", methods=["GET"])
+def get_friend_leaderboard():
+    """
+    The caller and their friends by total XP (?limit=, default 10, max 100):
+    { "leaderboard": [top entries], "me": the caller's entry }. XP is as of the
+    last leaderboard refresh; "me" is null until the caller's first one.
+    """
+    user, error = ensure_auth()
+    if error:
+        return error
+
+    limit = DEFAULT_LEADERBOARD_SIZE
+    if request.args.get("limit"):
+        try:
+            limit = max(1, min(MAX_LEADERBOARD_SIZE, int(request.args["limit"])))
+        except (TypeError, ValueError):
+            return jsonify({"error": "limit must be an integer"}), 400
+
+    members = [user["id"], *friendships.friend_ids(user["id"])]
+    conn = db_pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            FRIEND_LEADERBOARD.execute(cur, (members, limit, limit, user["id"]))
+            build = LEADERBOARD_ROWS.build(cur)
+            rows = cur.fetchall()
+    finally:
+        db_pool.putconn(conn)
+
+    leaderboard = []
+    me = None
+    for row in rows:
+        entry = build(row)
+        if row[-1]:
+            leaderboard.append(entry)
+        if entry.id == user["id"]:
+            me = entry
+    return jsonify({"leaderboard": leaderboard, "me": me})
+
+
 @friend_blueprint.route("/requests", methods=["GET"])
 def get_friend_requests():
     user, error = ensure_auth()
@@ -72,18 +310,16 @@ def get_friend_requests():
                 """
                 SELECT
                     fr.id,
-                    fr.sender_id,
-                    fr.receiver_id,
                     fr.status,
                     fr.requested_at,
-                    s.id,
-                    s.email,
-                    s.name,
-                    s.bio,
-                    r.id,
-                    r.email,
-                    r.name,
-                    r.bio
+                    s.id AS sender_id,
+                    s.email AS sender_email,
+                    s.name AS sender_name,
+                    s.bio AS sender_bio,
+                    r.id AS receiver_id,
+                    r.email AS receiver_email,
+                    r.name AS receiver_name,
+                    r.bio AS receiver_bio
                 FROM friend_requests fr
                 JOIN users s ON s.id = fr.sender_id
                 JOIN users r ON r.id = fr.receiver_id
@@ -93,6 +329,8 @@ def get_friend_requests():
                 """,
                 (user["id"], user["id"]),
             )
+            build_sender = SENDER_ROWS.build(cur)
+            build_receiver = RECEIVER_ROWS.build(cur)
             rows = cur.fetchall()
 
         incoming = []
@@ -101,13 +339,12 @@ def get_friend_requests():
         for row in rows:
             payload = {
                 "id": row[0],
-                "status": row[3],
-                "requested_at": row[4].isoformat() if row[4] else None,
+                "status": row[1],
+                "requested_at": row[2],
             }
-            sender = _build_user_payload(row[5:9])
-            receiver = _build_user_payload(row[9:13])
-            if row[1] == user["id"]:
-                payload["receiver"] = receiver
+            sender = build_sender(row)
+            if sender.id == user["id"]:
+                payload["receiver"] = build_receiver(row)
                 outgoing.append(payload)
             else:
                 payload["sender"] = sender
@@ -137,6 +374,11 @@ def send_friend_request():
     except (TypeError, ValueError):
         return jsonify({"error": "user_id must be an integer"}), 400
 
+    # Sessions only carry the id; read before taking a connection, as profiles.get may need its own.
+    sender = profiles.get(user["id"])
+    if not sender:
+        return jsonify({"error": "Unauthorized"}), 401
+
     conn = db_pool.getconn()
     try:
         with conn:
@@ -151,12 +393,11 @@ def send_friend_request():
                         "SELECT id, email, name, bio FROM users WHERE lower(email) = %s",
                         (target_email,),
                     )
-                target_row = cur.fetchone()
-                if not target_row:
+                target_user = USER_ROWS.one(cur)
+                if not target_user:
                     return jsonify({"error": "User not found"}), 404
 
-                target_user = _build_user_payload(target_row)
-                target_id = target_user["id"]
+                target_id = target_user.id
 
                 if target_id == user["id"]:
                     return jsonify({"error": "Cannot send a friend request to yourself"}), 400
@@ -164,12 +405,10 @@ def send_friend_request():
                 low_id = min(user["id"], target_id)
                 high_id = max(user["id"], target_id)
 
+                # Checked in this transaction, not through the friendships cache, so it
+                # cannot race a concurrent accept/unfriend or wait on a second connection.
                 cur.execute(
-                    """
-                    SELECT 1
-                    FROM friends
-                    WHERE user_id1 = %s AND user_id2 = %s
-                    """,
+                    "SELECT 1 FROM friends WHERE user_id1 = %s AND user_id2 = %s",
                     (low_id, high_id),
                 )
                 if cur.fetchone():
@@ -189,6 +428,7 @@ def send_friend_request():
 
                 incoming = None
                 outgoing = None
+                accepted_id = None
                 for row in rows:
                     if row[1] == user["id"]:
                         outgoing = row
@@ -219,29 +459,11 @@ def send_friend_request():
                         (low_id, high_id),
                     )
                     since_row = cur.fetchone()
-                    friend_payload = {
-                        "id": target_user["id"],
-                        "email": target_user["email"],
-                        "name": target_user["name"],
-                        "bio": target_user["bio"],
-                        "since": since_row[0].isoformat() if since_row and since_row[0] else None,
-                    }
-                    return (
-                        jsonify(
-                            {
-                                "friend": friend_payload,
-                                "request_id": incoming[0],
-                                "status": "accepted",
-                                "auto_accepted": True,
-                            }
-                        ),
-                        200,
-                    )
-
-                if outgoing and outgoing[3] == "pending":
+                    accepted_id = incoming[0]
+                elif outgoing and outgoing[3] == "pending":
                     return jsonify({"error": "Friend request already pending"}), 409
 
-                if outgoing:
+                elif outgoing:
                     cur.execute(
                         """
                         UPDATE friend_requests
@@ -263,14 +485,35 @@ def send_friend_request():
                     )
                     req_row = cur.fetchone()
 
+        if accepted_id is not None:
+            friendships.invalidate(user["id"], target_id)
+            friend_payload = Friend(
+                id=target_user.id,
+                email=target_user.email,
+                name=target_user.name,
+                bio=target_user.bio,
+                since=since_row[0] if since_row else None,
+            )
+            return (
+                jsonify(
+                    {
+                        "friend": friend_payload,
+                        "request_id": accepted_id,
+                        "status": "accepted",
+                        "auto_accepted": True,
+                    }
+                ),
+                200,
+            )
+
         request_payload = {
             "id": req_row[0],
             "status": req_row[1],
-            "requested_at": req_row[2].isoformat() if req_row[2] else None,
+            "requested_at": req_row[2],
             "sender": {
                 "id": user["id"],
-                "email": user.get("email"),
-                "name": user.get("name"),
+                "email": sender.email,
+                "name": sender.name,
             },
             "receiver": target_user,
         }
@@ -338,15 +581,16 @@ def accept_friend_request(request_id):
                     "SELECT id, email, name, bio FROM users WHERE id = %s",
                     (row[1],),
                 )
-                friend_row = cur.fetchone()
-
-        friend_payload = {
-            "id": friend_row[0],
-            "email": friend_row[1],
-            "name": friend_row[2],
-            "bio": friend_row[3],
-            "since": since_row[0].isoformat() if since_row and since_row[0] else None,
-        }
+                friend_user = USER_ROWS.one(cur)
+
+        friendships.invalidate(user["id"], friend_user.id)
+        friend_payload = Friend(
+            id=friend_user.id,
+            email=friend_user.email,
+            name=friend_user.name,
+            bio=friend_user.bio,
+            since=since_row[0] if since_row else None,
+        )
         return jsonify({"friend": friend_payload, "request_id": request_id, "status": "accepted"})
     finally:
         db_pool.putconn(conn)
@@ -471,6 +715,7 @@ def delete_friend(friend_user_id):
                     (user["id"], friend_user_id, friend_user_id, user["id"]),
                 )
 
+        friendships.invalidate(user["id"], friend_user_id)
         return ("", 204)
     finally:
         db_pool.putconn(conn)
@@ -485,23 +730,12 @@ def get_friend_habits(friend_id):
     if friend_id == user["id"]:
         return jsonify({"error": "Friend ID must be different from your user ID"}), 400
 
-    low_id = min(user["id"], friend_id)
-    high_id = max(user["id"], friend_id)
+    if not friendships.are_friends(user["id"], friend_id):
+        return jsonify({"error": "You can only view habits for confirmed friends."}), 403
 
     conn = db_pool.getconn()
     try:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT 1
-                FROM friends
-                WHERE user_id1 = %s AND user_id2 = %s
-                """,
-                (low_id, high_id),
-            )
-            if not cur.fetchone():
-                return jsonify({"error": "You can only view habits for confirmed friends."}), 403
-
             cur.execute(
                 """
                 SELECT id, email, name, bio
@@ -510,50 +744,16 @@ def get_friend_habits(friend_id):
                 """,
                 (friend_id,),
             )
-            friend_row = cur.fetchone()
-            if not friend_row:
+            friend = USER_ROWS.one(cur)
+            if not friend:
                 return jsonify({"error": "Friend not found"}), 404
 
-            cur.execute(
-                """
-                SELECT
-                    g.id,
-                    g.goal_text,
-                    g.xp,
-                    g.completed,
-                    g.created_at,
-                    h.id AS habit_id,
-                    h.name AS habit_name,
-                    h.description AS habit_description
-                FROM goals g
-                JOIN habits h ON h.id = g.habit_id
-                WHERE g.user_id = %s
-                ORDER BY h.name NULLS LAST, g.created_at DESC
-                """,
-                (friend_id,),
-            )
-            rows = cur.fetchall()
-
-        goals = [
-            {
-                "id": row[0],
-                "goal_text": row[1],
-                "xp": row[2],
-                "completed": row[3],
-                "created_at": row[4].isoformat() if row[4] else None,
-                "habit_id": row[5],
-                "habit": {
-                    "id": row[5],
-                    "name": row[6],
-                    "description": row[7],
-                },
-            }
-            for row in rows
-        ]
+            FRIEND_GOALS.execute(cur, (friend_id,))
+            goals = GOAL_ROWS.all(cur)
 
         return jsonify(
             {
-                "friend": _build_user_payload(friend_row),
+                "friend": friend,
                 "goals": goals,
             }
         )
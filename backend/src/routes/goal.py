@@ -1,9 +1,30 @@
 from flask import request, jsonify, Blueprint
+from tools import profiles
 from tools.auth_helper import ensure_auth
 from tools.database import db_pool 
+from tools.records import Goal, RowMapper
+from tools.statements import register
 
 goal_blueprint = Blueprint("goals", __name__, url_prefix="/api/goals")
 
+GOAL_ROWS = RowMapper(Goal)
+
+GOALS_FOR_USER = register("goals_for_user", """
+    SELECT 
+        g.id,
+        g.goal_text,
+        g.xp,
+        g.completed,
+        g.created_at,
+        h.id AS habit_id,
+        h.name AS habit_name,
+        h.description AS habit_description
+    FROM goals g
+    JOIN habits h ON g.habit_id = h.id
+    WHERE g.user_id = %s
+    ORDER BY g.created_at DESC
+""")
+
 @goal_blueprint.route("", methods=["GET"])
 def get_goals():
     user, error = ensure_auth()
@@ -13,40 +34,9 @@ def get_goals():
     conn = db_pool.getconn()
     try:
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT 
-                    g.id,
-                    g.goal_text,
-                    g.xp,
-                    g.completed,
-                    g.created_at,
-                    h.id AS habit_id,
-                    h.name AS habit_name,
-                    h.description AS habit_description
-                FROM goals g
-                JOIN habits h ON g.habit_id = h.id
-                WHERE g.user_id = %s
-                ORDER BY g.created_at DESC;
-            """, (user["id"],))
-            
-            rows = cur.fetchall()
-
-        goals = [
-            {
-                "id": r[0],
-                "goal_text": r[1],
-                "xp": r[2],
-                "completed": r[3],
-                "created_at": r[4].isoformat() if r[4] else None,
-                "habit_id": r[5],
-                "habit": {
-                    "id": r[5],
-                    "name": r[6],
-                    "description": r[7],
-                },
-            }
-            for r in rows
-        ]
+            GOALS_FOR_USER.execute(cur, (user["id"],))
+            goals = GOAL_ROWS.all(cur)
+
         return jsonify(goals)
     finally:
         db_pool.putconn(conn)
@@ -98,17 +88,10 @@ def create_goal():
                     FROM ins
                     JOIN habits h ON h.id = ins.habit_id;
                 """, (user["id"], habit_id, goal_text, xp, completed))
-                r = cur.fetchone()
+                goal = GOAL_ROWS.one(cur)
 
-        goal = {
-            "id": r[0],
-            "goal_text": r[1],
-            "xp": r[2],
-            "completed": r[3],
-            "created_at": r[4].isoformat() if r[4] else None,
-            "habit_id": r[5],
-            "habit": {"id": r[5], "name": r[6], "description": r[7]},
-        }
+        # Goal XP feeds the user's level (sync_user_level trigger)
+        profiles.invalidate(user["id"])
         return jsonify(goal), 201
     finally:
         db_pool.putconn(conn)
@@ -163,42 +146,29 @@ def update_goal(goal_id):
                 set_sql = ", ".join(f"{col} = %s" for col in fields)
                 params = [updates[col] for col in fields] + [goal_id, user["id"]]
 
-                # Update and get the updated goal (without join—keep it simple)
+                # Update and return the joined record in the same round trip
                 cur.execute(
                     f"""
-                    UPDATE goals
-                    SET {set_sql}
-                    WHERE id = %s AND user_id = %s
-                    RETURNING id, habit_id, goal_text, xp, completed, created_at
+                    WITH upd AS (
+                        UPDATE goals
+                        SET {set_sql}
+                        WHERE id = %s AND user_id = %s
+                        RETURNING id, habit_id, goal_text, xp, completed, created_at
+                    )
+                    SELECT
+                        upd.id, upd.goal_text, upd.xp, upd.completed, upd.created_at,
+                        h.id AS habit_id, h.name AS habit_name, h.description AS habit_description
+                    FROM upd
+                    JOIN habits h ON h.id = upd.habit_id
                     """,
                     params,
                 )
-                row = cur.fetchone()
-                if not row:
+                goal = GOAL_ROWS.one(cur)
+                if not goal:
                     return jsonify({"error": "Goal not found"}), 404
 
-                goal_id_out, habit_id_out, goal_text_out, xp_out, completed_out, created_at_out = row
-
-                # Fetch habit for the response payload
-                cur.execute(
-                    "SELECT id, name, description FROM habits WHERE id = %s",
-                    (habit_id_out,),
-                )
-                h = cur.fetchone()
-
-        goal = {
-            "id": goal_id_out,
-            "goal_text": goal_text_out,
-            "xp": xp_out,
-            "completed": completed_out,
-            "created_at": created_at_out.isoformat() if created_at_out else None,
-            "habit_id": h[0] if h else habit_id_out,
-            "habit": {
-                "id": h[0],
-                "name": h[1],
-                "description": h[2],
-            } if h else None,
-        }
+        if "xp" in updates:
+            profiles.invalidate(user["id"])
         return jsonify(goal)
     finally:
         db_pool.putconn(conn)
@@ -221,6 +191,7 @@ def delete_goal(goal_id):
                 r = cur.fetchone()
                 if not r:
                     return jsonify({"error": "Goal not found"}), 404
+        profiles.invalidate(user["id"])
         # No body needed; 204 is conventional for DELETE success
         return ("", 204)
     finally:
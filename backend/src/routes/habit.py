@@ -1,9 +1,19 @@
 from flask import request, jsonify, Blueprint
 from tools.auth_helper import ensure_auth
 from tools.database import db_pool 
+from tools.records import Habit, RowMapper
+from tools.statements import register
 
 habit_blueprint = Blueprint("habits", __name__, url_prefix="/api/habits")
 
+HABIT_ROWS = RowMapper(Habit)
+
+ALL_HABITS = register("all_habits", """
+    SELECT id, name, description
+    FROM habits
+    ORDER BY name
+""")
+
 @habit_blueprint.route("", methods=["GET"])
 def get_habits():
     user, error = ensure_auth()
@@ -13,17 +23,9 @@ def get_habits():
     conn = db_pool.getconn()
     try:
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT id, name, description
-                FROM habits
-                ORDER BY name;
-            """)
-            rows = cur.fetchall()
+            ALL_HABITS.execute(cur)
+            habits = HABIT_ROWS.all(cur)
 
-        habits = [
-            {"id": r[0], "name": r[1], "description": r[2]}
-            for r in rows
-        ]
         return jsonify(habits)
     finally:
         db_pool.putconn(conn)
@@ -1,16 +1,62 @@
 from datetime import datetime, date, timedelta
 from flask import Blueprint, jsonify, request
 
+from tools import health_ingest
 from tools.auth_helper import session_user
 from tools.database import db_pool
+from tools.records import HealthDay, HealthRollup, RowMapper
+from tools.statements import register
 
 health_blueprint = Blueprint("health", __name__, url_prefix="/api/health")
 
+HEALTH_DAY_ROWS = RowMapper(HealthDay)
+HEALTH_ROLLUP_ROWS = RowMapper(HealthRollup)
+
+# Rollup periods returned by default and at most (five years) per granularity.
+ROLLUP_PERIODS = {"week": (52, 261), "month": (12, 60)}
+
+# Upper bound on records per upload; decades of daily data fit comfortably.
+MAX_HEALTH_RECORDS = 20000
+
+DAILY_HEALTH_SINCE = register("daily_health_since", """
+    SELECT metric_date AS date, steps, exercise_minutes, sleep_minutes, source, updated_at
+    FROM user_health_metrics
+    WHERE user_id = %s AND metric_date >= %s
+    ORDER BY metric_date DESC
+""")
+
+# user_health_rollups is maintained by triggers on user_health_metrics.
+HEALTH_ROLLUPS_SINCE = register("health_rollups_since", """
+    SELECT
+        period_start,
+        days,
+        steps,
+        exercise_minutes,
+        sleep_minutes,
+        steps::float8 / days AS avg_steps,
+        exercise_minutes::float8 / days AS avg_exercise_minutes,
+        sleep_minutes::float8 / days AS avg_sleep_minutes
+    FROM user_health_rollups
+    WHERE user_id = %s AND granularity = %s AND period_start >= %s AND days > 0
+    ORDER BY period_start DESC
+""")
+
+
+def _rollup_since(granularity, periods):
+    """First day of the oldest of the last `periods` weeks/months, counting the current one."""
+    today = date.today()
+    if granularity == "week":
+        return today - timedelta(days=today.weekday()) - timedelta(weeks=periods - 1)
+    month_index = today.year * 12 + today.month - 1 - (periods - 1)
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
 
 def _parse_records(payload):
     records = payload.get("records")
     if not isinstance(records, list) or len(records) == 0:
         raise ValueError("records must be a non-empty list")
+    if len(records) > MAX_HEALTH_RECORDS:
+        raise ValueError(f"At most {MAX_HEALTH_RECORDS} records per request")
 
     parsed = []
     for idx, record in enumerate(records):
@@ -67,22 +113,9 @@ def upsert_daily_health():
     try:
         with conn:
             with conn.cursor() as cur:
-                for metric_date, steps, exercise_minutes, sleep_minutes, source in records:
-                    cur.execute(
-                        """
-                        INSERT INTO user_health_metrics (user_id, metric_date, steps, exercise_minutes, sleep_minutes, source)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (user_id, metric_date)
-                        DO UPDATE SET
-                            steps = EXCLUDED.steps,
-                            exercise_minutes = EXCLUDED.exercise_minutes,
-                            sleep_minutes = EXCLUDED.sleep_minutes,
-                            source = EXCLUDED.source,
-                            updated_at = now()
-                        """,
-                        (user["id"], metric_date, steps, exercise_minutes, sleep_minutes, source),
-                    )
-        return jsonify({"updated": len(records)}), 200
+                counts = health_ingest.merge_daily(cur, user["id"], records)
+        # `updated` (records accepted) is what existing clients read.
+        return jsonify({"updated": len(records), **counts}), 200
     finally:
         db_pool.putconn(conn)
 
@@ -105,28 +138,43 @@ def get_daily_health():
     conn = db_pool.getconn()
     try:
         with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT metric_date, steps, exercise_minutes, sleep_minutes, source, updated_at
-                FROM user_health_metrics
-                WHERE user_id = %s AND metric_date >= %s
-                ORDER BY metric_date DESC
-                """,
-                (user["id"], since_date),
-            )
-            rows = cur.fetchall()
-
-        records = [
-            {
-                "date": row[0].isoformat(),
-                "steps": row[1],
-                "exercise_minutes": row[2],
-                "sleep_minutes": row[3],
-                "source": row[4],
-                "updated_at": row[5].isoformat() if row[5] else None,
-            }
-            for row in rows
-        ]
+            DAILY_HEALTH_SINCE.execute(cur, (user["id"], since_date))
+            records = HEALTH_DAY_ROWS.all(cur)
+
         return jsonify({"records": records})
     finally:
         db_pool.putconn(conn)
+
+
+@health_blueprint.route("/rollups", methods=["GET"])
+def get_health_rollups():
+    """
+    Weekly or monthly totals and daily averages for long-range trends.
+    Query: ?granularity=week|month (default week), ?periods=<n>
+    (default 52 weeks / 12 months, max 261 weeks / 60 months).
+    """
+    user = session_user()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    granularity = request.args.get("granularity", default="week").strip().lower()
+    if granularity not in ROLLUP_PERIODS:
+        return jsonify({"error": "granularity must be 'week' or 'month'"}), 400
+
+    default_periods, max_periods = ROLLUP_PERIODS[granularity]
+    periods_param = request.args.get("periods", default=str(default_periods))
+    try:
+        periods = int(periods_param)
+    except (TypeError, ValueError):
+        return jsonify({"error": "periods must be an integer"}), 400
+    periods = max(1, min(periods, max_periods))
+
+    conn = db_pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            HEALTH_ROLLUPS_SINCE.execute(cur, (user["id"], granularity, _rollup_since(granularity, periods)))
+            records = HEALTH_ROLLUP_ROWS.all(cur)
+
+        return jsonify({"granularity": granularity, "records": records})
+    finally:
+        db_pool.putconn(conn)
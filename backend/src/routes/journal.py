@@ -1,8 +1,12 @@
 from datetime import datetime
 from datetime import date as date_cls
 from flask import Blueprint, jsonify, request
+from psycopg2.extras import execute_values
+from tools import cursors, profiles
 from tools.auth_helper import ensure_auth
 from tools.database import db_pool
+from tools.records import JournalEntry, RowMapper
+from tools.statements import register
 
 journal_blueprint = Blueprint("journal", __name__, url_prefix="/api/journal")
 
@@ -13,6 +17,23 @@ COMPLETION_TO_XP = {
 }
 DEFAULT_COMPLETION_LEVEL = "partial"
 
+# Page size for GET /entries when no limit is given, and the largest accepted.
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+# Most entries accepted by one POST /entries/bulk.
+MAX_BULK_ENTRIES = 1000
+
+ENTRY_ROWS = RowMapper(JournalEntry)
+
+# Ownership check, entry upsert, goal XP update and the joined re-select in one
+# round trip; see upsert_journal_entry in database/create_schema.sql.
+UPSERT_ENTRY = register("journal_upsert_entry", """
+    SELECT
+        id, goal_id, habit_id, habit_name, goal_text, entry_date, reflection,
+        completion_level, xp_delta, created_at, updated_at, goal_xp, created
+    FROM upsert_journal_entry(%s, %s, %s, %s, %s, %s)
+""")
+
 
 def _parse_date(value):
     if isinstance(value, date_cls):
@@ -36,25 +57,13 @@ def _normalize_completion_level(value):
     return level
 
 
-def _entry_payload(row):
-    return {
-        "id": row[0],
-        "goal_id": row[1],
-        "habit_id": row[2],
-        "habit_name": row[3],
-        "goal_text": row[4],
-        "entry_date": row[5].isoformat() if row[5] else None,
-        "reflection": row[6],
-        "completion_level": row[7],
-        "xp_delta": row[8],
-        "created_at": row[9].isoformat() if row[9] else None,
-        "updated_at": row[10].isoformat() if row[10] else None,
-        "goal_xp": row[11],
-    }
-
-
 @journal_blueprint.route("/entries", methods=["GET"])
 def list_entries():
+    """
+    Newest entries first, one page at a time (?limit=, default 100, max 500).
+    When more rows exist the response carries an X-Next-Cursor header; pass it
+    back as ?cursor= to fetch the following page.
+    """
     user, error = ensure_auth()
     if error:
         return error
@@ -63,6 +72,7 @@ def list_entries():
     start_date = _parse_date(request.args.get("from"))
     end_date = _parse_date(request.args.get("to"))
     limit = request.args.get("limit")
+    cursor = request.args.get("cursor")
 
     params = [user["id"]]
     where_clauses = ["je.user_id = %s"]
@@ -83,12 +93,32 @@ def list_entries():
         where_clauses.append("je.entry_date <= %s")
         params.append(end_date)
 
+    if cursor:
+        try:
+            after_date, after_id = cursors.decode(cursor, 2)
+            after_date = _parse_date(after_date)
+            after_id = int(after_id)
+        except (TypeError, ValueError):
+            return jsonify({"error": "cursor is invalid"}), 400
+        if after_date is None:
+            return jsonify({"error": "cursor is invalid"}), 400
+        # Seek past the last row of the previous page; matches the index order.
+        where_clauses.append("(je.entry_date, je.id) < (%s, %s)")
+        params.extend([after_date, after_id])
+
+    page_size = DEFAULT_PAGE_SIZE
+    if limit:
+        try:
+            page_size = max(1, min(MAX_PAGE_SIZE, int(limit)))
+        except (TypeError, ValueError):
+            return jsonify({"error": "limit must be an integer"}), 400
+
     sql = """
         SELECT
             je.id,
             je.goal_id,
             g.habit_id,
-            h.name,
+            h.name AS habit_name,
             g.goal_text,
             je.entry_date,
             je.reflection,
@@ -96,30 +126,28 @@ def list_entries():
             je.xp_delta,
             je.created_at,
             je.updated_at,
-            g.xp
+            g.xp AS goal_xp
         FROM journal_entries je
         JOIN goals g ON g.id = je.goal_id
         JOIN habits h ON h.id = g.habit_id
         WHERE {where}
         ORDER BY je.entry_date DESC, je.id DESC
+        LIMIT %s
     """.format(where=" AND ".join(where_clauses))
-
-    if limit:
-        try:
-            limit_value = max(1, min(500, int(limit)))
-            sql += " LIMIT %s"
-            params.append(limit_value)
-        except (TypeError, ValueError):
-            return jsonify({"error": "limit must be an integer"}), 400
+    # One extra row tells us whether another page exists.
+    params.append(page_size + 1)
 
     conn = db_pool.getconn()
     try:
         with conn.cursor() as cur:
             cur.execute(sql, params)
-            rows = cur.fetchall()
+            entries = ENTRY_ROWS.all(cur)
 
-        entries = [_entry_payload(r) for r in rows]
-        return jsonify(entries)
+        resp = jsonify(entries[:page_size])
+        if len(entries) > page_size:
+            last = entries[page_size - 1]
+            resp.headers["X-Next-Cursor"] = cursors.encode(last.entry_date.isoformat(), last.id)
+        return resp
     finally:
         db_pool.putconn(conn)
 
@@ -161,108 +189,197 @@ def upsert_entry():
     try:
         with conn:
             with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT id, user_id
-                    FROM goals
-                    WHERE id = %s
-                    """,
-                    (goal_id,),
+                UPSERT_ENTRY.execute(
+                    cur,
+                    (user["id"], goal_id, entry_date, reflection, xp_delta, completion_level),
                 )
-                goal_row = cur.fetchone()
-                if not goal_row or goal_row[1] != user["id"]:
+                build_entry = ENTRY_ROWS.build(cur)
+                row = cur.fetchone()
+                if not row:
                     return jsonify({"error": "Goal not found"}), 404
 
-                cur.execute(
-                    """
-                    SELECT id, xp_delta
-                    FROM journal_entries
-                    WHERE user_id = %s AND goal_id = %s AND entry_date = %s
-                    FOR UPDATE
-                    """,
-                    (user["id"], goal_id, entry_date),
-                )
-                existing = cur.fetchone()
-
-                xp_diff = xp_delta
-                entry_id = None
-                created = existing is None
-
-                if existing:
-                    entry_id = existing[0]
-                    previous_xp = existing[1] or 0
-                    xp_diff = xp_delta - previous_xp
-                    cur.execute(
-                        """
-                        UPDATE journal_entries
-                        SET reflection = %s,
-                            xp_delta = %s,
-                            completion_level = %s,
-                            updated_at = now()
-                        WHERE id = %s
-                        """,
-                        (reflection, xp_delta, completion_level, entry_id),
-                    )
-                else:
-                    cur.execute(
-                        """
-                        INSERT INTO journal_entries (user_id, goal_id, entry_date, reflection, xp_delta, completion_level)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        RETURNING id
-                        """,
-                        (user["id"], goal_id, entry_date, reflection, xp_delta, completion_level),
-                    )
-                    entry_id = cur.fetchone()[0]
-
-                cur.execute(
-                    """
-                    UPDATE goals
-                    SET xp = GREATEST(0, xp + %s)
-                    WHERE id = %s AND user_id = %s
-                    RETURNING xp, habit_id, goal_text
-                    """,
-                    (xp_diff, goal_id, user["id"]),
-                )
-                goal_update = cur.fetchone()
-                if not goal_update:
-                    conn.rollback()
-                    return jsonify({"error": "Failed to update goal XP"}), 500
-
-                cur.execute(
-                    """
-                    SELECT
-                        je.id,
-                        je.goal_id,
-                        g.habit_id,
-                        h.name,
-                        g.goal_text,
-                        je.entry_date,
-                        je.reflection,
-                        je.completion_level,
-                        je.xp_delta,
-                        je.created_at,
-                        je.updated_at,
-                        g.xp
-                    FROM journal_entries je
-                    JOIN goals g ON g.id = je.goal_id
-                    JOIN habits h ON h.id = g.habit_id
-                    WHERE je.id = %s
-                    """,
-                    (entry_id,),
-                )
-                entry_row = cur.fetchone()
-
-        payload = _entry_payload(entry_row) if entry_row else None
+        entry = build_entry(row)
+        created = row[-1]
+        profiles.invalidate(user["id"])
         status_code = 201 if created else 200
         response_body = {
-            "entry": payload,
+            "entry": entry,
             "goal": {
                 "id": goal_id,
-                "habit_id": goal_update[1],
-                "goal_text": goal_update[2],
-                "xp": goal_update[0],
+                "habit_id": entry.habit_id,
+                "goal_text": entry.goal_text,
+                "xp": entry.goal_xp,
             },
         }
         return jsonify(response_body), status_code
     finally:
         db_pool.putconn(conn)
+
+
+# Goals are locked in id order so concurrent bulk writes cannot deadlock; single
+# upserts lock one goal the same way (upsert_journal_entry).
+LOCK_OWNED_GOALS = register("journal_lock_owned_goals", """
+    SELECT id
+    FROM goals
+    WHERE user_id = %s AND id = ANY(%s)
+    ORDER BY id
+    FOR UPDATE
+""")
+
+# Runs after LOCK_OWNED_GOALS, so `previous` reads the current rows. One row per entry.
+BULK_UPSERT_SQL = """
+    WITH incoming (user_id, goal_id, entry_date, reflection, xp_delta, completion_level) AS (
+        VALUES %s
+    ),
+    previous AS (
+        SELECT i.goal_id, i.entry_date, je.xp_delta
+        FROM incoming i
+        JOIN journal_entries je
+          ON je.user_id = i.user_id AND je.goal_id = i.goal_id AND je.entry_date = i.entry_date
+    ),
+    upserted AS (
+        INSERT INTO journal_entries AS je (user_id, goal_id, entry_date, reflection, xp_delta, completion_level)
+        SELECT user_id, goal_id, entry_date, reflection, xp_delta, completion_level
+        FROM incoming
+        ON CONFLICT (user_id, goal_id, entry_date) DO UPDATE
+        SET reflection = EXCLUDED.reflection,
+            xp_delta = EXCLUDED.xp_delta,
+            completion_level = EXCLUDED.completion_level,
+            updated_at = now()
+        RETURNING je.id, je.goal_id, je.entry_date, je.xp_delta
+    ),
+    diffs AS (
+        SELECT u.goal_id, SUM(u.xp_delta - COALESCE(p.xp_delta, 0)) AS xp_diff
+        FROM upserted u
+        LEFT JOIN previous p USING (goal_id, entry_date)
+        GROUP BY u.goal_id
+    ),
+    goal_updates AS (
+        UPDATE goals g
+        SET xp = GREATEST(0, g.xp + d.xp_diff)
+        FROM diffs d
+        WHERE g.id = d.goal_id
+        RETURNING g.id, g.xp
+    )
+    SELECT u.id, u.goal_id, u.entry_date, p.goal_id IS NULL AS created, gu.xp AS goal_xp
+    FROM upserted u
+    LEFT JOIN previous p USING (goal_id, entry_date)
+    JOIN goal_updates gu ON gu.id = u.goal_id
+"""
+BULK_UPSERT_TEMPLATE = "(%s::bigint, %s::bigint, %s::date, %s, %s::integer, %s)"
+
+
+def _parse_bulk_item(item):
+    """Return ((goal_id, entry_date, reflection, completion_level), error)."""
+    if not isinstance(item, dict):
+        return None, "entry must be an object"
+
+    goal_id = item.get("goal_id")
+    if goal_id is None:
+        return None, "goal_id is required"
+    try:
+        goal_id = int(goal_id)
+    except (TypeError, ValueError):
+        return None, "goal_id must be an integer"
+
+    entry_date = _parse_date(item.get("entry_date"))
+    if not entry_date:
+        return None, "entry_date must be provided in YYYY-MM-DD format"
+
+    completion_level = _normalize_completion_level(item.get("completion_level"))
+    if completion_level is None:
+        return None, "completion_level must be one of " + ", ".join(sorted(COMPLETION_TO_XP.keys()))
+
+    reflection = (item.get("reflection") or "").strip()
+    return (goal_id, entry_date, reflection, completion_level), None
+
+
+@journal_blueprint.route("/entries/bulk", methods=["POST"])
+def bulk_upsert_entries():
+    """
+    Replay many entries in one request (e.g. after a client was offline).
+    Body: { "entries": [ { goal_id, entry_date, reflection?, completion_level? }, ... ] }
+
+    Items are applied like POST /entries; when the same goal and date appear
+    more than once the last one wins. Invalid items or goals the user does not
+    own are reported per index in `results` without rejecting the rest.
+    """
+    user, error = ensure_auth()
+    if error:
+        return error
+
+    data = request.get_json(silent=True) or {}
+    items = data.get("entries")
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "entries must be a non-empty list"}), 400
+    if len(items) > MAX_BULK_ENTRIES:
+        return jsonify({"error": f"At most {MAX_BULK_ENTRIES} entries per request"}), 400
+
+    results = [None] * len(items)
+    latest = {}  # (goal_id, entry_date) -> (index, parsed item)
+    for index, item in enumerate(items):
+        parsed, item_error = _parse_bulk_item(item)
+        if item_error:
+            results[index] = {"index": index, "status": "error", "error": item_error}
+            continue
+        key = parsed[:2]
+        if key in latest:
+            superseded = latest[key][0]
+            results[superseded] = {"index": superseded, "status": "superseded", "by": index}
+        latest[key] = (index, parsed)
+
+    goals = {}
+    if latest:
+        conn = db_pool.getconn()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    requested_goals = sorted({goal_id for goal_id, _ in latest})
+                    LOCK_OWNED_GOALS.execute(cur, (user["id"], requested_goals))
+                    owned = {row[0] for row in cur.fetchall()}
+
+                    rows = []
+                    positions = {}
+                    for key, (index, (goal_id, entry_date, reflection, completion_level)) in latest.items():
+                        if goal_id not in owned:
+                            results[index] = {"index": index, "status": "error", "error": "Goal not found"}
+                            continue
+                        positions[key] = index
+                        rows.append(
+                            (user["id"], goal_id, entry_date, reflection, COMPLETION_TO_XP[completion_level], completion_level)
+                        )
+
+                    if rows:
+                        written = execute_values(
+                            cur,
+                            BULK_UPSERT_SQL,
+                            rows,
+                            template=BULK_UPSERT_TEMPLATE,
+                            page_size=len(rows),
+                            fetch=True,
+                        )
+                        for entry_id, goal_id, entry_date, created, goal_xp in written:
+                            index = positions[(goal_id, entry_date)]
+                            results[index] = {
+                                "index": index,
+                                "status": "created" if created else "updated",
+                                "entry_id": entry_id,
+                            }
+                            goals[goal_id] = goal_xp
+        finally:
+            db_pool.putconn(conn)
+
+        if goals:
+            profiles.invalidate(user["id"])
+
+    counts = {"created": 0, "updated": 0, "superseded": 0, "failed": 0}
+    for result in results:
+        counts["failed" if result["status"] == "error" else result["status"]] += 1
+
+    return jsonify(
+        {
+            "results": results,
+            "goals": [{"id": goal_id, "xp": xp} for goal_id, xp in sorted(goals.items())],
+            **counts,
+        }
+    ), 200
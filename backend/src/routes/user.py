@@ -1,41 +1,92 @@
-from flask import request, jsonify, Blueprint, session
+from flask import request, jsonify, Blueprint
+from tools import cursors, profiles
 from tools.auth_helper import ensure_auth
 from tools.database import db_pool 
+from tools.records import RowMapper, UserSearchResult
 
 user_blueprint = Blueprint("user", __name__, url_prefix="/api/user")
 
+# Results per GET /search page when no limit is given, and the most accepted.
+DEFAULT_SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 50
+# Longest accepted query, and the shortest that also gets fuzzy (trigram) matches.
+MAX_SEARCH_QUERY = 100
+MIN_FUZZY_QUERY = 3
+# Candidates taken from each index per request; bounds the work (and how deep
+# pagination can go) however common the query is.
+SEARCH_CANDIDATES = 500
+# Sort key below every real result; the first page seeks from here.
+SEARCH_START = (-1, 0.0, 0)
+
+SEARCH_ROWS = RowMapper(UserSearchResult)
+
+# Prefix matches come first (range scans on idx_users_lower_name_id / idx_users_lower_email),
+# then fuzzy ones (pg_trgm's % operator with its default 0.3 similarity threshold);
+# each group is ordered by trigram similarity to the query. Each candidate list is
+# taken in a total order (ties broken by id), so every page of a query ranks the
+# same candidates. Not registered: psycopg2 needs % doubled, which prepared statements
+# would not undo. {fuzzy} is FUZZY_CANDIDATES or empty.
+SEARCH_USERS = """
+    WITH candidate (id, tier) AS (
+        (SELECT id, 0 FROM users
+         WHERE lower(name) LIKE %(prefix)s
+         ORDER BY lower(name) USING ~<~, id
+         LIMIT %(candidates)s)
+        UNION ALL
+        (SELECT id, 0 FROM users
+         WHERE lower(email) LIKE %(prefix)s
+         ORDER BY lower(email) USING ~<~
+         LIMIT %(candidates)s)
+        {fuzzy}
+    ),
+    scored AS (
+        SELECT
+            u.id,
+            u.name,
+            u.bio,
+            min(c.tier) AS tier,
+            GREATEST(similarity(lower(u.name), %(q)s), similarity(lower(u.email), %(q)s))::float8 AS score
+        FROM candidate c
+        JOIN users u ON u.id = c.id
+        WHERE u.id <> %(user_id)s
+        GROUP BY u.id
+    )
+    SELECT id, name, bio, CASE tier WHEN 0 THEN 'prefix' ELSE 'fuzzy' END AS match, score
+    FROM scored
+    WHERE (tier, -score, id) > (%(after_tier)s, %(after_score)s, %(after_id)s)
+    ORDER BY tier, score DESC, id
+    LIMIT %(limit)s
+"""
+# The closest matches first (KNN scans on idx_users_name_trgm / idx_users_email_trgm).
+FUZZY_CANDIDATES = """
+        UNION ALL
+        (SELECT id, 1 FROM users
+         WHERE lower(name) %% %(q)s
+         ORDER BY lower(name) <-> %(q)s, id
+         LIMIT %(candidates)s)
+        UNION ALL
+        (SELECT id, 1 FROM users
+         WHERE lower(email) %% %(q)s
+         ORDER BY lower(email) <-> %(q)s, id
+         LIMIT %(candidates)s)
+"""
+
+
+def _like_prefix(text):
+    """LIKE pattern matching strings that start with text."""
+    escaped = text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return escaped + "%"
+
 @user_blueprint.route("/me", methods=["GET"])
 def get_user():
     user, error = ensure_auth()
     if error:
         return error
-    
-    conn = db_pool.getconn()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT id, oauth_id, email, name, bio, level, streak, created_at, onboarding_complete, theme_preference
-                FROM users
-                WHERE id = %s
-            """, (user["id"],))
-            row = cur.fetchone()
-            if not row:
-                return jsonify({"error": "User not found"}), 404
-            user = {
-                "id": row[0],
-                "oauth_id": row[1],
-                "email": row[2],
-                "name": row[3],
-                "bio": row[4],
-                "level": row[5],
-                "streak": row[6],
-                "created_at": row[7].isoformat() if row[7] else None,
-                "onboarding_complete": row[8],
-                "theme_preference": row[9],
-            }
-            return jsonify(user)
-    finally:
-        db_pool.putconn(conn)
+
+    profile = profiles.get(user["id"])
+    if not profile:
+        return jsonify({"error": "User not found"}), 404
+    return jsonify(profile)
 
 @user_blueprint.route("/me", methods=["PATCH"])
 def update_user():
@@ -88,32 +139,76 @@ def update_user():
                     """,
                     params,
                 )
-                row = cur.fetchone()
-                if not row:
+                updated_user = profiles.PROFILE_ROWS.one(cur)
+                if not updated_user:
                     return jsonify({"error":"User not found"}), 404
-                updated_user = {
-                    "id": row[0],
-                    "oauth_id": row[1],
-                    "email": row[2],
-                    "name": row[3],
-                    "bio": row[4],
-                    "level": row[5],
-                    "streak": row[6],
-                    "created_at": row[7].isoformat() if row[7] else None,
-                    "onboarding_complete": row[8],
-                    "theme_preference": row[9],
-                }
-                # Keep session in sync so subsequent /auth/me reflects changes
-                if "user" in session:
-                    session["user"] = {
-                        **session["user"],
-                        **{
-                            "name": updated_user["name"],
-                            "bio": updated_user["bio"],
-                            "onboarding_complete": updated_user["onboarding_complete"],
-                            "theme_preference": updated_user["theme_preference"],
-                        },
-                    }
-                return jsonify(updated_user)
     finally:
         db_pool.putconn(conn)
+
+    # Every session of this user reads the profile from the cache, so refreshing it here
+    # is what makes /auth/me reflect the change (other workers within PROFILE_CACHE_TTL).
+    profiles.put(updated_user)
+    return jsonify(updated_user)
+
+
+@user_blueprint.route("/search", methods=["GET"])
+def search_users():
+    """
+    Find users by name or email (?q=, ?limit= default 20, max 50): prefix matches
+    first, then fuzzy ones for queries of 3+ characters. Emails are matched but
+    never returned. Pages continue with the X-Next-Cursor header as ?cursor=.
+    """
+    user, error = ensure_auth()
+    if error:
+        return error
+
+    q = " ".join((request.args.get("q") or "").split()).lower()
+    if not q:
+        return jsonify({"error": "q is required"}), 400
+    if len(q) > MAX_SEARCH_QUERY:
+        return jsonify({"error": f"q must be at most {MAX_SEARCH_QUERY} characters"}), 400
+
+    after_tier, after_score, after_id = SEARCH_START
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            after_tier, after_score, after_id = cursors.decode(cursor, 3)
+            after_tier, after_score, after_id = int(after_tier), float(after_score), int(after_id)
+        except (TypeError, ValueError):
+            return jsonify({"error": "cursor is invalid"}), 400
+
+    page_size = DEFAULT_SEARCH_PAGE_SIZE
+    limit = request.args.get("limit")
+    if limit:
+        try:
+            page_size = max(1, min(MAX_SEARCH_PAGE_SIZE, int(limit)))
+        except (TypeError, ValueError):
+            return jsonify({"error": "limit must be an integer"}), 400
+
+    sql = SEARCH_USERS.format(fuzzy=FUZZY_CANDIDATES if len(q) >= MIN_FUZZY_QUERY else "")
+    conn = db_pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            # One extra row tells us whether another page exists.
+            cur.execute(
+                sql,
+                {
+                    "q": q,
+                    "prefix": _like_prefix(q),
+                    "candidates": SEARCH_CANDIDATES,
+                    "user_id": user["id"],
+                    "after_tier": after_tier,
+                    "after_score": -after_score,
+                    "after_id": after_id,
+                    "limit": page_size + 1,
+                },
+            )
+            results = SEARCH_ROWS.all(cur)
+    finally:
+        db_pool.putconn(conn)
+
+    resp = jsonify(results[:page_size])
+    if len(results) > page_size:
+        last = results[page_size - 1]
+        resp.headers["X-Next-Cursor"] = cursors.encode(int(last.match == "fuzzy"), last.score, last.id)
+    return resp
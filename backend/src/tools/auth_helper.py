@@ -1,6 +1,7 @@
 from flask import session, current_app, jsonify
-from google.oauth2 import id_token
-from google.auth.transport import requests as grequests
+from google.auth import jwt
+
+from tools import google_certs
 
 # -----------------------------
 # Helpers
@@ -8,10 +9,16 @@ from google.auth.transport import requests as grequests
 def verify_google_id_token(id_token_str: str):
     """
     Verifies a Google ID token and returns its claims dict if valid, else raises.
+    Signing certs come from the process-wide cache in tools/google_certs.py.
     """
-    claims = id_token.verify_oauth2_token(
+    certs = google_certs.cert_cache.get()
+    if jwt.decode_header(id_token_str).get("kid") not in certs:
+        # Google rotated its keys before our cached copy expired.
+        certs = google_certs.cert_cache.get(force=True)
+
+    claims = jwt.decode(
         id_token_str,
-        grequests.Request(),
+        certs=certs,
         audience=current_app.config["GOOGLE_OAUTH_CLIENT_ID"],  # verifies aud
     )
     # Optional additional checks:
@@ -20,10 +27,11 @@ def verify_google_id_token(id_token_str: str):
     return claims
 
 def session_user():
-    """Return user info from session if present."""
-    if "user" in session:
-        return session["user"]
-    return None
+    """Return {"id", "picture"} for the logged-in user, or None; profiles come from tools/profiles.py."""
+    user_id = session.get("user_id")
+    if user_id is None:
+        return None
+    return {"id": user_id, "picture": session.get("picture")}
 
 
 def ensure_auth():
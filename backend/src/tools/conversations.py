@@ -0,0 +1,117 @@
+import os
+import sys
+import zlib
+from array import array
+
+# -----------------------------
+# Server-side AI conversation context
+# -----------------------------
+# Ollama's `context` is a list of token ids that the next turn must send back.
+# Instead of round-tripping it through clients as JSON, it is stored per
+# conversation as packed little-endian int32s, zlib-compressed when that is smaller.
+
+# Conversations untouched for this long are expired.
+AI_CONVERSATION_TTL = int(os.getenv("AI_CONVERSATION_TTL", str(24 * 3600)))
+# Stored context bytes kept per user; least recently used conversations are evicted beyond this.
+AI_CONTEXT_BYTES_PER_USER = int(os.getenv("AI_CONTEXT_BYTES_PER_USER", str(4 * 1024 * 1024)))
+# Packed contexts smaller than this are stored uncompressed.
+AI_CONTEXT_COMPRESS_MIN = int(os.getenv("AI_CONTEXT_COMPRESS_MIN", "1024"))
+
+_RAW = 0
+_ZLIB = 1
+
+
+def pack(tokens):
+    """Encode token ids as a 1-byte format tag followed by int32 data; raises ValueError on bad tokens."""
+    try:
+        packed = array("i", tokens)
+    except (TypeError, OverflowError) as exc:
+        raise ValueError("context must be a list of 32-bit integers") from exc
+    if sys.byteorder == "big":
+        packed.byteswap()
+    raw = packed.tobytes()
+    if len(raw) >= AI_CONTEXT_COMPRESS_MIN:
+        compressed = zlib.compress(raw, 1)
+        if len(compressed) < len(raw):
+            return bytes([_ZLIB]) + compressed
+    return bytes([_RAW]) + raw
+
+
+def unpack(blob):
+    blob = bytes(blob)
+    if not blob:
+        return []
+    body = blob[1:]
+    if blob[0] == _ZLIB:
+        body = zlib.decompress(body)
+    tokens = array("i")
+    tokens.frombytes(body)
+    if sys.byteorder == "big":
+        tokens.byteswap()
+    return tokens.tolist()
+
+
+def create(cur, user_id):
+    """Start an empty conversation and return its id."""
+    cur.execute(
+        """
+        INSERT INTO ai_conversations (user_id, context, token_count)
+        VALUES (%s, %s, 0)
+        RETURNING id
+        """,
+        (user_id, pack([])),
+    )
+    return cur.fetchone()[0]
+
+
+def load(cur, conversation_id, user_id):
+    """Return the stored tokens, or None if the conversation is missing, expired or not the user's."""
+    cur.execute(
+        """
+        SELECT context
+        FROM ai_conversations
+        WHERE id = %s AND user_id = %s
+          AND updated_at >= now() - make_interval(secs => %s)
+        """,
+        (conversation_id, user_id, AI_CONVERSATION_TTL),
+    )
+    row = cur.fetchone()
+    return unpack(row[0]) if row else None
+
+
+def save(cur, conversation_id, user_id, tokens):
+    """Store the latest context and evict expired or over-budget conversations for the user."""
+    cur.execute(
+        """
+        UPDATE ai_conversations
+        SET context = %s, token_count = %s, updated_at = now()
+        WHERE id = %s AND user_id = %s
+        """,
+        (pack(tokens or []), len(tokens or []), conversation_id, user_id),
+    )
+    cur.execute(
+        """
+        DELETE FROM ai_conversations c
+        USING (
+            SELECT id, SUM(octet_length(context)) OVER (ORDER BY updated_at DESC, id DESC) AS running_bytes
+            FROM ai_conversations
+            WHERE user_id = %s
+        ) budget
+        WHERE c.id = budget.id
+          AND c.id <> %s
+          AND budget.running_bytes > %s
+        """,
+        (user_id, conversation_id, AI_CONTEXT_BYTES_PER_USER),
+    )
+    cur.execute(
+        "DELETE FROM ai_conversations WHERE updated_at < now() - make_interval(secs => %s)",
+        (AI_CONVERSATION_TTL,),
+    )
+
+
+def delete(cur, conversation_id, user_id):
+    cur.execute(
+        "DELETE FROM ai_conversations WHERE id = %s AND user_id = %s RETURNING id",
+        (conversation_id, user_id),
+    )
+    return cur.fetchone() is not None
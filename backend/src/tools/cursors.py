@@ -0,0 +1,26 @@
+import base64
+import json
+
+# -----------------------------
+# Opaque keyset cursors
+# -----------------------------
+# A cursor is the sort key of the last row a client has seen, encoded so
+# clients treat it as a token. Pages then continue with a
+# `WHERE (sort columns) < (cursor values)` seek instead of OFFSET.
+
+
+def encode(*values):
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode(token, arity):
+    """Return the `arity` values packed by encode(); raises ValueError for anything malformed."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (TypeError, ValueError, UnicodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if not isinstance(values, list) or len(values) != arity:
+        raise ValueError("Invalid cursor")
+    return values
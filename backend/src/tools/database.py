@@ -1,8 +1,11 @@
 import os
+import threading
+import time
 from pathlib import Path
 
+import psycopg2
 from dotenv import load_dotenv
-from psycopg2 import pool
+from psycopg2 import extensions, pool
 
 # Load database credentials from env (allows per-machine secrets via .env/.env.local)
 ENV_ROOT = Path(__file__).resolve().parents[2]
@@ -16,18 +19,277 @@ DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_MIN_CONN = int(os.getenv("DB_MIN_CONN", "1"))
 DB_MAX_CONN = int(os.getenv("DB_MAX_CONN", "10"))
+# Seconds getconn() waits for a free connection before raising PoolError
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Seconds after which a connection is closed and replaced, regardless of health
+DB_CONN_MAX_LIFETIME = float(os.getenv("DB_CONN_MAX_LIFETIME", "1800"))
+# Idle connections older than this many seconds are pinged before reuse
+DB_CONN_CHECK_AFTER = float(os.getenv("DB_CONN_CHECK_AFTER", "30"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
 
 if not DB_USER or not DB_PASSWORD:
     raise RuntimeError("Database credentials missing. Set DB_USER and DB_PASSWORD in your env.")
 
-db_pool = pool.SimpleConnectionPool(
+
+class PooledConnection(extensions.connection):
+    """psycopg2 connection that remembers its age and which statements it has prepared."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created_at = time.monotonic()
+        self.returned_at = self.created_at
+        # Names of server-side prepared statements (see tools/statements.py)
+        self.prepared_statements = set()
+
+
+class ConnectionPool:
+    """
+    Thread-safe, fork-aware replacement for psycopg2's SimpleConnectionPool.
+
+    getconn() blocks for up to `timeout` seconds when every connection is checked
+    out, pings connections that sat idle for `check_after` seconds, and replaces
+    connections that are broken or older than `max_lifetime`. After a fork the
+    child starts with an empty pool and never touches the parent's sockets.
+
+    No connections are opened at construction, so importing this module in a
+    preforking server's master is safe; each worker calls prefill() after fork.
+    """
+
+    def __init__(self, minconn, maxconn, timeout, max_lifetime, check_after, **connect_kwargs):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("invalid pool bounds: need 0 <= minconn <= maxconn and maxconn >= 1")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self._connect_kwargs = connect_kwargs
+        # Connections inherited across fork(); referenced forever so their
+        # finalizers never send a terminate message on the parent's socket.
+        self._orphans = []
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self._idle = []
+        self._in_use = set()
+        self._size = 0
+        self._waiters = 0
+        self._closed = False
+        self._acquired = 0
+        self._waited = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._broken = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _check_pid(self):
+        if os.getpid() == self._pid:
+            return
+        # Forked: the inherited lock may be held by a thread that no longer exists,
+        # so rebuild state without acquiring it.
+        self._orphans.extend(self._idle)
+        self._orphans.extend(self._in_use)
+        self._reset()
+
+    def prefill(self):
+        """Open connections until `minconn` exist in this process."""
+        self._check_pid()
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.minconn:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append(conn)
+                self._cond.notify()
+
+    def _connect(self):
+        return psycopg2.connect(connection_factory=PooledConnection, **self._connect_kwargs)
+
+    def _expired(self, conn, now):
+        return self.max_lifetime > 0 and now - conn.created_at > self.max_lifetime
+
+    def _check_idle(self, conn):
+        """Return None if an idle connection can be handed out, else why it cannot."""
+        if conn.closed:
+            return "broken"
+        now = time.monotonic()
+        if self._expired(conn, now):
+            return "recycled"
+        if now - conn.returned_at < self.check_after:
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+        except psycopg2.Error:
+            return "broken"
+        return None
+
+    def _discard(self, conn, reason=None):
+        try:
+            if not conn.closed:
+                conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            if reason == "broken":
+                self._broken += 1
+            elif reason == "recycled":
+                self._recycled += 1
+            self._in_use.discard(conn)
+            self._size -= 1
+            self._cond.notify()
+
+    def getconn(self, timeout=None):
+        """Borrow a live connection, waiting up to `timeout` seconds (pool default if None)."""
+        self._check_pid()
+        wait_limit = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + wait_limit
+        waited = False
+
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise pool.PoolError("connection pool is closed")
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise pool.PoolError(
+                            f"connection pool exhausted (waited {wait_limit:.1f}s for one of {self.maxconn})"
+                        )
+                    waited = True
+                    self._waiters += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiters -= 1
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    conn = None
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            else:
+                reason = self._check_idle(conn)
+                if reason:
+                    self._discard(conn, reason)
+                    continue
+            break
+
+        elapsed = time.monotonic() - started
+        with self._cond:
+            self._in_use.add(conn)
+            self._acquired += 1
+            if waited:
+                self._waited += 1
+                self._wait_total += elapsed
+                self._wait_max = max(self._wait_max, elapsed)
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a borrowed connection; open transactions are rolled back."""
+        self._check_pid()
+        with self._cond:
+            if conn not in self._in_use:
+                if any(conn is orphan for orphan in self._orphans):
+                    return
+                raise pool.PoolError("trying to put unkeyed connection")
+
+        reason = None
+        if conn.closed:
+            reason = "broken"
+        elif not close:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                reason = "broken"
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    reason = "broken"
+
+        now = time.monotonic()
+        if not close and not reason and self._expired(conn, now):
+            reason = "recycled"
+
+        if close or reason or self._closed:
+            self._discard(conn, reason)
+            return
+
+        conn.returned_at = now
+        with self._cond:
+            self._in_use.discard(conn)
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def closeall(self):
+        """Close idle connections and refuse new checkouts; borrowed ones close on return."""
+        self._check_pid()
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+    def stats(self):
+        """Snapshot of utilization counters for scraping."""
+        self._check_pid()
+        with self._cond:
+            return {
+                "pid": self._pid,
+                "max": self.maxconn,
+                "open": self._size,
+                "in_use": len(self._in_use),
+                "idle": len(self._idle),
+                "waiters": self._waiters,
+                "acquired_total": self._acquired,
+                "waited_total": self._waited,
+                "timeouts_total": self._timeouts,
+                "recycled_total": self._recycled,
+                "broken_total": self._broken,
+                "wait_seconds_total": round(self._wait_total, 6),
+                "wait_seconds_max": round(self._wait_max, 6),
+            }
+
+
+db_pool = ConnectionPool(
     minconn=DB_MIN_CONN,
     maxconn=DB_MAX_CONN,
+    timeout=DB_POOL_TIMEOUT,
+    max_lifetime=DB_CONN_MAX_LIFETIME,
+    check_after=DB_CONN_CHECK_AFTER,
     database=DB_NAME,
     host=DB_HOST,
     user=DB_USER,
     password=DB_PASSWORD,
     port=DB_PORT,
+    connect_timeout=DB_CONNECT_TIMEOUT,
 )
 
 if __name__ == "__main__":
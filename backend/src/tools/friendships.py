@@ -0,0 +1,113 @@
+import os
+import threading
+
+from cachetools import LRUCache
+
+from tools.database import db_pool
+from tools.notify import listener
+from tools.statements import register
+
+# -----------------------------
+# Per-process friend adjacency cache
+# -----------------------------
+# Friendship checks (friend habits, friend requests) are set lookups against each
+# user's friend ids, loaded with one query and kept in an LRU. A trigger on
+# friends NOTIFYs the "friendships" channel with the affected user ids on every
+# change, so every worker drops stale sets; routes also invalidate locally right
+# after committing so their own next request sees the change. While the listener
+# is disconnected the cache is bypassed.
+
+# Users whose friend sets are kept per process; 0 disables the cache.
+FRIEND_CACHE_SIZE = int(os.getenv("FRIEND_CACHE_SIZE", "10000"))
+
+CHANNEL = "friendships"
+
+FRIEND_IDS = register("friend_ids", """
+    SELECT user_id2 FROM friends WHERE user_id1 = %s
+    UNION ALL
+    SELECT user_id1 FROM friends WHERE user_id2 = %s
+""")
+
+_enabled = FRIEND_CACHE_SIZE > 0
+_cache = LRUCache(maxsize=max(FRIEND_CACHE_SIZE, 1))
+_lock = threading.Lock()
+# Bumped by every invalidation; a load that overlapped one is returned but not cached.
+_generation = 0
+_hits = 0
+_misses = 0
+
+
+def _load(user_id):
+    conn = db_pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            FRIEND_IDS.execute(cur, (user_id, user_id))
+            return frozenset(row[0] for row in cur.fetchall())
+    finally:
+        db_pool.putconn(conn)
+
+
+def friend_ids(user_id):
+    """Return the frozenset of the user's friends' ids."""
+    global _hits, _misses
+    if not _enabled:
+        return _load(user_id)
+
+    listener.ensure_started()
+    cacheable = listener.connected
+    with _lock:
+        if cacheable:
+            ids = _cache.get(user_id)
+            if ids is not None:
+                _hits += 1
+                return ids
+        _misses += 1
+        generation = _generation
+
+    ids = _load(user_id)
+    if cacheable:
+        with _lock:
+            if generation == _generation:
+                _cache[user_id] = ids
+    return ids
+
+
+def are_friends(user_id, other_id):
+    return other_id in friend_ids(user_id)
+
+
+def invalidate(*user_ids):
+    """Drop the cached sets of these users (after a committed friends change)."""
+    global _generation
+    with _lock:
+        _generation += 1
+        for user_id in user_ids:
+            _cache.pop(user_id, None)
+
+
+def clear():
+    global _generation
+    with _lock:
+        _generation += 1
+        _cache.clear()
+
+
+def _on_notify(payload):
+    # Payload is comma-separated user ids, "*" for large changes, None after a reconnect.
+    if payload is None or payload == "*":
+        clear()
+    else:
+        invalidate(*(int(user_id) for user_id in payload.split(",") if user_id))
+
+
+listener.subscribe(CHANNEL, _on_notify)
+
+
+def stats():
+    with _lock:
+        return {
+            "enabled": _enabled,
+            "size": len(_cache),
+            "hits_total": _hits,
+            "misses_total": _misses,
+        }
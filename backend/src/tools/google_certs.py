@@ -0,0 +1,171 @@
+import json
+import os
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# -----------------------------
+# Google signing certificates
+# -----------------------------
+# ID tokens are verified against Google's public certs ({kid: PEM}). They are
+# fetched once per process over a keep-alive session, kept for the response's
+# Cache-Control max-age and refreshed in the background shortly before expiry,
+# so logins normally never wait on Google.
+
+GOOGLE_CERTS_URL = os.getenv("GOOGLE_CERTS_URL", "https://www.googleapis.com/oauth2/v1/certs")
+# Offline key source: a JSON file of {kid: PEM} used instead of fetching (tests, benchmarks).
+GOOGLE_CERTS_FILE = os.getenv("GOOGLE_CERTS_FILE", "").strip()
+# Seconds before expiry at which a background refresh starts.
+GOOGLE_CERTS_REFRESH_AHEAD = float(os.getenv("GOOGLE_CERTS_REFRESH_AHEAD", "300"))
+# Used when Google's response has no usable max-age.
+GOOGLE_CERTS_DEFAULT_TTL = float(os.getenv("GOOGLE_CERTS_DEFAULT_TTL", "3600"))
+GOOGLE_CERTS_TIMEOUT = float(os.getenv("GOOGLE_CERTS_TIMEOUT", "5"))
+# Forced refreshes (token signed with an unknown kid) are skipped if the last fetch is newer than this.
+GOOGLE_CERTS_MIN_REFETCH = float(os.getenv("GOOGLE_CERTS_MIN_REFETCH", "60"))
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+def _max_age(cache_control):
+    match = _MAX_AGE.search(cache_control or "")
+    return float(match.group(1)) if match else None
+
+
+class HttpKeySource:
+    """Fetches certs from `url`; returns (certs, ttl_seconds)."""
+
+    def __init__(self, url=GOOGLE_CERTS_URL):
+        self.url = url
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+    def __call__(self):
+        resp = self.session.get(self.url, timeout=GOOGLE_CERTS_TIMEOUT)
+        resp.raise_for_status()
+        ttl = _max_age(resp.headers.get("Cache-Control"))
+        return resp.json(), GOOGLE_CERTS_DEFAULT_TTL if ttl is None else ttl
+
+
+class StaticKeySource:
+    """Fixed {kid: PEM} mapping that never expires."""
+
+    def __init__(self, certs):
+        self.certs = dict(certs)
+
+    def __call__(self):
+        return self.certs, None
+
+
+def file_key_source(path):
+    with open(path) as fh:
+        return StaticKeySource(json.load(fh))
+
+
+class CertCache:
+    """Process-wide cert cache; `source()` returns (certs, ttl seconds or None for no expiry)."""
+
+    def __init__(self, source):
+        self.source = source
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._certs = None
+        self._expires_at = 0.0
+        self._fetched_at = None
+        self._refreshing = False
+        self._pid = os.getpid()
+        self.fetches = 0
+        self.failures = 0
+
+    def _fork_check(self):
+        # A refresh thread does not survive fork; its lock and flag must not either.
+        if self._pid != os.getpid():
+            self._lock = threading.Lock()
+            self._fetch_lock = threading.Lock()
+            self._refreshing = False
+            self._pid = os.getpid()
+
+    def _fetch(self):
+        try:
+            certs, ttl = self.source()
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            raise
+        with self._lock:
+            self.fetches += 1
+            self._certs = certs
+            self._fetched_at = time.monotonic()
+            self._expires_at = float("inf") if ttl is None else time.monotonic() + ttl
+        return certs
+
+    def _refresh_in_background(self):
+        try:
+            self._fetch()
+        except Exception:
+            pass  # keep serving the current certs; the next call retries
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _usable(self, force, now):
+        """Current certs if they can be served without a synchronous fetch, else None."""
+        if self._certs is None or now >= self._expires_at:
+            return None
+        if force and now - self._fetched_at >= GOOGLE_CERTS_MIN_REFETCH:
+            return None
+        return self._certs
+
+    def get(self, force=False):
+        """Return {kid: PEM}; fetches synchronously only when missing, expired or forced."""
+        self._fork_check()
+        now = time.monotonic()
+        with self._lock:
+            certs, expires_at = self._usable(force, now), self._expires_at
+            start_refresh = (
+                certs is not None
+                and not force
+                and now < expires_at
+                and expires_at - now < GOOGLE_CERTS_REFRESH_AHEAD
+                and not self._refreshing
+            )
+            if start_refresh:
+                self._refreshing = True
+
+        if start_refresh:
+            threading.Thread(target=self._refresh_in_background, name="google-certs", daemon=True).start()
+        if certs is not None:
+            return certs
+
+        # One thread fetches; the others wait and reuse its result.
+        with self._fetch_lock:
+            with self._lock:
+                fetched_meanwhile = self._fetched_at is not None and self._fetched_at > now
+                certs = self._certs if fetched_meanwhile else None
+            return certs if certs is not None else self._fetch()
+
+    def stats(self):
+        with self._lock:
+            remaining = self._expires_at - time.monotonic() if self._certs is not None else None
+            return {
+                "keys": len(self._certs or ()),
+                "expires_in": None if remaining == float("inf") else remaining,
+                "fetches_total": self.fetches,
+                "failures_total": self.failures,
+            }
+
+
+def _default_source():
+    return file_key_source(GOOGLE_CERTS_FILE) if GOOGLE_CERTS_FILE else HttpKeySource()
+
+
+cert_cache = CertCache(_default_source())
+
+
+def use_key_source(source):
+    """Swap where certs come from (e.g. StaticKeySource for offline-signed tokens)."""
+    global cert_cache
+    cert_cache = CertCache(source)
+    return cert_cache
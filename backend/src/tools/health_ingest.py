@@ -0,0 +1,102 @@
+import io
+import os
+
+from psycopg2.extras import execute_values
+
+# -----------------------------
+# Bulk daily health ingestion
+# -----------------------------
+# Records are merged with one INSERT ... ON CONFLICT. Small batches are sent
+# inline with execute_values; larger ones (multi-year HealthKit backfills) are
+# streamed into a per-connection temp table with COPY first. Rows whose values
+# did not change are left alone, so re-uploads do not churn the table.
+
+# Batches of at least this many records go through COPY.
+HEALTH_COPY_THRESHOLD = int(os.getenv("HEALTH_COPY_THRESHOLD", "100"))
+
+_MERGE = """
+    WITH incoming AS (
+        {source}
+    ),
+    merged AS (
+        INSERT INTO user_health_metrics AS m (user_id, metric_date, steps, exercise_minutes, sleep_minutes, source)
+        SELECT user_id, metric_date, steps, exercise_minutes, sleep_minutes, source
+        FROM incoming
+        ON CONFLICT (user_id, metric_date) DO UPDATE
+        SET steps = EXCLUDED.steps,
+            exercise_minutes = EXCLUDED.exercise_minutes,
+            sleep_minutes = EXCLUDED.sleep_minutes,
+            source = EXCLUDED.source,
+            updated_at = now()
+        WHERE (m.steps, m.exercise_minutes, m.sleep_minutes, m.source)
+              IS DISTINCT FROM (EXCLUDED.steps, EXCLUDED.exercise_minutes, EXCLUDED.sleep_minutes, EXCLUDED.source)
+        RETURNING (xmax = 0) AS created
+    )
+    SELECT count(*) FILTER (WHERE created), count(*) FILTER (WHERE NOT created)
+    FROM merged
+"""
+
+_VALUES_SQL = _MERGE.format(
+    source="""
+        SELECT * FROM (VALUES %s)
+        AS v (user_id, metric_date, steps, exercise_minutes, sleep_minutes, source)
+    """
+)
+_VALUES_TEMPLATE = "(%s::bigint, %s::date, %s::integer, %s::integer, %s::integer, %s)"
+
+_COPY_SQL = _MERGE.format(source="SELECT * FROM health_import")
+
+
+def _dedupe(user_id, records):
+    """One row per date (the last one wins), as ON CONFLICT cannot touch a row twice."""
+    latest = {}
+    for metric_date, steps, exercise_minutes, sleep_minutes, source in records:
+        latest[metric_date] = (user_id, metric_date, steps, exercise_minutes, sleep_minutes, source)
+    return list(latest.values())
+
+
+def _copy_field(value):
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _copy_rows(cur, rows):
+    # Lives for the connection; ON COMMIT DELETE ROWS empties it after each request.
+    cur.execute(
+        """
+        CREATE TEMP TABLE IF NOT EXISTS health_import (
+            user_id BIGINT,
+            metric_date DATE,
+            steps INTEGER,
+            exercise_minutes INTEGER,
+            sleep_minutes INTEGER,
+            source TEXT
+        ) ON COMMIT DELETE ROWS
+        """
+    )
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_field(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cur.copy_expert(
+        "COPY health_import (user_id, metric_date, steps, exercise_minutes, sleep_minutes, source) FROM STDIN",
+        buffer,
+    )
+
+
+def merge_daily(cur, user_id, records):
+    """
+    Upsert (metric_date, steps, exercise_minutes, sleep_minutes, source) records for
+    the user inside the caller's transaction. Returns {"created", "changed", "unchanged"}
+    counted per distinct date.
+    """
+    rows = _dedupe(user_id, records)
+    if len(rows) >= HEALTH_COPY_THRESHOLD:
+        _copy_rows(cur, rows)
+        cur.execute(_COPY_SQL)
+        created, changed = cur.fetchone()
+    else:
+        created, changed = execute_values(
+            cur, _VALUES_SQL, rows, template=_VALUES_TEMPLATE, page_size=len(rows), fetch=True
+        )[0]
+    return {"created": created, "changed": changed, "unchanged": len(rows) - created - changed}
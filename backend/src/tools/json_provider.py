@@ -0,0 +1,64 @@
+import os
+from dataclasses import is_dataclass
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+# JSON_PROVIDER=orjson|stdlib picks the encoder; default is orjson when installed.
+JSON_PROVIDER = os.getenv("JSON_PROVIDER", "orjson" if orjson else "stdlib").strip().lower()
+
+
+def _orjson_default(obj):
+    # orjson handles dataclasses, date and datetime itself; match Flask for the rest.
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    """Encodes responses with orjson; datetimes and slotted records are serialized in C."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_orjson_default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=_orjson_default)
+        return self._app.response_class(body, mimetype="application/json")
+
+
+class IsoJSONProvider(DefaultJSONProvider):
+    """stdlib fallback that writes dates as ISO 8601 instead of Flask's HTTP-date format."""
+
+    sort_keys = False
+
+    @staticmethod
+    def default(obj):
+        if isinstance(obj, (date, datetime)):
+            return obj.isoformat()
+        if is_dataclass(obj) and not isinstance(obj, type):
+            return {name: getattr(obj, name) for name in obj.__dataclass_fields__}
+        return DefaultJSONProvider.default(obj)
+
+
+def install_json_provider(app):
+    """Attach the configured JSON provider to `app`."""
+    if JSON_PROVIDER == "orjson":
+        if orjson is None:
+            raise RuntimeError("JSON_PROVIDER=orjson but orjson is not installed")
+        app.json = OrjsonProvider(app)
+    elif JSON_PROVIDER == "stdlib":
+        app.json = IsoJSONProvider(app)
+    else:
+        raise RuntimeError(f"Unknown JSON_PROVIDER {JSON_PROVIDER!r}; use 'orjson' or 'stdlib'")
@@ -0,0 +1,160 @@
+import os
+import select
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions, sql
+
+from tools.database import DB_CONNECT_TIMEOUT, DB_HOST, DB_NAME, DB_PASSWORD, DB_PORT, DB_USER
+
+# -----------------------------
+# Postgres LISTEN/NOTIFY fan-out
+# -----------------------------
+# Each worker process keeps one dedicated connection (outside db_pool) that
+# LISTENs on the subscribed channels from a daemon thread and hands payloads to
+# the registered handlers. Notifications sent while the connection is down are
+# lost, so after every (re)connect each handler is called with None, meaning
+# "drop everything". Caches built on this should bypass themselves while
+# listener.connected is False.
+
+# Seconds between wakeups to pick up new subscriptions.
+NOTIFY_POLL_SECONDS = float(os.getenv("NOTIFY_POLL_SECONDS", "5"))
+# Backoff after a failed connect or a dropped connection.
+NOTIFY_RETRY_SECONDS = float(os.getenv("NOTIFY_RETRY_SECONDS", "2"))
+# TCP keepalive idle time on the LISTEN connection. With the pings on quiet polls,
+# a half-open connection (failover behind a NAT or proxy) fails within about twice
+# this, and the caches relying on it are bypassed and cleared on reconnect.
+NOTIFY_KEEPALIVE_SECONDS = int(os.getenv("NOTIFY_KEEPALIVE_SECONDS", "10"))
+
+
+class Listener:
+    def __init__(self):
+        self._handlers = {}
+        # Connections inherited across fork(); kept referenced so they are never closed on the parent's socket.
+        self._orphans = []
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._conn = None
+        self._listening = set()
+        self.connected = False
+        self.connects = 0
+        self.notifications = 0
+        self.failures = 0
+
+    def _fork_check(self):
+        # The listener thread does not survive fork, and its socket belongs to the parent.
+        if self._pid != os.getpid():
+            if self._conn is not None:
+                self._orphans.append(self._conn)
+            self._reset()
+
+    def subscribe(self, channel, handler):
+        """Call handler(payload) for each NOTIFY on channel, and handler(None) after reconnects."""
+        with self._lock:
+            self._handlers.setdefault(channel, []).append(handler)
+
+    def ensure_started(self):
+        """Start this process's listener thread if it is not running (cheap; call on every use)."""
+        self._fork_check()
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="pg-listener", daemon=True)
+                self._thread.start()
+
+    def _connect(self):
+        conn = psycopg2.connect(
+            dbname=DB_NAME,
+            host=DB_HOST,
+            port=DB_PORT,
+            user=DB_USER,
+            password=DB_PASSWORD,
+            connect_timeout=DB_CONNECT_TIMEOUT,
+            application_name="listener",
+            keepalives=1,
+            keepalives_idle=NOTIFY_KEEPALIVE_SECONDS,
+            keepalives_interval=max(1, NOTIFY_KEEPALIVE_SECONDS // 3),
+            keepalives_count=3,
+            # Also fail a ping the server never acknowledges, not just an idle socket.
+            tcp_user_timeout=NOTIFY_KEEPALIVE_SECONDS * 2000,
+        )
+        conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return conn
+
+    def _listen_new_channels(self):
+        with self._lock:
+            channels = [channel for channel in self._handlers if channel not in self._listening]
+        with self._conn.cursor() as cur:
+            for channel in channels:
+                cur.execute(sql.SQL("LISTEN {}").format(sql.Identifier(channel)))
+                self._listening.add(channel)
+        return channels
+
+    def _dispatch(self, channel, payload):
+        with self._lock:
+            handlers = list(self._handlers.get(channel, ()))
+        for handler in handlers:
+            try:
+                handler(payload)
+            except Exception:
+                pass  # one bad handler must not stop the listener
+
+    def _run(self):
+        pid = os.getpid()
+        while pid == os.getpid():
+            try:
+                self._conn = self._connect()
+                self._listening = set()
+                channels = self._listen_new_channels()
+                self.connected = True
+                self.connects += 1
+                # Anything sent before LISTEN took effect was missed.
+                for channel in channels:
+                    self._dispatch(channel, None)
+
+                while True:
+                    ready, _, _ = select.select([self._conn], [], [], NOTIFY_POLL_SECONDS)
+                    if ready:
+                        self._conn.poll()
+                    else:
+                        # A quiet connection may be half-open, which select() never reports;
+                        # the round trip (bounded by tcp_user_timeout) raises if it is.
+                        with self._conn.cursor() as cur:
+                            cur.execute("SELECT 1")
+                    # Notifications that arrived during the ping are queued here too.
+                    while self._conn.notifies:
+                        notify = self._conn.notifies.pop(0)
+                        self.notifications += 1
+                        self._dispatch(notify.channel, notify.payload)
+                    for channel in self._listen_new_channels():
+                        self._dispatch(channel, None)
+            except Exception:
+                self.failures += 1
+            finally:
+                self.connected = False
+                if self._conn is not None:
+                    try:
+                        self._conn.close()
+                    except Exception:
+                        pass
+                    self._conn = None
+            time.sleep(NOTIFY_RETRY_SECONDS)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "connected": self.connected,
+                "channels": sorted(self._handlers),
+                "connects_total": self.connects,
+                "notifications_total": self.notifications,
+                "failures_total": self.failures,
+            }
+
+
+listener = Listener()
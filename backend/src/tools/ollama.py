@@ -0,0 +1,232 @@
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_OLLAMA_URL = "http://localhost:11434"
+DEFAULT_OLLAMA_MODEL = "phi3:mini"
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "120"))
+# Model calls that may run at once in this process; they never use web server threads.
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "2"))
+# Calls allowed to wait for a free slot; anything beyond is refused immediately.
+AI_QUEUE_SIZE = int(os.getenv("AI_QUEUE_SIZE", "4"))
+# Seconds a waiting client's call may sit in the queue before it is refused.
+AI_QUEUE_TIMEOUT = float(os.getenv("AI_QUEUE_TIMEOUT", "15"))
+# Suggested client back-off (Retry-After header) when refused.
+AI_RETRY_AFTER = int(os.getenv("AI_RETRY_AFTER", "10"))
+
+
+class OllamaError(Exception):
+    """Ollama could not produce a usable response."""
+
+
+class OllamaBusy(OllamaError):
+    """Refused by admission control: too many generations in flight or queued."""
+
+
+def settings():
+    """
+    Return sanitized Ollama base URL and preferred model.
+    """
+    base_url = os.environ.get("OLLAMA_BASE_URL", DEFAULT_OLLAMA_URL).strip() or DEFAULT_OLLAMA_URL
+    model = os.environ.get("OLLAMA_MODEL", DEFAULT_OLLAMA_MODEL).strip() or DEFAULT_OLLAMA_MODEL
+    return base_url.rstrip("/"), model
+
+
+def build_request(model, prompt, system_prompt=None, context=None, stream=False):
+    body = {
+        "model": model,
+        "prompt": prompt,
+        "stream": stream,
+    }
+    if system_prompt:
+        body["system"] = system_prompt
+    if context:
+        body["context"] = context
+    return body
+
+
+def generate(base_url, body):
+    """POST /api/generate and return the decoded completion; raises OllamaError."""
+    try:
+        resp = _runner().session.post(f"{base_url}/api/generate", json=body, timeout=OLLAMA_TIMEOUT)
+        resp.raise_for_status()
+        data = resp.json()
+    except requests.exceptions.RequestException as exc:
+        raise OllamaError(f"Ollama request failed: {exc}") from exc
+    except ValueError as exc:
+        raise OllamaError("Invalid JSON received from Ollama") from exc
+
+    if not data.get("response"):
+        raise OllamaError("Ollama response missing 'response'")
+    return data
+
+
+def _read_stream(base_url, body, chunks, cancelled):
+    """Executor task: push each NDJSON chunk from Ollama onto `chunks`, then None."""
+    try:
+        with _runner().session.post(
+            f"{base_url}/api/generate", json=body, timeout=OLLAMA_TIMEOUT, stream=True
+        ) as resp:
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                if cancelled.is_set():
+                    return
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise OllamaError(f"Ollama error: {chunk['error']}")
+                chunks.put(chunk)
+        chunks.put(None)
+    except requests.exceptions.RequestException as exc:
+        chunks.put(OllamaError(f"Ollama request failed: {exc}"))
+    except ValueError:
+        chunks.put(OllamaError("Invalid JSON received from Ollama"))
+    except OllamaError as exc:
+        chunks.put(exc)
+
+
+def stream(base_url, body):
+    """
+    Yield Ollama's incremental chunks for a "stream": true request body.
+
+    The HTTP read loop runs on the AI executor; closing this generator (e.g. the
+    client disconnected) stops it at the next chunk. Raises OllamaError.
+    """
+    chunks = queue.Queue()
+    cancelled = threading.Event()
+    future = submit(_read_stream, base_url, body, chunks, cancelled, queue_timeout=AI_QUEUE_TIMEOUT)
+
+    def on_done(f):
+        # Admission failures raised before _read_stream runs, and anything it did
+        # not turn into OllamaError itself, still need to reach the reader.
+        exc = f.exception()
+        if exc is None:
+            return
+        if not isinstance(exc, OllamaError):
+            wrapped = OllamaError(f"Ollama stream failed: {exc}")
+            wrapped.__cause__ = exc
+            exc = wrapped
+        chunks.put(exc)
+
+    future.add_done_callback(on_done)
+    try:
+        while True:
+            try:
+                # Ollama sends chunks continuously; a reader silent this long is stuck.
+                item = chunks.get(timeout=OLLAMA_TIMEOUT)
+            except queue.Empty:
+                raise OllamaError("Timed out waiting for Ollama") from None
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        cancelled.set()
+
+
+# -----------------------------
+# Dedicated executor + admission control
+# -----------------------------
+class _Runner:
+    """
+    Per-process executor, keep-alive HTTP session and admission counters.
+
+    At most AI_MAX_CONCURRENCY calls run and AI_QUEUE_SIZE wait; submit() refuses
+    anything beyond that with OllamaBusy instead of letting requests pile up.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=AI_MAX_CONCURRENCY, thread_name_prefix="ollama")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=AI_MAX_CONCURRENCY)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.lock = threading.Lock()
+        self.admitted = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.queue_timeouts = 0
+
+    def submit(self, fn, args, kwargs, queue_timeout):
+        with self.lock:
+            if self.admitted >= AI_MAX_CONCURRENCY + AI_QUEUE_SIZE:
+                self.rejected += 1
+                raise OllamaBusy("AI is busy; too many requests in progress")
+            self.admitted += 1
+        queued_at = time.monotonic()
+
+        def run():
+            with self.lock:
+                if queue_timeout is not None and time.monotonic() - queued_at > queue_timeout:
+                    self.admitted -= 1
+                    self.queue_timeouts += 1
+                    raise OllamaBusy("AI is busy; timed out waiting for a free slot")
+                self.running += 1
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.running -= 1
+                    self.admitted -= 1
+                    self.completed += 1
+
+        return self.executor.submit(run)
+
+    def has_capacity(self):
+        with self.lock:
+            return self.admitted < AI_MAX_CONCURRENCY + AI_QUEUE_SIZE
+
+    def stats(self):
+        with self.lock:
+            return {
+                "max_in_flight": AI_MAX_CONCURRENCY,
+                "max_queued": AI_QUEUE_SIZE,
+                "in_flight": self.running,
+                "queued": self.admitted - self.running,
+                "completed_total": self.completed,
+                "rejected_total": self.rejected,
+                "queue_timeouts_total": self.queue_timeouts,
+            }
+
+
+_runner_instance = None
+_runner_pid = None
+_runner_lock = threading.Lock()
+
+
+def _runner():
+    """Created lazily so each forked worker gets its own threads and sockets."""
+    global _runner_instance, _runner_pid
+    pid = os.getpid()
+    if _runner_instance is None or _runner_pid != pid:
+        with _runner_lock:
+            if _runner_instance is None or _runner_pid != pid:
+                _runner_instance = _Runner()
+                _runner_pid = pid
+    return _runner_instance
+
+
+def submit(fn, *args, queue_timeout=None, **kwargs):
+    """
+    Run fn on the AI executor; raises OllamaBusy if the queue is full.
+    With `queue_timeout`, a call still waiting after that many seconds fails with OllamaBusy.
+    """
+    return _runner().submit(fn, args, kwargs, queue_timeout)
+
+
+def has_capacity():
+    """True if submit() would currently admit another call."""
+    return _runner().has_capacity()
+
+
+def stats():
+    return _runner().stats()
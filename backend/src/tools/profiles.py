@@ -0,0 +1,77 @@
+import os
+import threading
+
+from cachetools import TTLCache
+
+from tools.database import db_pool
+from tools.records import RowMapper, UserProfile
+from tools.statements import register
+
+# -----------------------------
+# Per-process user profile cache
+# -----------------------------
+# GET /api/user/me and /api/auth/me read profiles from here. Writes in this
+# process invalidate the entry; other workers see the change within PROFILE_CACHE_TTL.
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "30"))
+
+PROFILE_ROWS = RowMapper(UserProfile)
+
+USER_PROFILE = register("user_profile", """
+    SELECT id, oauth_id, email, name, bio, level, streak, created_at, onboarding_complete, theme_preference
+    FROM users
+    WHERE id = %s
+""")
+
+_enabled = PROFILE_CACHE_SIZE > 0 and PROFILE_CACHE_TTL > 0
+_cache = TTLCache(maxsize=max(PROFILE_CACHE_SIZE, 1), ttl=max(PROFILE_CACHE_TTL, 1))
+_lock = threading.Lock()
+_hits = 0
+_misses = 0
+
+
+def get(user_id):
+    """Return the user's UserProfile, or None if the user no longer exists."""
+    global _hits, _misses
+    if _enabled:
+        with _lock:
+            profile = _cache.get(user_id)
+            if profile is not None:
+                _hits += 1
+                return profile
+            _misses += 1
+
+    conn = db_pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            USER_PROFILE.execute(cur, (user_id,))
+            profile = PROFILE_ROWS.one(cur)
+    finally:
+        db_pool.putconn(conn)
+
+    if profile is not None:
+        put(profile)
+    return profile
+
+
+def put(profile):
+    if _enabled:
+        with _lock:
+            _cache[profile.id] = profile
+
+
+def invalidate(user_id):
+    """Drop the cached profile after anything that changes the users row (name, level, streak...)."""
+    with _lock:
+        _cache.pop(user_id, None)
+
+
+def stats():
+    with _lock:
+        return {
+            "enabled": _enabled,
+            "size": len(_cache),
+            "hits_total": _hits,
+            "misses_total": _misses,
+        }
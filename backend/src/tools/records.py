@@ -0,0 +1,198 @@
+from dataclasses import dataclass, fields, is_dataclass
+from datetime import date, datetime
+from operator import itemgetter
+
+# -----------------------------
+# Record types
+# -----------------------------
+# Slotted dataclasses are what the routes hand to jsonify(); the JSON provider
+# (tools/json_provider.py) encodes them and their date/datetime fields natively.
+
+
+@dataclass(slots=True)
+class Habit:
+    id: int
+    name: str
+    description: str | None
+
+
+@dataclass(slots=True)
+class Goal:
+    id: int
+    goal_text: str
+    xp: int
+    completed: bool
+    created_at: datetime | None
+    habit_id: int
+    habit: Habit
+
+
+@dataclass(slots=True)
+class JournalEntry:
+    id: int
+    goal_id: int
+    habit_id: int
+    habit_name: str
+    goal_text: str
+    entry_date: date | None
+    reflection: str | None
+    completion_level: str
+    xp_delta: int
+    created_at: datetime | None
+    updated_at: datetime | None
+    goal_xp: int
+
+
+@dataclass(slots=True)
+class UserProfile:
+    id: int
+    oauth_id: str | None
+    email: str | None
+    name: str | None
+    bio: str | None
+    level: int
+    streak: int
+    created_at: datetime | None
+    onboarding_complete: bool
+    theme_preference: str
+
+
+@dataclass(slots=True)
+class UserSummary:
+    id: int
+    email: str | None
+    name: str | None
+    bio: str | None
+
+
+@dataclass(slots=True)
+class Friend:
+    id: int
+    email: str | None
+    name: str | None
+    bio: str | None
+    since: datetime | None
+
+
+@dataclass(slots=True)
+class FriendSuggestion:
+    id: int
+    name: str | None
+    bio: str | None
+    mutual_count: int
+
+
+@dataclass(slots=True)
+class UserSearchResult:
+    id: int
+    name: str | None
+    bio: str | None
+    match: str
+    score: float
+
+
+@dataclass(slots=True)
+class LeaderboardEntry:
+    rank: int
+    id: int
+    name: str | None
+    total_xp: int
+    level: int
+
+
+@dataclass(slots=True)
+class FeedEntry:
+    id: int
+    friend: UserSummary
+    goal_id: int
+    habit_id: int
+    habit_name: str
+    goal_text: str
+    entry_date: date
+    completion_level: str
+    xp_delta: int
+    created_at: datetime | None
+    updated_at: datetime | None
+
+
+@dataclass(slots=True)
+class HealthDay:
+    date: date
+    steps: int
+    exercise_minutes: int
+    sleep_minutes: int
+    source: str
+    updated_at: datetime | None
+
+
+@dataclass(slots=True)
+class HealthRollup:
+    period_start: date
+    days: int
+    steps: int
+    exercise_minutes: int
+    sleep_minutes: int
+    avg_steps: float
+    avg_exercise_minutes: float
+    avg_sleep_minutes: float
+
+
+# -----------------------------
+# Row mapping
+# -----------------------------
+def _compile(record_type, index, prefix):
+    """
+    Build a row -> record function. Each field reads the column named
+    `prefix + field`; a dataclass-typed field without such a column is built
+    from the columns prefixed with `<field>_` (e.g. Goal.habit <- habit_id, habit_name, ...).
+    """
+    parts = []
+    plain = True
+    for field in fields(record_type):
+        column = prefix + field.name
+        if column in index:
+            parts.append(index[column])
+        elif is_dataclass(field.type):
+            parts.append(_compile(field.type, index, f"{column}_"))
+            plain = False
+        else:
+            raise KeyError(f"{record_type.__name__}.{field.name}: query has no column {column!r}")
+
+    if plain:
+        if len(parts) == 1:
+            position = parts[0]
+            return lambda row: record_type(row[position])
+        getter = itemgetter(*parts)
+        return lambda row: record_type(*getter(row))
+
+    getters = [itemgetter(p) if isinstance(p, int) else p for p in parts]
+    return lambda row: record_type(*[get(row) for get in getters])
+
+
+class RowMapper:
+    """Maps cursor rows onto `record_type`, locating columns by name via cur.description."""
+
+    def __init__(self, record_type, prefix=""):
+        self.record_type = record_type
+        self.prefix = prefix
+        self._plans = {}
+
+    def build(self, cur):
+        """Return the row -> record function for the cursor's current result set."""
+        columns = tuple(col.name for col in cur.description)
+        plan = self._plans.get(columns)
+        if plan is None:
+            index = {}
+            for position, name in enumerate(columns):
+                index.setdefault(name, position)
+            plan = _compile(self.record_type, index, self.prefix)
+            self._plans[columns] = plan
+        return plan
+
+    def one(self, cur):
+        row = cur.fetchone()
+        return self.build(cur)(row) if row else None
+
+    def all(self, cur):
+        build = self.build(cur)
+        return [build(row) for row in cur.fetchall()]
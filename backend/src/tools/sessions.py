@@ -0,0 +1,200 @@
+import hashlib
+import os
+import secrets
+import threading
+import time
+
+from cachetools import TTLCache
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from psycopg2.extras import Json
+from werkzeug.datastructures import CallbackDict
+
+from tools.database import db_pool
+
+# -----------------------------
+# Server-side sessions
+# -----------------------------
+# The cookie carries only a signed random session id; the session dict lives in
+# the user_sessions table (keyed by a hash of the id) behind a small per-process
+# TTL cache, so most requests authenticate without touching Postgres.
+
+# Sessions looked up within this many seconds are served from memory. A logout
+# in another worker is seen by this one after at most this long.
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "30"))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+
+
+def _hash(sid):
+    # Only the hash is stored, so a copy of the table cannot be replayed as cookies.
+    return hashlib.sha256(sid.encode()).hexdigest()
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.rotated_from = None
+        self.modified = False
+
+    def clear(self):
+        # Clearing (login/logout) retires the old id instead of reusing it (session fixation).
+        if self.sid is not None:
+            self.rotated_from = self.sid
+            self.sid = None
+        super().clear()
+
+
+class PostgresSessionInterface(SessionInterface):
+    session_class = ServerSession
+
+    def __init__(self):
+        self._enabled = SESSION_CACHE_SIZE > 0 and SESSION_CACHE_TTL > 0
+        self._cache = TTLCache(maxsize=max(SESSION_CACHE_SIZE, 1), ttl=max(SESSION_CACHE_TTL, 1))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt="server-session")
+
+    # --- store ---
+    def _load(self, key):
+        if self._enabled:
+            with self._lock:
+                entry = self._cache.get(key)
+                if entry is not None:
+                    self.hits += 1
+                    return entry
+                self.misses += 1
+
+        conn = db_pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT data, extract(epoch FROM expires_at) FROM user_sessions WHERE id = %s AND expires_at > now()",
+                    (key,),
+                )
+                row = cur.fetchone()
+        finally:
+            db_pool.putconn(conn)
+
+        if row is None:
+            return None
+        entry = (row[0], float(row[1]))
+        self._remember(key, entry)
+        return entry
+
+    def _remember(self, key, entry):
+        if self._enabled:
+            with self._lock:
+                self._cache[key] = entry
+
+    def _forget(self, key):
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def _write(self, key, data, expires_at, new):
+        conn = db_pool.getconn()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        """
+                        INSERT INTO user_sessions (id, user_id, data, expires_at)
+                        VALUES (%s, %s, %s, to_timestamp(%s))
+                        ON CONFLICT (id) DO UPDATE
+                        SET user_id = EXCLUDED.user_id, data = EXCLUDED.data, expires_at = EXCLUDED.expires_at
+                        """,
+                        (key, data.get("user_id"), Json(data), expires_at),
+                    )
+                    if new:
+                        # Logins are rare enough to carry the expired-session sweep.
+                        cur.execute("DELETE FROM user_sessions WHERE expires_at < now()")
+        finally:
+            db_pool.putconn(conn)
+        self._remember(key, (data, expires_at))
+
+    def _delete(self, key):
+        conn = db_pool.getconn()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute("DELETE FROM user_sessions WHERE id = %s", (key,))
+        finally:
+            db_pool.putconn(conn)
+        self._forget(key)
+
+    # --- SessionInterface ---
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return self.session_class()
+        try:
+            sid = self._signer(app).unsign(cookie).decode()
+        except BadSignature:
+            return self.session_class()
+
+        entry = self._load(_hash(sid))
+        if entry is None or entry[1] <= time.time():
+            return self.session_class()
+        data, expires_at = entry
+        return self.session_class(dict(data), sid=sid, expires_at=expires_at)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        lifetime = app.permanent_session_lifetime.total_seconds()
+
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if session.rotated_from is not None:
+            self._delete(_hash(session.rotated_from))
+
+        if not session:
+            if session.rotated_from is not None or session.sid is not None:
+                if session.sid is not None:
+                    self._delete(_hash(session.sid))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        now = time.time()
+        new = session.sid is None
+        # Sliding expiry, but the row is only rewritten once half the lifetime has passed.
+        stale = session.expires_at is None or session.expires_at - now < lifetime / 2
+        if not (new or session.modified or stale):
+            return
+
+        if new:
+            session.sid = secrets.token_urlsafe(32)
+        session.expires_at = now + lifetime
+        self._write(_hash(session.sid), dict(session), session.expires_at, new)
+
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode(),
+            expires=int(session.expires_at),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self._enabled,
+                "size": len(self._cache),
+                "hits_total": self.hits,
+                "misses_total": self.misses,
+            }
+
+
+session_interface = PostgresSessionInterface()
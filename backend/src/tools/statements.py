@@ -0,0 +1,89 @@
+import itertools
+import re
+import threading
+
+from psycopg2 import errors
+
+# -----------------------------
+# Server-side prepared statements
+# -----------------------------
+# Hot route queries are registered once at import time. The first execution on a
+# pooled connection sends PREPARE; every later execution on that connection sends
+# only EXECUTE with the parameters, so Postgres skips parsing and (after a few
+# runs) planning. Statements are written with psycopg2 "%s" placeholders and must
+# not contain any other "%" characters.
+
+_PLACEHOLDER = re.compile(r"%s")
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class PreparedStatement:
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        self.param_count = len(_PLACEHOLDER.findall(sql))
+        numbering = itertools.count(1)
+        self._prepare_sql = "PREPARE {} AS {}".format(
+            name, _PLACEHOLDER.sub(lambda _: f"${next(numbering)}", sql)
+        )
+        if self.param_count:
+            self._execute_sql = "EXECUTE {} ({})".format(name, ", ".join(["%s"] * self.param_count))
+        else:
+            self._execute_sql = f"EXECUTE {name}"
+        self._lock = threading.Lock()
+        self.prepares = 0
+        self.executions = 0
+
+    def execute(self, cur, params=()):
+        """Run the statement on `cur`, preparing it first if this connection has not seen it."""
+        prepared = getattr(cur.connection, "prepared_statements", None)
+        if prepared is None:
+            # Plain psycopg2 connection (scripts, benchmarks): no per-connection state.
+            cur.execute(self.sql, params)
+            return
+
+        needs_prepare = self.name not in prepared
+        if needs_prepare:
+            cur.execute(self._prepare_sql)
+            prepared.add(self.name)
+        try:
+            cur.execute(self._execute_sql, params)
+        except errors.InvalidSqlStatementName:
+            # Session was reset underneath us; prepare again on next use.
+            prepared.discard(self.name)
+            raise
+
+        with self._lock:
+            self.executions += 1
+            if needs_prepare:
+                self.prepares += 1
+
+
+def register(name, sql):
+    """Register a named statement; re-registering the same name needs identical SQL."""
+    with _registry_lock:
+        existing = _registry.get(name)
+        if existing is not None:
+            if existing.sql != sql:
+                raise ValueError(f"prepared statement {name!r} already registered with different SQL")
+            return existing
+        statement = PreparedStatement(name, sql)
+        _registry[name] = statement
+        return statement
+
+
+def stats():
+    """Per-statement counters; `hits` are executions that reused an existing prepare."""
+    with _registry_lock:
+        statements = list(_registry.values())
+    result = {}
+    for statement in statements:
+        with statement._lock:
+            result[statement.name] = {
+                "executions": statement.executions,
+                "prepares": statement.prepares,
+                "hits": statement.executions - statement.prepares,
+            }
+    return result
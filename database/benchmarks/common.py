@@ -0,0 +1,65 @@
+import os
+import statistics
+import time
+from pathlib import Path
+
+import psycopg2
+from dotenv import load_dotenv
+
+ENV_ROOT = Path(__file__).resolve().parent.parent.parent
+load_dotenv(ENV_ROOT / ".env")
+load_dotenv(ENV_ROOT / ".env.local")
+load_dotenv(ENV_ROOT / "backend" / ".env")
+
+DB_CONFIG = {
+    "dbname": os.getenv("DB_NAME", "magic_journal"),
+    "user": os.getenv("DB_USER"),
+    "password": os.getenv("DB_PASSWORD"),
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": int(os.getenv("DB_PORT", "5432")),
+}
+
+BENCH_EMAIL_DOMAIN = "bench.invalid"
+
+
+def connect():
+    if not DB_CONFIG["user"] or not DB_CONFIG["password"]:
+        raise RuntimeError("Database credentials missing. Set DB_USER and DB_PASSWORD in your env.")
+    return psycopg2.connect(**DB_CONFIG)
+
+
+def create_user(cur, label):
+    """Insert a throwaway user; drop_bench_users() removes it and everything it owns."""
+    email = f"{label}-{time.time_ns()}@{BENCH_EMAIL_DOMAIN}"
+    cur.execute(
+        "INSERT INTO users (oauth_id, email, name, bio) VALUES (%s, %s, %s, '') RETURNING id",
+        (f"bench-{email}", email, label),
+    )
+    return cur.fetchone()[0]
+
+
+def drop_bench_users(conn):
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM users WHERE email LIKE %s", (f"%@{BENCH_EMAIL_DOMAIN}",))
+
+
+def measure(fn, iterations, warmup=20):
+    """Call fn(i) `iterations` times after `warmup` calls; return per-call seconds."""
+    for i in range(warmup):
+        fn(i)
+    samples = []
+    for i in range(warmup, warmup + iterations):
+        started = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def report(label, samples):
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(
+        f"{label:<28} n={len(samples):<6} mean={statistics.fmean(samples) * 1000:7.3f}ms "
+        f"p50={statistics.median(samples) * 1000:7.3f}ms p95={p95 * 1000:7.3f}ms"
+    )
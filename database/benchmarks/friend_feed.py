@@ -0,0 +1,181 @@
+"""
+GET /api/friends/feed for viewers with 50 and 500 friends, each friend with a
+year of entries on two goals (~730 entries per friend), next to OTHER_USERS
+non-friends with a year of entries each. In the "idle" case the friends' year
+ended 90 days ago, so the newest friend activity sits behind everyone else's.
+
+  before: one query filtering journal_entries with user_id = ANY(friends),
+          sorted and cut to a page
+  after:  the two-pass LATERAL seeks from routes/friend.py (FRIEND_FEED)
+
+Prints both plans for the first page, then latency for the first page and for
+a page 20 pages deep (reached by following cursors). Run against a development
+database; the seeded users are deleted afterwards.
+
+Run: python database/benchmarks/friend_feed.py [iterations]
+"""
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+from common import BENCH_EMAIL_DOMAIN, connect, create_user, drop_bench_users, measure, report
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "backend" / "src"))
+from routes.friend import FEED_START, FRIEND_FEED  # noqa: E402
+
+# (friends, days since the friends' last entry)
+SCENARIOS = ((50, 0), (500, 0), (500, 90))
+OTHER_USERS = 2000
+DAYS = 365
+PAGE_SIZE = 50
+DEEP_PAGE = 20
+
+BEFORE = """
+    SELECT
+        je.id, u.id AS friend_id, u.email AS friend_email, u.name AS friend_name, u.bio AS friend_bio,
+        je.goal_id, g.habit_id, h.name AS habit_name, g.goal_text, je.entry_date,
+        je.completion_level, je.xp_delta, je.created_at, je.updated_at
+    FROM journal_entries je
+    JOIN goals g ON g.id = je.goal_id
+    JOIN habits h ON h.id = g.habit_id
+    JOIN users u ON u.id = je.user_id
+    WHERE je.user_id = ANY(%s::bigint[])
+      AND (je.entry_date, je.id) < (%s, %s)
+    ORDER BY je.entry_date DESC, je.id DESC
+    LIMIT %s
+"""
+
+
+def before_params(friend_ids, after, limit):
+    return (friend_ids, after[0], after[1], limit)
+
+
+def after_params(friend_ids, after, limit):
+    return (friend_ids, limit, after[0], after[1], after[0], after[1])
+
+
+VARIANTS = (
+    ("before (= ANY)", BEFORE, before_params),
+    ("after (LATERAL x2)", FRIEND_FEED.sql, after_params),
+)
+
+
+def seed_users(cur, label, count, goals_each, idle_days=0):
+    """Insert `count` users with `goals_each` goals and DAYS days of entries per goal, ending idle_days ago."""
+    cur.execute(
+        """
+        INSERT INTO users (oauth_id, email, name, bio)
+        SELECT 'bench-' || %(label)s || '-' || n, %(label)s || '-' || n || '@' || %(domain)s, %(label)s || ' ' || n, ''
+        FROM generate_series(1, %(count)s) AS n
+        RETURNING id
+        """,
+        {"label": f"{label}-{time.time_ns()}", "domain": BENCH_EMAIL_DOMAIN, "count": count},
+    )
+    user_ids = [row[0] for row in cur.fetchall()]
+    cur.execute(
+        """
+        INSERT INTO goals (user_id, habit_id, goal_text)
+        SELECT u, (SELECT id FROM habits ORDER BY id LIMIT 1), 'bench goal ' || n
+        FROM unnest(%s::bigint[]) AS u
+        CROSS JOIN generate_series(1, %s) AS n
+        """,
+        (user_ids, goals_each),
+    )
+    cur.execute(
+        """
+        INSERT INTO journal_entries (user_id, goal_id, entry_date, reflection, xp_delta, completion_level)
+        SELECT g.user_id, g.id, %s::date - d, 'bench', 10, 'complete'
+        FROM goals g
+        CROSS JOIN generate_series(%s, %s + %s - 1) AS d
+        WHERE g.user_id = ANY(%s::bigint[])
+        """,
+        (date.today(), idle_days, idle_days, DAYS, user_ids),
+    )
+    return user_ids, cur.rowcount
+
+
+def vacuum(conn):
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("VACUUM ANALYZE journal_entries")
+            cur.execute("ANALYZE goals")
+    finally:
+        conn.autocommit = False
+
+
+def seed(conn, friend_count, idle_days):
+    started = time.perf_counter()
+    with conn:
+        with conn.cursor() as cur:
+            viewer = create_user(cur, "feed-viewer")
+            friend_ids, entries = seed_users(cur, "feed-friend", friend_count, goals_each=2, idle_days=idle_days)
+            cur.execute(
+                """
+                INSERT INTO friends (user_id1, user_id2)
+                SELECT LEAST(%s, f), GREATEST(%s, f) FROM unnest(%s::bigint[]) AS f
+                """,
+                (viewer, viewer, friend_ids),
+            )
+    vacuum(conn)
+    print(f"seeded {friend_count} friends, {entries} entries in {time.perf_counter() - started:.1f}s")
+    return friend_ids
+
+
+def page_cursor(conn, friend_ids, pages):
+    """Sort key of the last row after `pages` pages, found by following the feed."""
+    after = FEED_START
+    with conn:
+        with conn.cursor() as cur:
+            for _ in range(pages):
+                cur.execute(FRIEND_FEED.sql, after_params(friend_ids, after, PAGE_SIZE))
+                rows = cur.fetchall()
+                after = (rows[-1][9], rows[-1][0])
+    return after
+
+
+def explain(conn, sql, params):
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute("EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) " + sql, params)
+            return "\n".join("    " + row[0] for row in cur.fetchall())
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    conn = connect()
+    try:
+        started = time.perf_counter()
+        with conn:
+            with conn.cursor() as cur:
+                _, entries = seed_users(cur, "feed-other", OTHER_USERS, goals_each=1)
+        vacuum(conn)
+        print(f"seeded {OTHER_USERS} other users, {entries} entries in {time.perf_counter() - started:.1f}s")
+
+        for friend_count, idle_days in SCENARIOS:
+            friend_ids = seed(conn, friend_count, idle_days)
+            deep = page_cursor(conn, friend_ids, DEEP_PAGE)
+            scenario = f"{friend_count:>3}{' idle' if idle_days else ''}"
+            for label, sql, params in VARIANTS:
+                print(f"{scenario} friends, first page, {label}:")
+                print(explain(conn, sql, params(friend_ids, FEED_START, PAGE_SIZE)) + "\n")
+
+            for page_label, after in (("first page", FEED_START), (f"page {DEEP_PAGE}", deep)):
+                for label, sql, params in VARIANTS:
+                    args = params(friend_ids, after, PAGE_SIZE)
+
+                    def one(i, sql=sql, args=args):
+                        with conn:
+                            with conn.cursor() as cur:
+                                cur.execute(sql, args)
+                                cur.fetchall()
+
+                    report(f"{scenario} {page_label} {label}", measure(one, iterations))
+    finally:
+        drop_bench_users(conn)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+GET /api/friends and the dashboard friend count over a ~1M edge friends table.
+
+  before: the original OR filter with the CASE join
+  after:  the UNION ALL over both directions (routes/friend.py), served by the
+          covering friends_pkey and idx_friends_user2_user1
+
+Seeds USERS throwaway users with DEGREE friends each (USERS * DEGREE / 2 edges),
+vacuums so index-only scans can skip the heap, prints each query's plan for one
+user and then the latency of looking up random users. Seeding and cleanup take
+a while; run this against a development database.
+
+Run: python database/benchmarks/friends_list.py [iterations]
+"""
+import random
+import sys
+import time
+
+from common import BENCH_EMAIL_DOMAIN, connect, drop_bench_users, measure, report
+
+USERS = 20000
+DEGREE = 100
+
+BEFORE = """
+    SELECT
+        CASE WHEN f.user_id1 = %(user_id)s THEN f.user_id2 ELSE f.user_id1 END AS id,
+        u.email, u.name, u.bio, f.since
+    FROM friends f
+    JOIN users u
+      ON u.id = CASE WHEN f.user_id1 = %(user_id)s THEN f.user_id2 ELSE f.user_id1 END
+    WHERE f.user_id1 = %(user_id)s OR f.user_id2 = %(user_id)s
+    ORDER BY u.name NULLS LAST, u.email
+"""
+
+AFTER = """
+    SELECT u.id, u.email, u.name, u.bio, f.since
+    FROM (
+        SELECT user_id2 AS friend_id, since FROM friends WHERE user_id1 = %(user_id)s
+        UNION ALL
+        SELECT user_id1, since FROM friends WHERE user_id2 = %(user_id)s
+    ) f
+    JOIN users u ON u.id = f.friend_id
+    ORDER BY u.name NULLS LAST, u.email
+"""
+
+COUNT_BEFORE = "SELECT count(*) FROM friends f WHERE f.user_id1 = %(user_id)s OR f.user_id2 = %(user_id)s"
+
+COUNT_AFTER = """
+    SELECT (SELECT count(*) FROM friends WHERE user_id1 = %(user_id)s)
+         + (SELECT count(*) FROM friends WHERE user_id2 = %(user_id)s)
+"""
+
+QUERIES = (
+    ("list before (OR + CASE)", BEFORE),
+    ("list after (UNION ALL)", AFTER),
+    ("count before (OR)", COUNT_BEFORE),
+    ("count after (two seeks)", COUNT_AFTER),
+)
+
+
+def seed(conn):
+    """Insert the users and a ring lattice of edges: user i befriends i+1 .. i+DEGREE/2."""
+    started = time.perf_counter()
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO users (oauth_id, email, name, bio)
+                SELECT 'bench-friends-' || n, 'friends-' || n || '@' || %s, 'friend ' || n, ''
+                FROM generate_series(1, %s) AS n
+                RETURNING id
+                """,
+                (BENCH_EMAIL_DOMAIN, USERS),
+            )
+            user_ids = sorted(row[0] for row in cur.fetchall())
+            cur.execute(
+                """
+                INSERT INTO friends (user_id1, user_id2, since)
+                SELECT LEAST(a.id, b.id), GREATEST(a.id, b.id), now() - k * interval '1 hour'
+                FROM unnest(%s::bigint[]) WITH ORDINALITY AS a (id, n)
+                CROSS JOIN generate_series(1, %s) AS k
+                JOIN unnest(%s::bigint[]) WITH ORDINALITY AS b (id, n)
+                  ON b.n = (a.n + k - 1) %% %s + 1
+                """,
+                (user_ids, DEGREE // 2, user_ids, USERS),
+            )
+            edges = cur.rowcount
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("VACUUM ANALYZE friends")
+            cur.execute("ANALYZE users")
+    finally:
+        conn.autocommit = False
+    print(f"seeded {USERS} users, {edges} edges in {time.perf_counter() - started:.1f}s")
+    return user_ids
+
+
+def explain(conn, sql, user_id):
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute("EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) " + sql, {"user_id": user_id})
+            return "\n".join("    " + row[0] for row in cur.fetchall())
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    conn = connect()
+    try:
+        user_ids = seed(conn)
+        for label, sql in QUERIES:
+            print(f"{label}:\n{explain(conn, sql, user_ids[len(user_ids) // 2])}\n")
+
+        rng = random.Random(0)
+        picks = [rng.choice(user_ids) for _ in range(iterations + 20)]
+        for label, sql in QUERIES:
+
+            def one(i, sql=sql):
+                with conn:
+                    with conn.cursor() as cur:
+                        cur.execute(sql, {"user_id": picks[i]})
+                        cur.fetchall()
+
+            report(label, measure(one, iterations))
+    finally:
+        started = time.perf_counter()
+        drop_bench_users(conn)
+        conn.close()
+        print(f"cleanup {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+POST /api/health/daily ingestion at 10, 1,000 and 10,000 records.
+
+  row-by-row:     the original one INSERT ... ON CONFLICT per record
+  execute_values: tools.health_ingest with everything inline
+  copy:           tools.health_ingest through COPY into the temp table
+
+Each size is loaded into an empty range (inserts), then re-uploaded with every
+value changed (updates); every batch is one committed transaction.
+
+Run: python database/benchmarks/health_ingest.py [repeats]
+"""
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from common import connect, create_user, drop_bench_users, report
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "backend" / "src"))
+from tools import health_ingest  # noqa: E402
+
+SIZES = (10, 1000, 10000)
+
+
+def row_by_row(cur, user_id, records):
+    for metric_date, steps, exercise_minutes, sleep_minutes, source in records:
+        cur.execute(
+            """
+            INSERT INTO user_health_metrics (user_id, metric_date, steps, exercise_minutes, sleep_minutes, source)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (user_id, metric_date)
+            DO UPDATE SET
+                steps = EXCLUDED.steps,
+                exercise_minutes = EXCLUDED.exercise_minutes,
+                sleep_minutes = EXCLUDED.sleep_minutes,
+                source = EXCLUDED.source,
+                updated_at = now()
+            """,
+            (user_id, metric_date, steps, exercise_minutes, sleep_minutes, source),
+        )
+
+
+def bulk(threshold):
+    def load(cur, user_id, records):
+        health_ingest.HEALTH_COPY_THRESHOLD = threshold
+        health_ingest.merge_daily(cur, user_id, records)
+
+    return load
+
+
+VARIANTS = (
+    ("row-by-row", row_by_row),
+    ("execute_values", bulk(threshold=10**9)),
+    ("copy", bulk(threshold=0)),
+)
+
+
+def make_records(size, steps):
+    start = date(2000, 1, 1)
+    return [(start + timedelta(days=i), steps + i % 7, 30, 420, "apple_health") for i in range(size)]
+
+
+def timed(conn, fn, user_id, records):
+    started = time.perf_counter()
+    with conn:
+        with conn.cursor() as cur:
+            fn(cur, user_id, records)
+    return time.perf_counter() - started
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    conn = connect()
+    try:
+        for size in SIZES:
+            runs = repeats if size < 10000 else max(1, repeats // 2)
+            for label, fn in VARIANTS:
+                inserts, updates = [], []
+                for _ in range(runs):
+                    with conn:
+                        with conn.cursor() as cur:
+                            user_id = create_user(cur, "health")
+                    inserts.append(timed(conn, fn, user_id, make_records(size, 1000)))
+                    updates.append(timed(conn, fn, user_id, make_records(size, 2000)))
+                report(f"{size:>5} insert {label}", inserts)
+                report(f"{size:>5} update {label}", updates)
+    finally:
+        drop_bench_users(conn)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
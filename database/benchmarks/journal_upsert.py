@@ -0,0 +1,120 @@
+"""
+Before/after latency of POST /api/journal/entries' database work.
+
+  before: the original five statements (owner check, SELECT ... FOR UPDATE,
+          UPDATE or INSERT, goal XP update, joined re-select)
+  after:  one call to upsert_journal_entry()
+
+Each iteration is its own committed transaction and alternates between
+creating a new day's entry and rewriting an existing one.
+
+Run: python database/benchmarks/journal_upsert.py [iterations]
+"""
+import sys
+from datetime import date, timedelta
+
+from common import connect, create_user, drop_bench_users, measure, report
+
+LEVELS = (("partial", 5), ("complete", 10))
+
+
+def before(cur, user_id, goal_id, entry_date, level, xp_delta):
+    cur.execute("SELECT id, user_id FROM goals WHERE id = %s", (goal_id,))
+    cur.fetchone()
+    cur.execute(
+        """
+        SELECT id, xp_delta FROM journal_entries
+        WHERE user_id = %s AND goal_id = %s AND entry_date = %s
+        FOR UPDATE
+        """,
+        (user_id, goal_id, entry_date),
+    )
+    existing = cur.fetchone()
+    xp_diff = xp_delta
+    if existing:
+        entry_id = existing[0]
+        xp_diff = xp_delta - (existing[1] or 0)
+        cur.execute(
+            """
+            UPDATE journal_entries
+            SET reflection = %s, xp_delta = %s, completion_level = %s, updated_at = now()
+            WHERE id = %s
+            """,
+            ("bench", xp_delta, level, entry_id),
+        )
+    else:
+        cur.execute(
+            """
+            INSERT INTO journal_entries (user_id, goal_id, entry_date, reflection, xp_delta, completion_level)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            RETURNING id
+            """,
+            (user_id, goal_id, entry_date, "bench", xp_delta, level),
+        )
+        entry_id = cur.fetchone()[0]
+    cur.execute(
+        "UPDATE goals SET xp = GREATEST(0, xp + %s) WHERE id = %s AND user_id = %s RETURNING xp, habit_id, goal_text",
+        (xp_diff, goal_id, user_id),
+    )
+    cur.fetchone()
+    cur.execute(
+        """
+        SELECT je.id, je.goal_id, g.habit_id, h.name, g.goal_text, je.entry_date, je.reflection,
+               je.completion_level, je.xp_delta, je.created_at, je.updated_at, g.xp
+        FROM journal_entries je
+        JOIN goals g ON g.id = je.goal_id
+        JOIN habits h ON h.id = g.habit_id
+        WHERE je.id = %s
+        """,
+        (entry_id,),
+    )
+    cur.fetchone()
+
+
+def after(cur, user_id, goal_id, entry_date, level, xp_delta):
+    cur.execute(
+        "SELECT * FROM upsert_journal_entry(%s, %s, %s, %s, %s, %s)",
+        (user_id, goal_id, entry_date, "bench", xp_delta, level),
+    )
+    cur.fetchone()
+
+
+def run(conn, label, variant, iterations):
+    with conn:
+        with conn.cursor() as cur:
+            user_id = create_user(cur, f"upsert-{label}")
+            cur.execute(
+                """
+                INSERT INTO goals (user_id, habit_id, goal_text)
+                SELECT %s, id, 'bench goal' FROM habits ORDER BY id LIMIT 1
+                RETURNING id
+                """,
+                (user_id,),
+            )
+            goal_id = cur.fetchone()[0]
+
+    start = date(2000, 1, 1)
+
+    def one(i):
+        # Even iterations create day i // 2; odd ones rewrite it with another level.
+        level, xp_delta = LEVELS[i % 2]
+        with conn:
+            with conn.cursor() as cur:
+                variant(cur, user_id, goal_id, start + timedelta(days=i // 2), level, xp_delta)
+
+    report(label, measure(one, iterations))
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    conn = connect()
+    try:
+        run(conn, "before (5 statements)", before, iterations)
+        run(conn, "after (upsert_journal_entry)", after, iterations)
+    finally:
+        drop_bench_users(conn)
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Journal upsert latency for users with many goals, old vs new level trigger.
+
+  before: the original sync_user_level, which re-sums every goal of the user
+  after:  the delta trigger (apply_user_xp) from create_schema.sql
+
+Each variant, bench user included, runs in one transaction that is always rolled back, each upsert
+under its own savepoint. For the "before" run the goal triggers are swapped for
+the legacy ones inside that transaction, so the real triggers are never changed
+outside it, even if the script dies. The swap locks goals until the rollback;
+run this against a development database.
+
+Run: python database/benchmarks/user_level.py [iterations]
+"""
+import sys
+from datetime import date, timedelta
+
+from common import connect, create_user, measure, report
+
+GOAL_COUNTS = (10, 100, 500)
+
+LEGACY_TRIGGERS = """
+    CREATE OR REPLACE FUNCTION legacy_refresh_user_level(target_user_id BIGINT) RETURNS VOID AS $$
+    DECLARE
+      total INTEGER;
+    BEGIN
+      SELECT COALESCE(SUM(xp), 0) INTO total FROM goals WHERE user_id = target_user_id;
+      UPDATE users SET level = GREATEST(1, (total / 100) + 1) WHERE id = target_user_id;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION legacy_sync_user_level() RETURNS TRIGGER AS $$
+    BEGIN
+      IF TG_OP = 'DELETE' THEN
+        PERFORM legacy_refresh_user_level(OLD.user_id);
+        RETURN OLD;
+      END IF;
+      PERFORM legacy_refresh_user_level(NEW.user_id);
+      RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS trg_goals_sync_user_level_insert ON goals;
+    DROP TRIGGER IF EXISTS trg_goals_sync_user_level_update ON goals;
+    DROP TRIGGER IF EXISTS trg_goals_sync_user_level_delete ON goals;
+    CREATE TRIGGER trg_goals_sync_user_level_insert AFTER INSERT ON goals
+      FOR EACH ROW EXECUTE FUNCTION legacy_sync_user_level();
+    CREATE TRIGGER trg_goals_sync_user_level_update AFTER UPDATE ON goals
+      FOR EACH ROW EXECUTE FUNCTION legacy_sync_user_level();
+    CREATE TRIGGER trg_goals_sync_user_level_delete AFTER DELETE ON goals
+      FOR EACH ROW EXECUTE FUNCTION legacy_sync_user_level();
+"""
+
+
+def setup(cur, goal_count):
+    user_id = create_user(cur, "level")
+    cur.execute(
+        """
+        INSERT INTO goals (user_id, habit_id, goal_text, xp)
+        SELECT %s, (SELECT id FROM habits ORDER BY id LIMIT 1), 'bench goal ' || n, 50
+        FROM generate_series(1, %s) AS n
+        RETURNING id
+        """,
+        (user_id, goal_count),
+    )
+    return user_id, [row[0] for row in cur.fetchall()]
+
+
+def run(conn, label, goal_count, iterations, legacy=False):
+    """One variant inside a transaction that is rolled back whatever happens."""
+    try:
+        with conn.cursor() as cur:
+            if legacy:
+                cur.execute(LEGACY_TRIGGERS)
+            user_id, goal_ids = setup(cur, goal_count)
+            start = date(2000, 1, 1)
+
+            def one(i):
+                cur.execute("SAVEPOINT upsert")
+                cur.execute(
+                    "SELECT * FROM upsert_journal_entry(%s, %s, %s, %s, %s, %s)",
+                    (user_id, goal_ids[i % goal_count], start + timedelta(days=i), "bench", 10, "complete"),
+                )
+                cur.fetchone()
+                cur.execute("RELEASE SAVEPOINT upsert")
+
+            report(f"{goal_count:>4} goals {label}", measure(one, iterations))
+    finally:
+        conn.rollback()
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    conn = connect()
+    try:
+        for goal_count in GOAL_COUNTS:
+            run(conn, "before (re-sum)", goal_count, iterations, legacy=True)
+            run(conn, "after (delta)", goal_count, iterations)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
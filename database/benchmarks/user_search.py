@@ -0,0 +1,170 @@
+"""
+User lookups against USERS seeded users (names drawn from small first/last name
+lists, so common prefixes match tens of thousands of rows).
+
+  email lookup: send_friend_request's lower(email) = %s, with index scans
+                disabled (what it did before idx_users_lower_email) and as planned
+  search:       GET /api/user/search (SEARCH_USERS from routes/user.py) for short
+                and longer prefixes and fuzzy queries, against the same query with
+                index scans disabled; skipped where pg_trgm is not installed
+
+Prints the plans, then latency. Run against a development database; seeding
+takes a few minutes and the seeded users are deleted afterwards.
+
+Run: python database/benchmarks/user_search.py [iterations] [users]
+"""
+import random
+import sys
+import time
+from pathlib import Path
+
+from common import BENCH_EMAIL_DOMAIN, connect, drop_bench_users, measure, report
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "backend" / "src"))
+from routes.user import (  # noqa: E402
+    FUZZY_CANDIDATES,
+    MIN_FUZZY_QUERY,
+    SEARCH_CANDIDATES,
+    SEARCH_START,
+    SEARCH_USERS,
+    _like_prefix,
+)
+
+USERS = 1_000_000
+PAGE_SIZE = 20
+FIRST_NAMES = (
+    "Ada Alan Alice Amir Ana Ben Bianca Carl Chen Clara Dana David Elena Emil Eva Farah Felix "
+    "Grace Hana Hugo Ines Ivan Jamal Jana Kai Karin Leo Lina Marco Maya Nadia Noah Olga Omar "
+    "Paula Priya Rafael Rosa Sami Sofia"
+).split()
+LAST_NAMES = (
+    "Adams Becker Costa Dubois Evans Fischer Garcia Hansen Ito Jensen Kim Kowalski Lopez Meyer "
+    "Nakamura Novak Okafor Petrov Quinn Rossi Schmidt Silva Tanaka Umar Vargas Weber Xu Yilmaz "
+    "Zhang Berg Moreau Nguyen Patel Rahman Santos Smith Walsh Young Ziegler Haddad"
+).split()
+# (label, query)
+PREFIX_QUERIES = (("short prefix", "ma"), ("name prefix", "marco ro"), ("email prefix", "sofia.ha"))
+FUZZY_QUERIES = (("fuzzy name", "sofai hansen"), ("fuzzy email", "emil.schmit"))
+
+EMAIL_LOOKUP = "SELECT id FROM users WHERE lower(email) = %s"
+NO_INDEX_SCANS = "SET LOCAL enable_indexscan = off; SET LOCAL enable_bitmapscan = off; SET LOCAL enable_indexonlyscan = off"
+
+
+def seed(conn, count):
+    started = time.perf_counter()
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO users (oauth_id, email, name, bio)
+                SELECT
+                    'bench-search-' || n,
+                    lower(f.name) || '.' || lower(l.name) || n || '@' || %(domain)s,
+                    f.name || ' ' || l.name,
+                    ''
+                FROM generate_series(0, %(count)s - 1) AS n
+                CROSS JOIN LATERAL (SELECT (%(first)s::text[])[1 + n %% %(first_count)s] AS name) f
+                CROSS JOIN LATERAL (SELECT (%(last)s::text[])[1 + (n / %(first_count)s) %% %(last_count)s] AS name) l
+                """,
+                {
+                    "domain": BENCH_EMAIL_DOMAIN,
+                    "count": count,
+                    "first": list(FIRST_NAMES),
+                    "first_count": len(FIRST_NAMES),
+                    "last": list(LAST_NAMES),
+                    "last_count": len(LAST_NAMES),
+                },
+            )
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("VACUUM ANALYZE users")
+    finally:
+        conn.autocommit = False
+    print(f"seeded {count} users in {time.perf_counter() - started:.1f}s")
+
+
+def has_pg_trgm(conn):
+    with conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+            return cur.fetchone()[0]
+
+
+def search_query(q):
+    sql = SEARCH_USERS.format(fuzzy=FUZZY_CANDIDATES if len(q) >= MIN_FUZZY_QUERY else "")
+    after_tier, after_score, after_id = SEARCH_START
+    params = {
+        "q": q,
+        "prefix": _like_prefix(q),
+        "candidates": SEARCH_CANDIDATES,
+        "user_id": 0,
+        "after_tier": after_tier,
+        "after_score": -after_score,
+        "after_id": after_id,
+        "limit": PAGE_SIZE + 1,
+    }
+    return sql, params
+
+
+def run(conn, sql, params, index_scans=True, explain=False):
+    with conn:
+        with conn.cursor() as cur:
+            if not index_scans:
+                cur.execute(NO_INDEX_SCANS)
+            if explain:
+                cur.execute("EXPLAIN (ANALYZE, BUFFERS, COSTS OFF) " + sql, params)
+                return "\n".join("    " + row[0] for row in cur.fetchall())
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+
+def compare(conn, label, sql, params_for, iterations):
+    """Plans for one call, then latency, with index scans disabled and as planned."""
+    variants = (("before (no index)", False), ("after (indexed)", True))
+    for name, index_scans in variants:
+        print(f"{label}, {name}:")
+        print(run(conn, sql, params_for(0), index_scans, explain=True) + "\n")
+    for name, index_scans in variants:
+        # Sequential scans over a million rows are slow; a few samples are plenty.
+        n = iterations if index_scans else max(5, iterations // 50)
+
+        def one(i, index_scans=index_scans):
+            run(conn, sql, params_for(i), index_scans)
+
+        report(f"{label} {name}", measure(one, n, warmup=2 if not index_scans else 20))
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else USERS
+    conn = connect()
+    try:
+        seed(conn, count)
+
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT email FROM users WHERE oauth_id LIKE %s ORDER BY random() LIMIT 1000",
+                    ("bench-search-%",),
+                )
+                emails = [row[0] for row in cur.fetchall()]
+        random.shuffle(emails)
+        compare(conn, "email lookup", EMAIL_LOOKUP, lambda i: (emails[i % len(emails)],), iterations)
+
+        # Search ranks with pg_trgm's similarity(), prefix matches included.
+        if not has_pg_trgm(conn):
+            print("pg_trgm is not installed; skipping search")
+            return
+        for label, q in PREFIX_QUERIES + FUZZY_QUERIES:
+            sql, params = search_query(q)
+            compare(conn, f"search {label}", sql, lambda i, params=params: params, iterations)
+    finally:
+        started = time.perf_counter()
+        drop_bench_users(conn)
+        print(f"dropped bench users in {time.perf_counter() - started:.1f}s")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
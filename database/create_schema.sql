@@ -3,9 +3,19 @@
 
 BEGIN;
 
+-- ===== Extensions =====
+-- Trigram indexes for fuzzy user search (GET /api/user/search)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- ===== Enums =====
--- Friend request status (pending -> accepted/declined/cancelled)
-CREATE TYPE friend_request_status AS ENUM ('pending','accepted','declined','cancelled');
+-- Friend request status (pending -> accepted/declined/cancelled). Guarded so the
+-- script can be re-run on existing databases to apply the upgrades below.
+DO $$
+BEGIN
+  IF NOT EXISTS (SELECT 1 FROM pg_type WHERE typname = 'friend_request_status') THEN
+    CREATE TYPE friend_request_status AS ENUM ('pending','accepted','declined','cancelled');
+  END IF;
+END $$;
 
 -- ===== Core tables =====
 CREATE TABLE IF NOT EXISTS users (
@@ -16,10 +26,31 @@ CREATE TABLE IF NOT EXISTS users (
   bio          TEXT,
   level        INTEGER NOT NULL DEFAULT 1,
   streak       INTEGER NOT NULL DEFAULT 0,
+  total_xp     BIGINT NOT NULL DEFAULT 0,
+  streak_last_date DATE,
   created_at   TIMESTAMPTZ NOT NULL DEFAULT now(),
   onboarding_complete BOOLEAN NOT NULL DEFAULT FALSE,
   theme_preference TEXT NOT NULL DEFAULT 'system' CHECK (theme_preference IN ('system','light','dark'))
 );
+-- Case-insensitive lookups: text_pattern_ops serves both lower(email) = ... (friend
+-- requests by email) and LIKE 'prefix%' (user search, names in (name, id) order);
+-- the GiST trigram indexes return fuzzy matches closest first (ORDER BY ... <->).
+-- Earlier single-column / GIN versions are replaced.
+CREATE INDEX IF NOT EXISTS idx_users_lower_email ON users(lower(email) text_pattern_ops);
+DROP INDEX IF EXISTS idx_users_lower_name;
+CREATE INDEX IF NOT EXISTS idx_users_lower_name_id ON users(lower(name) text_pattern_ops, id);
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM pg_class c JOIN pg_am am ON am.oid = c.relam
+    WHERE c.relname IN ('idx_users_email_trgm', 'idx_users_name_trgm') AND am.amname = 'gin'
+  ) THEN
+    DROP INDEX IF EXISTS idx_users_email_trgm;
+    DROP INDEX IF EXISTS idx_users_name_trgm;
+  END IF;
+END $$;
+CREATE INDEX IF NOT EXISTS idx_users_email_trgm ON users USING gist (lower(email) gist_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_users_name_trgm ON users USING gist (lower(name) gist_trgm_ops);
 
 CREATE TABLE IF NOT EXISTS habits (
   id           BIGSERIAL PRIMARY KEY,
@@ -87,10 +118,156 @@ CREATE TABLE IF NOT EXISTS friends (
   user_id1 BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
   user_id2 BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
   since    TIMESTAMPTZ NOT NULL DEFAULT now(),
-  PRIMARY KEY (user_id1, user_id2),
+  PRIMARY KEY (user_id1, user_id2) INCLUDE (since),
   CHECK (user_id1 < user_id2)
 );
-CREATE INDEX IF NOT EXISTS idx_friends_user2 ON friends(user_id2);
+-- Both directions are covering so friend lists (one branch per column, see
+-- routes/friend.py) are index-only scans. Existing databases get the covering
+-- primary key swapped in once; the plain user_id2 index is replaced.
+DO $$
+BEGIN
+  IF NOT EXISTS (
+    SELECT 1 FROM pg_index WHERE indexrelid = 'friends_pkey'::regclass AND indnatts > indnkeyatts
+  ) THEN
+    CREATE UNIQUE INDEX friends_pkey_covering ON friends(user_id1, user_id2) INCLUDE (since);
+    ALTER TABLE friends
+      DROP CONSTRAINT friends_pkey,
+      ADD CONSTRAINT friends_pkey PRIMARY KEY USING INDEX friends_pkey_covering;
+  END IF;
+END $$;
+DROP INDEX IF EXISTS idx_friends_user2;
+CREATE INDEX IF NOT EXISTS idx_friends_user2_user1 ON friends(user_id2, user_id1) INCLUDE (since);
+
+-- Tell every app worker whose friend set changed (tools/friendships.py LISTENs on
+-- "friendships"); covers cascades and manual SQL too. Payloads are capped at
+-- 8000 bytes, so large changes send "*" (drop everything).
+CREATE OR REPLACE FUNCTION notify_friendship_change() RETURNS TRIGGER AS $$
+DECLARE
+  edges TEXT;
+  ids TEXT;
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    edges := 'SELECT user_id1, user_id2 FROM new_rows';
+  ELSIF TG_OP = 'UPDATE' THEN
+    edges := 'SELECT user_id1, user_id2 FROM new_rows UNION ALL SELECT user_id1, user_id2 FROM old_rows';
+  ELSE
+    edges := 'SELECT user_id1, user_id2 FROM old_rows';
+  END IF;
+
+  EXECUTE format($sql$
+    SELECT string_agg(DISTINCT v.id::text, ',')
+    FROM (%s) e
+    CROSS JOIN LATERAL (VALUES (e.user_id1), (e.user_id2)) AS v (id)
+  $sql$, edges) INTO ids;
+
+  IF ids IS NOT NULL THEN
+    PERFORM pg_notify('friendships', CASE WHEN length(ids) > 7900 THEN '*' ELSE ids END);
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_friends_notify_insert ON friends;
+DROP TRIGGER IF EXISTS trg_friends_notify_update ON friends;
+DROP TRIGGER IF EXISTS trg_friends_notify_delete ON friends;
+
+CREATE TRIGGER trg_friends_notify_insert
+AFTER INSERT ON friends
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_friendship_change();
+
+CREATE TRIGGER trg_friends_notify_update
+AFTER UPDATE ON friends
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_friendship_change();
+
+CREATE TRIGGER trg_friends_notify_delete
+AFTER DELETE ON friends
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION notify_friendship_change();
+
+-- "People you may know": each user's top friends-of-friends by mutual friend count,
+-- written by backend/src/jobs/refresh_friend_suggestions.py (GET /api/friends/suggestions).
+CREATE TABLE IF NOT EXISTS friend_suggestions (
+  user_id      BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  suggested_id BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  mutual_count INTEGER NOT NULL,
+  computed_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (user_id, suggested_id)
+);
+CREATE INDEX IF NOT EXISTS idx_friend_suggestions_rank
+  ON friend_suggestions(user_id, mutual_count DESC, suggested_id);
+CREATE INDEX IF NOT EXISTS idx_friend_suggestions_suggested_id ON friend_suggestions(suggested_id);
+
+-- Users whose suggestions are stale; drained by the job. No FK, so rows for
+-- users deleted meanwhile are harmless (the job finds nothing to write).
+CREATE TABLE IF NOT EXISTS friend_suggestion_queue (
+  user_id   BIGINT PRIMARY KEY,
+  queued_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_friend_suggestion_queue_queued_at ON friend_suggestion_queue(queued_at);
+
+-- A changed edge a-b changes the two-hop neighborhoods of a, b and all their friends.
+CREATE OR REPLACE FUNCTION queue_friend_suggestions() RETURNS TRIGGER AS $$
+DECLARE
+  edges TEXT;
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    edges := 'SELECT user_id1, user_id2 FROM new_rows';
+  ELSIF TG_OP = 'UPDATE' THEN
+    edges := 'SELECT user_id1, user_id2 FROM new_rows UNION ALL SELECT user_id1, user_id2 FROM old_rows';
+  ELSE
+    edges := 'SELECT user_id1, user_id2 FROM old_rows';
+  END IF;
+
+  EXECUTE format($sql$
+    WITH touched AS (
+      SELECT DISTINCT v.id
+      FROM (%s) e
+      CROSS JOIN LATERAL (VALUES (e.user_id1), (e.user_id2)) AS v (id)
+    ),
+    affected AS (
+      SELECT id FROM touched
+      UNION
+      SELECT f.user_id2 FROM touched t JOIN friends f ON f.user_id1 = t.id
+      UNION
+      SELECT f.user_id1 FROM touched t JOIN friends f ON f.user_id2 = t.id
+    )
+    INSERT INTO friend_suggestion_queue (user_id)
+    SELECT id FROM affected ORDER BY id
+    ON CONFLICT DO NOTHING
+  $sql$, edges);
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_friends_suggestions_insert ON friends;
+DROP TRIGGER IF EXISTS trg_friends_suggestions_update ON friends;
+DROP TRIGGER IF EXISTS trg_friends_suggestions_delete ON friends;
+
+CREATE TRIGGER trg_friends_suggestions_insert
+AFTER INSERT ON friends
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION queue_friend_suggestions();
+
+CREATE TRIGGER trg_friends_suggestions_update
+AFTER UPDATE ON friends
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION queue_friend_suggestions();
+
+CREATE TRIGGER trg_friends_suggestions_delete
+AFTER DELETE ON friends
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION queue_friend_suggestions();
+
+-- Existing databases: queue everyone with friends once, before any suggestions exist.
+INSERT INTO friend_suggestion_queue (user_id)
+SELECT u.id
+FROM users u
+WHERE NOT EXISTS (SELECT 1 FROM friend_suggestions)
+  AND (EXISTS (SELECT 1 FROM friends f WHERE f.user_id1 = u.id)
+       OR EXISTS (SELECT 1 FROM friends f WHERE f.user_id2 = u.id))
+ON CONFLICT DO NOTHING;
 
 -- Daily journal entries tied to a user's goals/habits
 CREATE TABLE IF NOT EXISTS journal_entries (
@@ -105,7 +282,9 @@ CREATE TABLE IF NOT EXISTS journal_entries (
   updated_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
   UNIQUE (user_id, goal_id, entry_date)
 );
-CREATE INDEX IF NOT EXISTS idx_journal_entries_user_id ON journal_entries(user_id);
+-- Matches list_entries' ORDER BY so keyset pages seek instead of sort; replaces the plain user_id index.
+DROP INDEX IF EXISTS idx_journal_entries_user_id;
+CREATE INDEX IF NOT EXISTS idx_journal_entries_user_date_id ON journal_entries(user_id, entry_date DESC, id DESC);
 CREATE INDEX IF NOT EXISTS idx_journal_entries_goal_id ON journal_entries(goal_id);
 CREATE INDEX IF NOT EXISTS idx_journal_entries_entry_date ON journal_entries(entry_date);
 
@@ -124,36 +303,97 @@ CREATE TABLE IF NOT EXISTS user_health_metrics (
 );
 CREATE INDEX IF NOT EXISTS idx_user_health_metrics_user_date ON user_health_metrics(user_id, metric_date);
 
--- Keep user level aligned to total XP (sum of goal XP)
+-- Asynchronous AI generations (POST /api/ai/jobs); rows expire after an hour
+CREATE TABLE IF NOT EXISTS ai_jobs (
+  id          BIGSERIAL PRIMARY KEY,
+  user_id     BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  status      TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending','done','failed')),
+  result      JSONB,
+  error       TEXT,
+  created_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+  started_at  TIMESTAMPTZ,
+  finished_at TIMESTAMPTZ
+);
+ALTER TABLE ai_jobs ADD COLUMN IF NOT EXISTS started_at TIMESTAMPTZ;
+CREATE INDEX IF NOT EXISTS idx_ai_jobs_created_at ON ai_jobs(created_at);
+
+-- Server-side sessions; the cookie carries a signed id whose sha256 is the key (tools/sessions.py)
+CREATE TABLE IF NOT EXISTS user_sessions (
+  id          TEXT PRIMARY KEY,
+  user_id     BIGINT REFERENCES users(id) ON DELETE CASCADE,
+  data        JSONB NOT NULL DEFAULT '{}'::jsonb,
+  expires_at  TIMESTAMPTZ NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_user_sessions_user_id ON user_sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_user_sessions_expires_at ON user_sessions(expires_at);
+
+-- Server-side Ollama context per conversation (packed int32 tokens, see tools/conversations.py)
+CREATE TABLE IF NOT EXISTS ai_conversations (
+  id          BIGSERIAL PRIMARY KEY,
+  user_id     BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  context     BYTEA NOT NULL,
+  token_count INTEGER NOT NULL DEFAULT 0,
+  updated_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+-- Already compressed in the app; keep TOAST from trying again.
+ALTER TABLE ai_conversations ALTER COLUMN context SET STORAGE EXTERNAL;
+CREATE INDEX IF NOT EXISTS idx_ai_conversations_user_updated ON ai_conversations(user_id, updated_at DESC);
+CREATE INDEX IF NOT EXISTS idx_ai_conversations_updated_at ON ai_conversations(updated_at);
+
+-- Keep users.total_xp (sum of goal XP) and level current by applying deltas
+-- from goal changes; nothing re-sums a user's goals on the write path.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS total_xp BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION apply_user_xp(target_user_id BIGINT, xp_delta BIGINT) RETURNS VOID AS $$
+BEGIN
+  IF target_user_id IS NULL OR xp_delta = 0 THEN
+    RETURN;
+  END IF;
+
+  UPDATE users
+  SET total_xp = total_xp + xp_delta,
+      level = GREATEST(1, ((total_xp + xp_delta) / 100) + 1)
+  WHERE id = target_user_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Full recount for one user; used by the reconciliation job (backend/src/jobs/reconcile_user_xp.py).
 CREATE OR REPLACE FUNCTION refresh_user_level(target_user_id BIGINT) RETURNS VOID AS $$
 DECLARE
-  total_xp INTEGER;
+  goal_xp BIGINT;
 BEGIN
   IF target_user_id IS NULL THEN
     RETURN;
   END IF;
 
-  SELECT COALESCE(SUM(xp), 0) INTO total_xp
+  SELECT COALESCE(SUM(xp), 0) INTO goal_xp
   FROM goals
   WHERE user_id = target_user_id;
 
   UPDATE users
-  SET level = GREATEST(1, (total_xp / 100) + 1)
+  SET total_xp = goal_xp,
+      level = GREATEST(1, (goal_xp / 100) + 1)
   WHERE id = target_user_id;
 END;
 $$ LANGUAGE plpgsql;
 
 CREATE OR REPLACE FUNCTION sync_user_level() RETURNS TRIGGER AS $$
 BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM apply_user_xp(NEW.user_id, NEW.xp);
+    RETURN NEW;
+  END IF;
+
   IF TG_OP = 'DELETE' THEN
-    PERFORM refresh_user_level(OLD.user_id);
+    PERFORM apply_user_xp(OLD.user_id, -OLD.xp);
     RETURN OLD;
   END IF;
 
-  PERFORM refresh_user_level(NEW.user_id);
-
-  IF TG_OP = 'UPDATE' AND NEW.user_id IS DISTINCT FROM OLD.user_id THEN
-    PERFORM refresh_user_level(OLD.user_id);
+  IF NEW.user_id IS DISTINCT FROM OLD.user_id THEN
+    PERFORM apply_user_xp(OLD.user_id, -OLD.xp);
+    PERFORM apply_user_xp(NEW.user_id, NEW.xp);
+  ELSE
+    PERFORM apply_user_xp(NEW.user_id, NEW.xp - OLD.xp);
   END IF;
 
   RETURN NEW;
@@ -164,16 +404,319 @@ DROP TRIGGER IF EXISTS trg_goals_sync_user_level_insert ON goals;
 DROP TRIGGER IF EXISTS trg_goals_sync_user_level_update ON goals;
 DROP TRIGGER IF EXISTS trg_goals_sync_user_level_delete ON goals;
 
+-- WHEN clauses skip the trigger call entirely for goals that carry no XP change
+-- (e.g. goal_text or completed edits).
 CREATE TRIGGER trg_goals_sync_user_level_insert
 AFTER INSERT ON goals
-FOR EACH ROW EXECUTE FUNCTION sync_user_level();
+FOR EACH ROW WHEN (NEW.xp <> 0)
+EXECUTE FUNCTION sync_user_level();
 
 CREATE TRIGGER trg_goals_sync_user_level_update
-AFTER UPDATE ON goals
-FOR EACH ROW EXECUTE FUNCTION sync_user_level();
+AFTER UPDATE OF xp, user_id ON goals
+FOR EACH ROW WHEN (OLD.xp IS DISTINCT FROM NEW.xp OR OLD.user_id IS DISTINCT FROM NEW.user_id)
+EXECUTE FUNCTION sync_user_level();
 
 CREATE TRIGGER trg_goals_sync_user_level_delete
 AFTER DELETE ON goals
-FOR EACH ROW EXECUTE FUNCTION sync_user_level();
+FOR EACH ROW WHEN (OLD.xp <> 0)
+EXECUTE FUNCTION sync_user_level();
+
+-- Existing databases: seed total_xp once when the column is first added.
+UPDATE users u
+SET total_xp = g.xp, level = GREATEST(1, (g.xp / 100) + 1)
+FROM (SELECT user_id, SUM(xp) AS xp FROM goals GROUP BY user_id) g
+WHERE g.user_id = u.id AND u.total_xp = 0 AND g.xp <> 0;
+
+-- Snapshot of users' XP for GET /api/friends/leaderboard, refreshed concurrently
+-- by backend/src/jobs/refresh_leaderboard.py. Rows only change when a user's XP,
+-- level or name does, so refreshes rewrite little and the covering id index
+-- serves index-only lookups (the users heap churns with every XP change).
+CREATE MATERIALIZED VIEW IF NOT EXISTS leaderboard AS
+SELECT id, name, total_xp, level
+FROM users;
+-- Required for REFRESH ... CONCURRENTLY.
+CREATE UNIQUE INDEX IF NOT EXISTS idx_leaderboard_id ON leaderboard(id) INCLUDE (total_xp, level, name);
+
+-- Weekly and monthly health totals, kept in step with user_health_metrics by the
+-- statement-level triggers below (GET /api/health/rollups). Averages are totals / days.
+CREATE TABLE IF NOT EXISTS user_health_rollups (
+  user_id          BIGINT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+  granularity      TEXT NOT NULL CHECK (granularity IN ('week','month')),
+  period_start     DATE NOT NULL,
+  days             INTEGER NOT NULL DEFAULT 0,
+  steps            BIGINT NOT NULL DEFAULT 0,
+  exercise_minutes BIGINT NOT NULL DEFAULT 0,
+  sleep_minutes    BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (user_id, granularity, period_start)
+);
+
+CREATE OR REPLACE FUNCTION apply_health_rollups() RETURNS TRIGGER AS $$
+DECLARE
+  delta TEXT;
+BEGIN
+  -- Signed daily rows from the transition tables: +1 for new values, -1 for old ones.
+  IF TG_OP = 'INSERT' THEN
+    delta := 'SELECT user_id, metric_date, 1 AS sign, steps, exercise_minutes, sleep_minutes FROM new_rows';
+  ELSIF TG_OP = 'UPDATE' THEN
+    delta := 'SELECT user_id, metric_date, 1 AS sign, steps, exercise_minutes, sleep_minutes FROM new_rows
+              UNION ALL
+              SELECT user_id, metric_date, -1, steps, exercise_minutes, sleep_minutes FROM old_rows';
+  ELSE
+    delta := 'SELECT user_id, metric_date, -1 AS sign, steps, exercise_minutes, sleep_minutes FROM old_rows';
+  END IF;
+
+  EXECUTE format($sql$
+    INSERT INTO user_health_rollups AS r (user_id, granularity, period_start, days, steps, exercise_minutes, sleep_minutes)
+    SELECT
+      d.user_id,
+      g.granularity,
+      date_trunc(g.granularity, d.metric_date::timestamp)::date,
+      SUM(d.sign),
+      SUM(d.sign * d.steps),
+      SUM(d.sign * d.exercise_minutes),
+      SUM(d.sign * d.sleep_minutes)
+    FROM (%s) d
+    CROSS JOIN (VALUES ('week'), ('month')) AS g (granularity)
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (user_id, granularity, period_start) DO UPDATE
+    SET days = r.days + EXCLUDED.days,
+        steps = r.steps + EXCLUDED.steps,
+        exercise_minutes = r.exercise_minutes + EXCLUDED.exercise_minutes,
+        sleep_minutes = r.sleep_minutes + EXCLUDED.sleep_minutes
+  $sql$, delta);
+
+  IF TG_OP = 'DELETE' THEN
+    DELETE FROM user_health_rollups r
+    USING (SELECT DISTINCT user_id FROM old_rows) o
+    WHERE r.user_id = o.user_id AND r.days <= 0;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_health_rollups_insert ON user_health_metrics;
+DROP TRIGGER IF EXISTS trg_health_rollups_update ON user_health_metrics;
+DROP TRIGGER IF EXISTS trg_health_rollups_delete ON user_health_metrics;
+
+CREATE TRIGGER trg_health_rollups_insert
+AFTER INSERT ON user_health_metrics
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION apply_health_rollups();
+
+CREATE TRIGGER trg_health_rollups_update
+AFTER UPDATE ON user_health_metrics
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION apply_health_rollups();
+
+CREATE TRIGGER trg_health_rollups_delete
+AFTER DELETE ON user_health_metrics
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION apply_health_rollups();
+
+-- Existing databases: build the rollups once from the daily rows.
+INSERT INTO user_health_rollups (user_id, granularity, period_start, days, steps, exercise_minutes, sleep_minutes)
+SELECT m.user_id, g.granularity, date_trunc(g.granularity, m.metric_date::timestamp)::date,
+       COUNT(*), SUM(m.steps), SUM(m.exercise_minutes), SUM(m.sleep_minutes)
+FROM user_health_metrics m
+CROSS JOIN (VALUES ('week'), ('month')) AS g (granularity)
+WHERE NOT EXISTS (SELECT 1 FROM user_health_rollups)
+GROUP BY 1, 2, 3;
+
+-- Journal upsert in one call (POST /api/journal/entries). Returns the entry joined
+-- with its goal and whether it was created; no row when the goal is not the user's.
+CREATE OR REPLACE FUNCTION upsert_journal_entry(
+  p_user_id BIGINT,
+  p_goal_id BIGINT,
+  p_entry_date DATE,
+  p_reflection TEXT,
+  p_xp_delta INTEGER,
+  p_completion_level TEXT
+) RETURNS TABLE (
+  id BIGINT,
+  goal_id BIGINT,
+  habit_id BIGINT,
+  habit_name TEXT,
+  goal_text TEXT,
+  entry_date DATE,
+  reflection TEXT,
+  completion_level TEXT,
+  xp_delta INTEGER,
+  created_at TIMESTAMPTZ,
+  updated_at TIMESTAMPTZ,
+  goal_xp INTEGER,
+  created BOOLEAN
+) AS $$
+#variable_conflict use_column
+DECLARE
+  previous_xp INTEGER;
+BEGIN
+  -- Writers of a goal's entries queue on the goal row, so the read below is current.
+  PERFORM 1 FROM goals WHERE goals.id = p_goal_id AND goals.user_id = p_user_id FOR UPDATE;
+  IF NOT FOUND THEN
+    RETURN;
+  END IF;
+
+  SELECT je.xp_delta INTO previous_xp
+  FROM journal_entries je
+  WHERE je.user_id = p_user_id AND je.goal_id = p_goal_id AND je.entry_date = p_entry_date;
+
+  RETURN QUERY
+  WITH upserted AS (
+    INSERT INTO journal_entries AS je (user_id, goal_id, entry_date, reflection, xp_delta, completion_level)
+    VALUES (p_user_id, p_goal_id, p_entry_date, p_reflection, p_xp_delta, p_completion_level)
+    ON CONFLICT (user_id, goal_id, entry_date) DO UPDATE
+    SET reflection = EXCLUDED.reflection,
+        xp_delta = EXCLUDED.xp_delta,
+        completion_level = EXCLUDED.completion_level,
+        updated_at = now()
+    RETURNING je.id, je.goal_id, je.entry_date, je.reflection, je.completion_level, je.xp_delta, je.created_at, je.updated_at
+  ), goal AS (
+    UPDATE goals
+    SET xp = GREATEST(0, goals.xp + p_xp_delta - COALESCE(previous_xp, 0))
+    WHERE goals.id = p_goal_id
+    RETURNING goals.id, goals.habit_id, goals.goal_text, goals.xp
+  )
+  SELECT
+    upserted.id, upserted.goal_id, goal.habit_id, h.name, goal.goal_text, upserted.entry_date,
+    upserted.reflection, upserted.completion_level, upserted.xp_delta, upserted.created_at,
+    upserted.updated_at, goal.xp, previous_xp IS NULL
+  FROM upserted
+  JOIN goal ON goal.id = upserted.goal_id
+  JOIN habits h ON h.id = goal.habit_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Daily streaks: users.streak is the run of consecutive days (ending today or
+-- yesterday, by the database's current_date) with at least one entry that earned
+-- XP; streak_last_date is the latest such day. The journal triggers below extend
+-- the run in place for the common "logged today" write and fall back to a recount
+-- otherwise; lapsed streaks are zeroed by the nightly job (backend/src/jobs/refresh_streaks.py).
+ALTER TABLE users ADD COLUMN IF NOT EXISTS streak_last_date DATE;
+-- The nightly job's lookup of live streaks that have lapsed.
+CREATE INDEX IF NOT EXISTS idx_users_streak_lapse ON users(streak_last_date) WHERE streak > 0;
+
+-- Recount one user's streak; returns whether the row changed.
+CREATE OR REPLACE FUNCTION refresh_user_streak(target_user_id BIGINT) RETURNS BOOLEAN AS $$
+DECLARE
+  last_day DATE;
+  run INTEGER := 0;
+BEGIN
+  PERFORM 1 FROM users WHERE id = target_user_id FOR NO KEY UPDATE;
+
+  SELECT MAX(entry_date) INTO last_day
+  FROM journal_entries
+  WHERE user_id = target_user_id AND xp_delta > 0;
+
+  -- Gaps and islands: walking active days newest first, day + position is
+  -- constant along a run of consecutive days, so the current run is the days
+  -- that share last_day's value. Lapsed runs are 0 and need no count.
+  IF last_day >= current_date - 1 THEN
+    SELECT COUNT(*) INTO run
+    FROM (
+      SELECT entry_date, row_number() OVER (ORDER BY entry_date DESC) AS pos
+      FROM journal_entries
+      WHERE user_id = target_user_id AND xp_delta > 0
+      GROUP BY entry_date
+    ) days
+    WHERE entry_date + pos::int = last_day + 1;
+  END IF;
+
+  UPDATE users
+  SET streak = run, streak_last_date = last_day
+  WHERE id = target_user_id
+    AND (streak, streak_last_date) IS DISTINCT FROM (run, last_day);
+  RETURN FOUND;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION apply_user_streaks() RETURNS TRIGGER AS $$
+DECLARE
+  changes TEXT;
+  r RECORD;
+  day DATE;
+  current_streak INTEGER;
+  last_day DATE;
+BEGIN
+  -- Signed active (XP-earning) days from the transition tables.
+  IF TG_OP = 'INSERT' THEN
+    changes := 'SELECT user_id, entry_date, 1 AS sign FROM new_rows WHERE xp_delta > 0';
+  ELSIF TG_OP = 'UPDATE' THEN
+    changes := 'SELECT user_id, entry_date, 1 AS sign FROM new_rows WHERE xp_delta > 0
+                UNION ALL
+                SELECT user_id, entry_date, -1 FROM old_rows WHERE xp_delta > 0';
+  ELSE
+    changes := 'SELECT user_id, entry_date, -1 AS sign FROM old_rows WHERE xp_delta > 0';
+  END IF;
+
+  FOR r IN EXECUTE format($sql$
+    SELECT user_id,
+           array_agg(entry_date) FILTER (WHERE net > 0) AS added,
+           bool_or(net < 0) AS removed
+    FROM (
+      SELECT user_id, entry_date, SUM(sign) AS net
+      FROM (%s) c
+      GROUP BY 1, 2
+    ) d
+    WHERE net <> 0
+    GROUP BY user_id
+    ORDER BY user_id
+  $sql$, changes)
+  LOOP
+    IF r.removed OR cardinality(r.added) > 1 THEN
+      PERFORM refresh_user_streak(r.user_id);
+      CONTINUE;
+    END IF;
+
+    day := r.added[1];
+    SELECT streak, streak_last_date INTO current_streak, last_day
+    FROM users
+    WHERE id = r.user_id
+    FOR NO KEY UPDATE;
+
+    IF last_day IS NULL OR day > last_day + 1 THEN
+      UPDATE users
+      SET streak = CASE WHEN day >= current_date - 1 THEN 1 ELSE 0 END, streak_last_date = day
+      WHERE id = r.user_id;
+    ELSIF day = last_day + 1 AND current_streak > 0 THEN
+      UPDATE users
+      SET streak = CASE WHEN day >= current_date - 1 THEN current_streak + 1 ELSE 0 END, streak_last_date = day
+      WHERE id = r.user_id;
+    ELSIF day = last_day OR (day < last_day AND day > last_day - current_streak) THEN
+      -- Already inside the current run.
+      NULL;
+    ELSE
+      -- Fills an older gap, or extends a lapsed run of unknown length.
+      PERFORM refresh_user_streak(r.user_id);
+    END IF;
+  END LOOP;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_journal_streaks_insert ON journal_entries;
+DROP TRIGGER IF EXISTS trg_journal_streaks_update ON journal_entries;
+DROP TRIGGER IF EXISTS trg_journal_streaks_delete ON journal_entries;
+
+CREATE TRIGGER trg_journal_streaks_insert
+AFTER INSERT ON journal_entries
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION apply_user_streaks();
+
+CREATE TRIGGER trg_journal_streaks_update
+AFTER UPDATE ON journal_entries
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT EXECUTE FUNCTION apply_user_streaks();
+
+CREATE TRIGGER trg_journal_streaks_delete
+AFTER DELETE ON journal_entries
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT EXECUTE FUNCTION apply_user_streaks();
+
+-- Existing databases: count streaks once when the column is first added.
+SELECT refresh_user_streak(u.id)
+FROM users u
+WHERE u.streak_last_date IS NULL
+  AND EXISTS (SELECT 1 FROM journal_entries je WHERE je.user_id = u.id AND je.xp_delta > 0);
 
 COMMIT;
@@ -1,5 +1,11 @@
 import { http } from "./http";
 
+const JOB_POLL_INTERVAL_MS = 750;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// Queues the generation on the backend and polls until it finishes, so a slow
+// model never ties up a web server thread.
 export async function requestWiseAdvice({ prompt, systemPrompt, context } = {}) {
   const body = {
     prompt,
@@ -10,8 +16,23 @@ export async function requestWiseAdvice({ prompt, systemPrompt, context } = {})
   if (Array.isArray(context) && context.length > 0) {
     body.context = context;
   }
-  return http("/api/ai/respond", {
+  const job = await http("/api/ai/jobs", {
     method: "POST",
     body,
   });
+  // Cached answers come back already finished.
+  if (job.status === "done") {
+    return job.result;
+  }
+
+  for (;;) {
+    await sleep(JOB_POLL_INTERVAL_MS);
+    const status = await http(`/api/ai/jobs/${job.job_id}`);
+    if (status.status === "done") {
+      return status.result;
+    }
+    if (status.status === "failed") {
+      throw new Error(status.error || "AI request failed");
+    }
+  }
 }